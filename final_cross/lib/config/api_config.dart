@@ -23,7 +23,8 @@ class ApiConfig {
   }
   
   // Course endpoints
-  static String get coursesUrl => '$baseUrl/courses';
+  // The list screen only needs the summary projection; the detail page fetches lessons
+  static String get coursesUrl => '$baseUrl/courses?fields=summary';
   static String courseByIdUrl(String id) => '$baseUrl/courses/$id';
   
   // Auth/Profile endpoints
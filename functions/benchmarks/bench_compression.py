@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Compression benchmark: CPU time versus bytes saved on the exported sample data
+Usage: python benchmarks/bench_compression.py [export_dir]
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.compression import brotli, compress
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEVELS = [('gzip', 1), ('gzip', 6), ('gzip', 9)]
+if brotli:
+    LEVELS += [('br', 1), ('br', 5), ('br', 11)]
+# Enrollment listings grow with the collection; replicate the sample to see that regime
+SCALE_FACTOR = 100
+
+
+def latest_export_dir():
+    dirs = sorted(glob.glob(os.path.join(FUNCTIONS_DIR, 'data_export_*')))
+    if not dirs:
+        print("✗ No data_export_* directory found. Run export_data.py first.")
+        sys.exit(1)
+    return dirs[-1]
+
+
+def encode(payload):
+    """Serialize like jsonify does in production (compact separators)"""
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def cpu_ms_per_call(data, encoding, level):
+    """Average CPU milliseconds for one compression"""
+    iterations = max(3, min(200, 2000000 // max(len(data), 1)))
+    start = time.process_time()
+    for _ in range(iterations):
+        compressed = compress(data, encoding, level)
+    elapsed = time.process_time() - start
+    return elapsed / iterations * 1000, len(compressed)
+
+
+def main():
+    export_dir = sys.argv[1] if len(sys.argv) > 1 else latest_export_dir()
+    print("=" * 78)
+    print("  COMPRESSION BENCHMARK")
+    print("=" * 78)
+    print(f"\n📂 Data: {os.path.basename(export_dir)}/")
+    if not brotli:
+        print("  (brotli not installed, gzip only)")
+
+    samples = []
+    for path in sorted(glob.glob(os.path.join(export_dir, '*.json'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name == 'summary':
+            continue
+        with open(path, encoding='utf-8') as f:
+            payload = json.load(f)
+        samples.append((name, encode(payload)))
+        if name == 'enrollments':
+            scaled = dict(payload, data=payload['data'] * SCALE_FACTOR)
+            scaled['count'] = len(scaled['data'])
+            samples.append((f'enrollments x{SCALE_FACTOR}', encode(scaled)))
+
+    print(f"\n{'payload':<18}{'codec':<9}{'bytes in':>10}{'bytes out':>11}{'saved':>8}{'cpu ms':>9}{'KB saved/ms':>13}")
+    print("-" * 78)
+    for name, data in samples:
+        for encoding, level in LEVELS:
+            cpu_ms, size = cpu_ms_per_call(data, encoding, level)
+            saved = len(data) - size
+            per_ms = saved / 1024 / cpu_ms if cpu_ms else float('inf')
+            print(f"{name:<18}{encoding + '-' + str(level):<9}{len(data):>10}{size:>11}"
+                  f"{saved / len(data):>8.0%}{cpu_ms:>9.3f}{per_ms:>13.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+JSON serialization benchmark over the enrollment export
+Usage: python benchmarks/bench_json.py [export_dir]
+"""
+
+import glob
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from utils.json_provider import dumps, orjson, stdlib_dumps
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Replicate the sample so timings reflect a realistic admin listing
+SCALE_FACTOR = 100
+REPEAT = 5
+
+
+def latest_export_dir():
+    dirs = sorted(glob.glob(os.path.join(FUNCTIONS_DIR, 'data_export_*')))
+    if not dirs:
+        print("✗ No data_export_* directory found. Run export_data.py first.")
+        sys.exit(1)
+    return dirs[-1]
+
+
+def restore_datetimes(data):
+    """Turn exported date strings back into datetimes, as Firestore returns them"""
+    if isinstance(data, dict):
+        return {k: restore_datetimes(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [restore_datetimes(item) for item in data]
+    if isinstance(data, str) and data.endswith(' GMT'):
+        try:
+            return parsedate_to_datetime(data)
+        except (TypeError, ValueError):
+            return data
+    return data
+
+
+def legacy_convert_to_serializable(data):
+    """The recursive walk export_data.py used before the shared encoder"""
+    if isinstance(data, dict):
+        return {k: legacy_convert_to_serializable(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [legacy_convert_to_serializable(item) for item in data]
+    elif isinstance(data, datetime):
+        return data.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    else:
+        return data
+
+
+def main():
+    export_dir = sys.argv[1] if len(sys.argv) > 1 else latest_export_dir()
+    with open(os.path.join(export_dir, 'enrollments.json'), encoding='utf-8') as f:
+        exported = json.load(f)
+    records = restore_datetimes(exported['data']) * SCALE_FACTOR
+    payload = {'success': True, 'data': records, 'count': len(records)}
+
+    flask_provider = DefaultJSONProvider(Flask(__name__))
+    candidates = [
+        ('legacy export walk + json', lambda: json.dumps(legacy_convert_to_serializable(payload))),
+        ('flask default provider', lambda: flask_provider.dumps(payload)),
+        ('stdlib fallback', lambda: stdlib_dumps(payload)),
+    ]
+    if orjson:
+        candidates.append(('orjson provider', lambda: dumps(payload)))
+
+    print("=" * 60)
+    print("  JSON SERIALIZATION BENCHMARK")
+    print("=" * 60)
+    print(f"\n📂 Data: {os.path.basename(export_dir)}/enrollments.json x{SCALE_FACTOR} "
+          f"({len(records)} enrollments)")
+    if not orjson:
+        print("  (orjson not installed, fallback only)")
+    print(f"\n{'encoder':<30}{'ms':>10}{'bytes':>12}{'speedup':>9}")
+    print("-" * 61)
+
+    baseline = None
+    for name, encode in candidates:
+        elapsed = min(timeit.repeat(encode, number=1, repeat=REPEAT)) * 1000
+        size = len(encode())
+        baseline = baseline or elapsed
+        print(f"{name:<30}{elapsed:>10.2f}{size:>12}{baseline / elapsed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Model memory benchmark: dict-backed attribute models vs __slots__ models
+Usage: python benchmarks/bench_models.py [export_dir]
+"""
+
+import gc
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from itertools import cycle, islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.category import Category
+from models.course import SUMMARY_FIELDS, Course
+from models.enrollment import Enrollment
+from models.user import User
+
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INSTANCES = 100000
+REPEAT = 3
+
+
+def latest_export_dir():
+    dirs = sorted(glob.glob(os.path.join(FUNCTIONS_DIR, 'data_export_*')))
+    if not dirs:
+        print("✗ No data_export_* directory found. Run export_data.py first.")
+        sys.exit(1)
+    return dirs[-1]
+
+
+class LegacyCourse:
+    """Course as it was: every field copied onto the instance __dict__"""
+    def __init__(self, data=None):
+        self.data = data or {}
+        self.id = self.data.get('id', '')
+        self.title = self.data.get('title', '')
+        self.description = self.data.get('description', '')
+        self.instructor = self.data.get('instructor', '')
+        self.duration = self.data.get('duration', 0)
+        self.difficulty = self.data.get('difficulty', 'Beginner')
+        self.price = self.data.get('price', 0.0)
+        self.rating = self.data.get('rating', 0.0)
+        self.studentsCount = self.data.get('studentsCount', 0)
+        self.category = self.data.get('category', '')
+        self.lessons = self.data.get('lessons', [])
+        self.isPublished = self.data.get('isPublished', True)
+
+
+class LegacyCategory:
+    def __init__(self, data=None):
+        self.data = data or {}
+        self.id = self.data.get('id', '')
+        self.name = self.data.get('name', '')
+        self.description = self.data.get('description', '')
+        self.icon = self.data.get('icon', '')
+        self.coursesCount = self.data.get('coursesCount', 0)
+        self.createdAt = self.data.get('createdAt', datetime.utcnow())
+        self.updatedAt = self.data.get('updatedAt', datetime.utcnow())
+
+
+class LegacyUser:
+    def __init__(self, uid=None, email=None, display_name=None, phone=None, bio=None,
+                 role='student', profile_picture_url=None, enrollment_count=0,
+                 created_at=None, updated_at=None, profile_complete=False, **kwargs):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+        self.phone = phone
+        self.bio = bio
+        self.role = role
+        self.profile_picture_url = profile_picture_url
+        self.enrollment_count = enrollment_count
+        self.created_at = created_at or datetime.utcnow()
+        self.updated_at = updated_at or datetime.utcnow()
+        self.profile_complete = profile_complete
+        self.preferences = kwargs.get('preferences', {
+            'notifications': True,
+            'email_updates': True,
+            'difficulty_preference': 'beginner'
+        })
+        self.stats = kwargs.get('stats', {
+            'courses_completed': 0,
+            'total_learning_time': 0,
+            'certificates_earned': 0,
+            'current_streak': 0
+        })
+
+
+class LegacyEnrollment:
+    def __init__(self, enrollment_id=None, user_id=None, course_id=None,
+                 enrolled_at=None, **kwargs):
+        self.enrollment_id = enrollment_id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.course_id = course_id
+        self.enrolled_at = enrolled_at or datetime.utcnow()
+        self.progress = kwargs.get('progress', {
+            'completed_lessons': [],
+            'current_lesson': 0,
+            'completion_percentage': 0.0,
+            'total_time_spent': 0,
+            'last_accessed': None
+        })
+        self.status = kwargs.get('status', 'active')
+        self.completed_at = kwargs.get('completed_at')
+        self.certificate_issued = kwargs.get('certificate_issued', False)
+        self.rating = kwargs.get('rating')
+        self.review = kwargs.get('review')
+        self.reviewed_at = kwargs.get('reviewed_at')
+
+
+def load(export_dir, name):
+    with open(os.path.join(export_dir, f'{name}.json'), encoding='utf-8') as f:
+        return json.load(f)['data']
+
+
+def build_all(factory, records):
+    return [factory(record) for record in islice(cycle(records), INSTANCES)]
+
+
+def measure(factory, records):
+    """(bytes per instance, construction ms for INSTANCES) with the source dicts excluded"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = build_all(factory, records)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del instances
+
+    best = None
+    for _ in range(REPEAT):
+        gc.collect()
+        start = time.perf_counter()
+        instances = build_all(factory, records)
+        elapsed = (time.perf_counter() - start) * 1000
+        del instances
+        best = elapsed if best is None else min(best, elapsed)
+    return size / INSTANCES, best
+
+
+def main():
+    export_dir = sys.argv[1] if len(sys.argv) > 1 else latest_export_dir()
+    courses = load(export_dir, 'courses')
+    # What a ?fields=summary listing hands the model: no lessons
+    summaries = [{key: course[key] for key in ['id'] + SUMMARY_FIELDS if key in course} for course in courses]
+    categories = load(export_dir, 'categories')
+    users = load(export_dir, 'users')
+    enrollments = load(export_dir, 'enrollments')
+    # A freshly created enrollment has no progress map yet
+    new_enrollments = [{'user_id': e.get('user_id'), 'course_id': e.get('course_id')} for e in enrollments]
+
+    cases = [
+        ('Course', courses, LegacyCourse, Course),
+        ('Course (summary)', summaries, LegacyCourse, Course),
+        ('Category', categories, LegacyCategory, Category),
+        ('User', users, lambda r: LegacyUser(**r), User.from_dict),
+        ('Enrollment', enrollments, lambda r: LegacyEnrollment(**r), Enrollment.from_dict),
+        ('Enrollment (new)', new_enrollments, lambda r: LegacyEnrollment(**r), Enrollment.from_dict),
+    ]
+
+    print("=" * 76)
+    print("  MODEL MEMORY BENCHMARK")
+    print("=" * 76)
+    print(f"\n📂 Data: {os.path.basename(export_dir)}/ x{INSTANCES} instances per model")
+    print(f"\n{'model':<20}{'legacy B/obj':>14}{'slots B/obj':>13}{'legacy ms':>11}{'slots ms':>10}{'saved':>8}")
+    print("-" * 76)
+
+    for name, records, legacy, current in cases:
+        legacy_bytes, legacy_ms = measure(legacy, records)
+        slots_bytes, slots_ms = measure(current, records)
+        saved = 1 - slots_bytes / legacy_bytes
+        print(f"{name:<20}{legacy_bytes:>14.0f}{slots_bytes:>13.0f}{legacy_ms:>11.1f}{slots_ms:>10.1f}{saved:>7.0%}")
+
+    print("\n  Bytes include the list slot holding each instance; the shared source")
+    print("  dicts from the export are not counted.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Route dispatch microbenchmark: legacy if/elif chain vs precompiled route table
+Usage: python benchmarks/bench_router.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import router
+
+ITERATIONS = 50000
+
+# (method, path) pairs covering every route the Flutter client calls
+SAMPLE_REQUESTS = [
+    ('GET', '/'),
+    ('GET', '/health'),
+    ('GET', '/courses'),
+    ('GET', '/courses/flutter-basics-001'),
+    ('GET', '/categories/'),
+    ('POST', '/enrollments/enroll'),
+    ('GET', '/enrollments'),
+    ('GET', '/enrollments/all'),
+    ('GET', '/enrollments/check/flutter-basics-001'),
+    ('PUT', '/enrollments/2122bf31-5078-45b8-b015-1e3fd93aceb3/progress'),
+    ('POST', '/auth/register'),
+    ('GET', '/auth/profile'),
+    ('PUT', '/auth/profile'),
+    ('GET', '/does/not/exist'),
+]
+
+
+def legacy_dispatch(method, path):
+    """Path matching and per-branch imports of the old `api` if/elif chain"""
+    if path == '/courses' or path == '/courses/':
+        if method == 'GET':
+            from models.course import Course
+            return 'courses'
+    elif path.startswith('/courses/') and len(path.split('/')) == 3:
+        course_id = path.split('/')[2]
+        if method == 'GET':
+            from models.course import Course
+            return 'course:' + course_id
+    elif path == '/' or path == '':
+        return 'root'
+    elif path == '/health':
+        return 'health'
+    elif path == '/categories' or path == '/categories/':
+        if method == 'GET':
+            from firebase_admin import firestore
+            return 'categories'
+    elif path.startswith('/enrollments'):
+        if method == 'POST' and path == '/enrollments/enroll':
+            from models.enrollment import Enrollment
+            from models.course import Course
+            from firebase_admin import auth
+            return 'enroll'
+        elif method == 'GET' and path == '/enrollments':
+            from models.enrollment import Enrollment
+            from models.course import Course
+            from firebase_admin import auth
+            return 'enrollments'
+        elif method == 'GET' and path == '/enrollments/all':
+            from models.enrollment import Enrollment
+            from models.course import Course
+            return 'enrollments_all'
+        elif method == 'GET' and path.startswith('/enrollments/check/'):
+            from models.enrollment import Enrollment
+            from firebase_admin import auth
+            return 'check:' + path.split('/')[3]
+    elif path == '/auth/register' and method == 'POST':
+        from controllers.auth_controller import create_user_profile
+        from firebase_admin import auth
+        return 'register'
+    elif path == '/auth/profile':
+        if method == 'GET':
+            from controllers.auth_controller import verify_token, get_user_profile
+            from firebase_admin import auth
+            import controllers.auth_controller
+            return 'profile'
+        elif method == 'PUT':
+            from controllers.auth_controller import update_user_profile
+            from firebase_admin import auth
+            import json
+            return 'update_profile'
+    return None
+
+
+def time_per_call(func, method, path):
+    """Best-of-5 average nanoseconds per dispatch"""
+    runs = timeit.repeat(lambda: func(method, path), number=ITERATIONS, repeat=5)
+    return min(runs) / ITERATIONS * 1e9
+
+
+def main():
+    print("=" * 78)
+    print("  ROUTE DISPATCH BENCHMARK (ns per call)")
+    print("=" * 78)
+    print(f"\n{'method':<7}{'path':<58}{'old':>6}{'new':>7}")
+    print("-" * 78)
+
+    old_total = 0.0
+    new_total = 0.0
+    for method, path in SAMPLE_REQUESTS:
+        old = time_per_call(legacy_dispatch, method, path)
+        new = time_per_call(router.match, method, path)
+        old_total += old
+        new_total += new
+        print(f"{method:<7}{path:<58}{old:>6.0f}{new:>7.0f}")
+
+    print("-" * 78)
+    count = len(SAMPLE_REQUESTS)
+    print(f"{'mean':<65}{old_total / count:>6.0f}{new_total / count:>7.0f}")
+    print("\nNote: the legacy chain had no entry for progress/complete/review routes")
+
+
+if __name__ == "__main__":
+    main()
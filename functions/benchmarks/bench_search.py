@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Course search benchmark: index build, incremental sync and query latency
+on a synthetic bilingual catalog
+Usage: python benchmarks/bench_search.py [course_count]
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.course import course_index, search_fields
+from utils.search import SearchIndex
+
+COURSES = 50000
+CHANGED = 100
+QUERY_ROUNDS = 200
+SEED = 42
+
+ENGLISH = [
+    'docker', 'kubernetes', 'flutter', 'react', 'native', 'python', 'django', 'flask', 'node',
+    'express', 'vue', 'angular', 'swift', 'kotlin', 'android', 'ios', 'mobile', 'backend',
+    'frontend', 'devops', 'cloud', 'firebase', 'firestore', 'database', 'sql', 'testing',
+    'security', 'design', 'patterns', 'fundamentals', 'advanced', 'introduction', 'development',
+    'applications', 'containers', 'deployment', 'microservices', 'api', 'rest', 'graphql',
+    'machine', 'learning', 'data', 'analysis', 'visualization', 'performance', 'state', 'hooks'
+]
+VIETNAMESE = [
+    'hóa', 'ứng', 'dụng', 'với', 'lập', 'trình', 'phát', 'triển', 'cơ', 'bản', 'nâng', 'cao',
+    'điều', 'phối', 'dữ', 'liệu', 'giao', 'diện', 'người', 'dùng', 'bảo', 'mật', 'kiểm', 'thử',
+    'hệ', 'thống', 'máy', 'chủ', 'thiết', 'kế', 'học', 'tập', 'khóa', 'đám', 'mây', 'triển', 'khai'
+]
+INSTRUCTORS = ['DevOps Engineer', 'Nguyễn Văn An', 'Trần Thị Bình', 'Mobile Expert', 'Lê Hoàng Đức',
+               'Senior Backend Developer', 'Phạm Minh Châu', 'Frontend Architect']
+
+QUERIES = [
+    ('one word', 'docker'),
+    ('two words', 'react native'),
+    ('folded Vietnamese', 'ung dung'),
+    ('accented Vietnamese', 'ứng dụng điều phối'),
+    ('prefix', 'kube'),
+    ('short prefix', 'de'),
+    ('mixed', 'docker trien khai'),
+    ('no match', 'zzzz')
+]
+
+
+# Real catalogs have a long tail of rarer terms; word frequencies follow Zipf's law
+TAIL_WORDS = 20000
+SYLLABLES = ['an', 'ba', 'co', 'de', 'gi', 'ho', 'ki', 'lo', 'ma', 'ne', 'ph', 'qu', 'ra', 'si', 'tr', 'vu', 'xe']
+
+
+def vocabulary(rng):
+    tail = {''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(TAIL_WORDS)}
+    ranked = ENGLISH + VIETNAMESE + sorted(tail)
+    return ranked, [1.0 / (rank + 1) for rank in range(len(ranked))]
+
+
+def words(rng, count):
+    return ' '.join(rng.choices(WORDS, WEIGHTS, k=count))
+
+
+def synthetic_course(rng, number):
+    return {
+        'id': f'course-{number:06d}',
+        'title': words(rng, rng.randint(3, 6)).title(),
+        'description': words(rng, rng.randint(12, 30)),
+        'instructor': rng.choice(INSTRUCTORS),
+        'lessons': [{'id': f'lesson-{i:03d}', 'title': words(rng, rng.randint(2, 5)), 'order': i + 1}
+                    for i in range(rng.randint(4, 12))]
+    }
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COURSES
+    rng = random.Random(SEED)
+    global WORDS, WEIGHTS
+    WORDS, WEIGHTS = vocabulary(rng)
+    courses = [synthetic_course(rng, number) for number in range(count)]
+    index = SearchIndex(course_index.field_weights)
+
+    print("=" * 70)
+    print("  COURSE SEARCH BENCHMARK")
+    print("=" * 70)
+    print(f"\n📚 Catalog: {count} synthetic courses (seed {SEED})")
+
+    start = time.perf_counter()
+    index.sync(courses, search_fields)
+    build_ms = (time.perf_counter() - start) * 1000
+    # Memory is measured on a second build: tracemalloc slows allocation down a lot
+    tracemalloc.start()
+    measured = SearchIndex(course_index.field_weights)
+    measured.sync(courses, search_fields)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+    print(f"\n  Full build:        {build_ms:>9.1f} ms   ({memory / 1024 / 1024:.1f} MB)")
+
+    # The catalog cache refreshing hands over a new list in which a few courses changed
+    refreshed = list(courses)
+    for number in rng.sample(range(count), CHANGED):
+        refreshed[number] = dict(refreshed[number], title=words(rng, 4).title())
+    start = time.perf_counter()
+    changed = index.sync(refreshed, search_fields)
+    print(f"  Incremental sync:  {(time.perf_counter() - start) * 1000:>9.1f} ms   ({changed} courses re-indexed)")
+
+    start = time.perf_counter()
+    index.sync(refreshed, search_fields)
+    print(f"  Unchanged catalog: {(time.perf_counter() - start) * 1000:>9.3f} ms")
+
+    print(f"\n{'query':<22}{'hits':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print("-" * 70)
+    for name, query in QUERIES:
+        samples = []
+        for _ in range(QUERY_ROUNDS):
+            start = time.perf_counter()
+            results = index.search(query, 20)
+            samples.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<22}{len(results):>6}{percentile(samples, 0.5):>10.2f}"
+              f"{percentile(samples, 0.95):>10.2f}{percentile(samples, 0.99):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
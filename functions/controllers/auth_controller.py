@@ -1,13 +1,35 @@
-from firebase_admin import auth, firestore
+from firebase_admin import auth
 from flask import request, jsonify
 import functools
+import hashlib
+import os
 from datetime import datetime
+from utils.cache import LRUCache
 
-def get_db():
-    """Get Firestore client instance"""
-    return firestore.client()
+# Verified ID tokens, keyed by a hash of the raw token and dropped at its `exp` claim
+token_cache = LRUCache(max_entries=int(os.environ.get('TOKEN_CACHE_SIZE', 1024)))
 
-def verify_token(f):
+def verify_id_token(token, check_revoked=False):
+    """Verify a Firebase ID token, reusing earlier verifications of the same token.
+
+    Revocation is only visible to a fresh check, so check_revoked=True always
+    goes to Firebase Auth and bypasses the cache.
+    """
+    if check_revoked:
+        return auth.verify_id_token(token, check_revoked=True)
+    
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    decoded_token = token_cache.get(key)
+    if decoded_token is None:
+        decoded_token = auth.verify_id_token(token)
+        token_cache.set(key, decoded_token, expires_at=decoded_token.get('exp'))
+    return decoded_token
+
+def verify_token(f=None, check_revoked=False):
+    """Require a valid bearer token; use @verify_token(check_revoked=True) to skip the cache"""
+    if f is None:
+        return functools.partial(verify_token, check_revoked=check_revoked)
+    
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
         try:
@@ -16,12 +38,12 @@ def verify_token(f):
                 return jsonify({'error': 'No token provided'}), 401
             
             token = auth_header.split(' ')[1]
-            decoded_token = auth.verify_id_token(token)
+            decoded_token = verify_id_token(token, check_revoked=check_revoked)
             request.user = decoded_token
-            return f(*args, **kwargs)
         except Exception as e:
             print(f'Token verification error: {e}')
             return jsonify({'error': 'Invalid token'}), 401
+        return f(*args, **kwargs)
     
     return decorated_function
 
@@ -6,10 +6,12 @@ Usage: python export_data.py
 
 import os
 import sys
-import json
 from datetime import datetime
 from pathlib import Path
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils.json_provider import dumps
+
 # Add UTF-8 encoding support
 if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
@@ -62,16 +64,10 @@ def initialize_firebase():
     return True
 
 
-def convert_to_serializable(data):
-    """Convert Firestore data to JSON serializable format"""
-    if isinstance(data, dict):
-        return {k: convert_to_serializable(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [convert_to_serializable(item) for item in data]
-    elif isinstance(data, datetime):
-        return data.strftime("%a, %d %b %Y %H:%M:%S GMT")
-    else:
-        return data
+def write_json(output_file, result):
+    """Write a result with the API's JSON encoder (same datetime format as responses)"""
+    with open(output_file, 'wb') as f:
+        f.write(dumps(result, pretty=True))
 
 
 def export_collection(db, collection_name, output_dir):
@@ -85,7 +81,6 @@ def export_collection(db, collection_name, output_dir):
         for doc in docs:
             doc_data = doc.to_dict()
             doc_data['id'] = doc.id
-            doc_data = convert_to_serializable(doc_data)
             data_list.append(doc_data)
         
         # Create result in API format
@@ -97,8 +92,7 @@ def export_collection(db, collection_name, output_dir):
         
         # Save to file
         output_file = os.path.join(output_dir, f"{collection_name}.json")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        write_json(output_file, result)
         
         print(f"  ✓ Exported {len(data_list)} documents")
         return len(data_list)
@@ -126,14 +120,12 @@ def export_enrollments_with_courses(db, output_dir):
                 if course_doc.exists:
                     course_data = course_doc.to_dict()
                     course_data['id'] = course_doc.id
-                    enrollment_data['course'] = convert_to_serializable(course_data)
+                    enrollment_data['course'] = course_data
                 else:
                     enrollment_data['course'] = None
             else:
                 enrollment_data['course'] = None
             
-            # Convert to serializable
-            enrollment_data = convert_to_serializable(enrollment_data)
             data_list.append(enrollment_data)
         
         # Create result in API format
@@ -145,8 +137,7 @@ def export_enrollments_with_courses(db, output_dir):
         
         # Save to file
         output_file = os.path.join(output_dir, "enrollments.json")
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+        write_json(output_file, result)
         
         print(f"  ✓ Exported {len(data_list)} enrollments with course details")
         return len(data_list)
@@ -171,8 +162,7 @@ def create_summary(output_dir, collections_exported, total_documents):
     
     # Save summary
     summary_file = os.path.join(output_dir, "summary.json")
-    with open(summary_file, 'w', encoding='utf-8') as f:
-        json.dump(summary, f, indent=2, ensure_ascii=False)
+    write_json(summary_file, summary)
     
     print(f"  ✓ Summary created")
     return summary
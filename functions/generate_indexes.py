@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Generate firestore.indexes.json from the queries the models issue.
+
+Every query goes through models/query.py, whose Query.indexes() reports the
+composite indexes it needs. This script builds each query shape the code can
+issue (including every combination of GET /courses catalog parameters that
+Course.catalog_query accepts) and writes the deduplicated indexes next to
+firebase.json.
+
+Usage: python generate_indexes.py [--check]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from models.course import CATALOG_SORTS, Course
+from models.enrollment import Enrollment
+from models.query import DESCENDING, InvalidQuery
+
+INDEXES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'firestore.indexes.json')
+
+# One representative value per catalog parameter; only the query shape matters
+CATALOG_SAMPLES = {
+    'category': 'a,b',
+    'difficulty': 'a,b',
+    'min_price': '0',
+    'max_price': '0',
+    'min_rating': '0'
+}
+
+
+def catalog_queries():
+    """Every query GET /courses can build from its filter and sort parameters; rejected ones need no index"""
+    params = list(CATALOG_SAMPLES)
+    sorts = [None] + CATALOG_SORTS + ['-' + field for field in CATALOG_SORTS]
+    for count in range(len(params) + 1):
+        for combination in itertools.combinations(params, count):
+            for sort in sorts:
+                args = {param: CATALOG_SAMPLES[param] for param in combination}
+                if sort:
+                    args['sort'] = sort
+                try:
+                    query = Course.catalog_query(args)
+                except InvalidQuery:
+                    continue
+                if query is not None:
+                    yield query
+
+
+def issued_queries():
+    yield from catalog_queries()
+    yield Enrollment.query().where('user_id', '==', '').order_by('enrolled_at', DESCENDING)
+    yield Enrollment.query().where('user_id', '==', '').where('course_id', '==', '')
+    yield Enrollment.query().where('course_id', '==', '')
+    # Incremental recommendation refresh (models/recommendations.py)
+    yield Enrollment.query().where('enrolled_at', '>', '')
+    yield Course.query().where('isPublished', '==', True)
+
+
+def issued_aggregations():
+    """(query, aggregations) pairs run as aggregation queries"""
+    yield from Enrollment.course_stats_queries('')
+
+
+def build_indexes():
+    indexes = {}
+    shapes = [index for query in issued_queries() for index in query.indexes()]
+    shapes += [index for query, aggregations in issued_aggregations() for index in query.indexes(aggregations)]
+    for index in shapes:
+        indexes[json.dumps(index, sort_keys=True)] = index
+    return sorted(indexes.values(), key=lambda index: (
+        index['collectionGroup'], [(field['fieldPath'], field.get('order', '')) for field in index['fields']]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate firestore.indexes.json')
+    parser.add_argument('--check', action='store_true',
+                        help='exit non-zero if the committed file is out of date')
+    args = parser.parse_args()
+
+    content = json.dumps({'indexes': build_indexes(), 'fieldOverrides': []}, indent=2) + '\n'
+    if args.check:
+        current = None
+        if os.path.exists(INDEXES_FILE):
+            with open(INDEXES_FILE, encoding='utf-8') as f:
+                current = f.read()
+        if current != content:
+            print("✗ firestore.indexes.json is out of date; run python generate_indexes.py")
+            sys.exit(1)
+        print("✓ firestore.indexes.json is up to date")
+        return
+
+    with open(INDEXES_FILE, 'w', encoding='utf-8') as f:
+        f.write(content)
+    print(f"✓ Wrote {len(json.loads(content)['indexes'])} composite indexes to {INDEXES_FILE}")
+
+
+if __name__ == "__main__":
+    main()
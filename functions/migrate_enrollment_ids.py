@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Rewrite UUID-keyed enrollment documents to the deterministic
+'<user_id>_<course_id>' IDs that Enrollment.get_user_course_enrollment reads.
+
+Documents are copied to their new ID and the old one is deleted in the same
+WriteBatch. The copy is a create(), so it never overwrites an enrollment made
+meanwhile under the new ID, and the delete carries the old document's update
+time, so an edit made after the page was read aborts the batch instead of
+being lost; the page is then re-read and retried. The last migrated document
+ID is checkpointed after every batch, so an interrupted run picks up where it
+stopped; rerunning from the start is also safe because already-migrated
+documents are skipped.
+
+Usage: python migrate_enrollment_ids.py [--dry-run] [--batch-size N] [--restart]
+"""
+
+import argparse
+import os
+import sys
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from export_data import initialize_firebase
+from models.db import commit_batch, get_db, get_documents, stream_query
+from models.enrollment import Enrollment
+
+CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '.migrate_enrollment_ids.checkpoint')
+
+# Each migrated document is two writes (create + delete); a batch holds at most 500
+MAX_BATCH_SIZE = 250
+
+# Times a page is re-read and retried after a concurrent write aborts its batch
+MAX_ATTEMPTS = 5
+
+
+def read_checkpoint():
+    """Last migrated document ID from a previous run, or None"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return None
+    with open(CHECKPOINT_FILE, encoding='utf-8') as f:
+        return f.read().strip() or None
+
+
+def write_checkpoint(doc_id):
+    with open(CHECKPOINT_FILE, 'w', encoding='utf-8') as f:
+        f.write(doc_id)
+
+
+def migrate_batch(db, docs, dry_run=False):
+    """Move one page of enrollment documents, returning (migrated, skipped, conflicts)"""
+    collection_ref = db.collection('enrollments')
+    pending = []
+    skipped = 0
+    for doc in docs:
+        data = doc.to_dict()
+        user_id, course_id = data.get('user_id'), data.get('course_id')
+        if not user_id or not course_id:
+            print(f"  ⚠ {doc.id}: missing user_id/course_id, left as is")
+            skipped += 1
+            continue
+        new_id = Enrollment.make_id(user_id, course_id)
+        if new_id == doc.id:
+            skipped += 1
+            continue
+        pending.append((doc, data, new_id))
+
+    # One batched read to find targets that already exist (duplicate enrollments)
+    existing = {snapshot.id for snapshot in get_documents(
+        [collection_ref.document(new_id) for _, _, new_id in pending]) if snapshot.exists}
+
+    batch = db.batch()
+    migrated = 0
+    conflicts = 0
+    for doc, data, new_id in pending:
+        if new_id in existing:
+            print(f"  ⚠ {doc.id}: {new_id} already exists, left for manual review")
+            conflicts += 1
+            continue
+        existing.add(new_id)
+        data['enrollment_id'] = new_id
+        batch.create(collection_ref.document(new_id), data)
+        batch.delete(doc.reference, option=db.write_option(last_update_time=doc.update_time))
+        migrated += 1
+
+    if not dry_run:
+        commit_batch(batch)
+    return migrated, skipped, conflicts
+
+
+def migrate_page(db, query, docs, dry_run=False):
+    """migrate_batch, re-reading the page when a concurrent write aborts the batch"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            return migrate_batch(db, docs, dry_run)
+        except (AlreadyExists, FailedPrecondition) as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            print(f"  ↻ Page changed while migrating ({e}); retrying")
+            docs = list(stream_query(query))
+
+
+def migrate(batch_size=MAX_BATCH_SIZE, dry_run=False, restart=False):
+    db = get_db()
+    last_id = None if restart else read_checkpoint()
+    if last_id:
+        print(f"↻ Resuming after {last_id}")
+
+    totals = {'migrated': 0, 'skipped': 0, 'conflicts': 0}
+    while True:
+        query = db.collection('enrollments').order_by('__name__').limit(batch_size)
+        if last_id:
+            query = query.start_after({'__name__': last_id})
+        docs = list(stream_query(query))
+        if not docs:
+            break
+
+        migrated, skipped, conflicts = migrate_page(db, query, docs, dry_run)
+        totals['migrated'] += migrated
+        totals['skipped'] += skipped
+        totals['conflicts'] += conflicts
+
+        last_id = docs[-1].id
+        if not dry_run:
+            write_checkpoint(last_id)
+        print(f"  ✓ Batch up to {last_id}: {migrated} migrated, {skipped} skipped, {conflicts} conflicts")
+
+    if not dry_run and os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move enrollments to deterministic document IDs')
+    parser.add_argument('--dry-run', action='store_true', help='report what would change without writing')
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE,
+                        help=f'documents per batch (max {MAX_BATCH_SIZE})')
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    args = parser.parse_args()
+
+    if not initialize_firebase():
+        print("\n✗ Failed to initialize Firebase. Exiting.")
+        return
+
+    batch_size = max(1, min(args.batch_size, MAX_BATCH_SIZE))
+    totals = migrate(batch_size, dry_run=args.dry_run, restart=args.restart)
+
+    print("\n" + "=" * 60)
+    print("  MIGRATION DRY RUN COMPLETE" if args.dry_run else "  MIGRATION COMPLETE")
+    print("=" * 60)
+    print(f"  • Migrated: {totals['migrated']}")
+    print(f"  • Already migrated / skipped: {totals['skipped']}")
+    print(f"  • Conflicts: {totals['conflicts']}")
+    if not args.dry_run and not totals['conflicts']:
+        print("\n  Every enrollment has its deterministic ID; ENROLLMENT_LEGACY_LOOKUP can be unset")
+    elif not args.dry_run:
+        print("\n  Keep ENROLLMENT_LEGACY_LOOKUP=1 until the conflicts are resolved")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n✗ Migration interrupted; rerun to resume from the last checkpoint")
+        sys.exit(1)
@@ -1,28 +1,39 @@
 from datetime import datetime
-from firebase_admin import firestore
+from models.counter import ShardedCounter
+from models.db import get_db, get_document, set_document, update_document
+from models.fields import ChangeTracking, data_field
+from models.query import Query
+from utils.cache import catalog_cache, estimate_size
 
+# Bumped by every course creation; coursesCount holds the reconciled part
+courses_counter = ShardedCounter('categories', 'coursesCount')
 
-def get_db():
-	"""Get Firestore client instance"""
-	try:
-		return firestore.client()
-	except Exception as e:
-		print(f"Error getting Firestore client: {e}")
-		return None
 
+class Category(ChangeTracking):
+	# Only the document dict is stored; fields are read from it on access
+	__slots__ = ('data',)
+
+	# Owned by courses_counter; a save must never overwrite it
+	UNTRACKED_FIELDS = ('coursesCount',)
 
-class Category:
 	def __init__(self, data=None):
 		self.data = data or {}
-		# Common fields based on exported database structure
-		self.id = self.data.get('id', '')
-		self.name = self.data.get('name', '')
-		self.description = self.data.get('description', '')
-		self.icon = self.data.get('icon', '')
-		# Keep camelCase to match existing JSON (e.g., courses.json uses studentsCount)
-		self.coursesCount = self.data.get('coursesCount', 0)
-		self.createdAt = self.data.get('createdAt', datetime.utcnow())
-		self.updatedAt = self.data.get('updatedAt', datetime.utcnow())
+
+	# Common fields based on exported database structure
+	id = data_field('id', '')
+	name = data_field('name', '')
+	description = data_field('description', '')
+	icon = data_field('icon', '')
+	# Keep camelCase to match existing JSON (e.g., courses.json uses studentsCount)
+	coursesCount = data_field('coursesCount', 0)
+
+	@property
+	def createdAt(self):
+		return self.data['createdAt'] if 'createdAt' in self.data else datetime.utcnow()
+
+	@property
+	def updatedAt(self):
+		return self.data['updatedAt'] if 'updatedAt' in self.data else datetime.utcnow()
 
 	def to_dict(self):
 		return self.data or {
@@ -36,47 +47,47 @@ class Category:
 		}
 
 	def save(self):
-		"""Create a new category document."""
+		"""Create a new category document, or write only the fields changed since it was loaded."""
 		db = get_db()
 		if not db:
 			return None
-		doc_ref = db.collection('categories').document()
-		# Ensure ids are consistent
-		self.data['id'] = doc_ref.id
-		self.data['createdAt'] = self.data.get('createdAt', datetime.utcnow())
-		self.data['updatedAt'] = datetime.utcnow()
-		doc_ref.set(self.data)
-		self.id = doc_ref.id
+		changes = self.changes()
+		if changes is None:
+			doc_ref = db.collection('categories').document()
+			# Ensure ids are consistent
+			self.data['id'] = doc_ref.id
+			self.data['createdAt'] = self.data.get('createdAt', datetime.utcnow())
+			self.data['updatedAt'] = datetime.utcnow()
+			set_document(doc_ref, self.data)
+			catalog_cache.delete('categories')
+		elif changes:
+			self.data['updatedAt'] = datetime.utcnow()
+			changes['updatedAt'] = self.data['updatedAt']
+			update_document(db.collection('categories').document(self.id), changes)
+			catalog_cache.delete('categories')
+		self.mark_saved()
 		return self
 
 	def update(self, updates):
-		"""Update category fields in Firestore and local cache."""
-		db = get_db()
-		if not db or not self.id:
+		"""Apply field updates and save the ones that change anything."""
+		if not get_db() or not self.id:
 			return False
-		updates = dict(updates or {})
-		updates['updatedAt'] = datetime.utcnow()
-		db.collection('categories').document(self.id).update(updates)
-		self.data.update(updates)
-		# also update attributes if present
-		for key, value in updates.items():
-			setattr(self, key, value)
+		if self.changes() is None:
+			# Built by hand rather than loaded: take the stored state to be what we hold
+			self.mark_saved()
+		self.data.update(updates or {})
+		self.save()
 		return True
 
 	def increment_course_count(self, delta=1):
-		"""Atomically increment coursesCount."""
-		db = get_db()
-		if not db or not self.id:
+		"""Atomically increment coursesCount through its sharded counter."""
+		if not get_db() or not self.id:
 			return False
 		try:
-			db.collection('categories').document(self.id).update({
-				'coursesCount': firestore.Increment(delta),
-				'updatedAt': datetime.utcnow(),
-			})
+			courses_counter.increment(self.id, delta)
+			catalog_cache.delete('categories')
 			self.coursesCount = (self.coursesCount or 0) + delta
-			self.updatedAt = datetime.utcnow()
 			self.data['coursesCount'] = self.coursesCount
-			self.data['updatedAt'] = self.updatedAt
 			return True
 		except Exception as e:
 			print(f"Error incrementing coursesCount: {e}")
@@ -88,27 +99,58 @@ class Category:
 		db = get_db()
 		if not db:
 			return None
-		doc = db.collection('categories').document(category_id).get()
+		doc = get_document(db.collection('categories').document(category_id))
 		if doc.exists:
-			data = doc.to_dict()
-			data['id'] = doc.id
-			return cls(data)
+			return cls.from_doc(doc)
 		return None
 
+	@classmethod
+	def find_catalog(cls):
+		"""All categories as dicts with live course counts; the documents come from the catalog cache."""
+		return courses_counter.with_totals(cls._cached_catalog())
+
+	@classmethod
+	def _cached_catalog(cls):
+		"""All categories as stored, served from the per-instance catalog cache."""
+		categories = catalog_cache.get('categories')
+		if categories is None:
+			categories = [dict(category.to_dict()) for category in cls.find_all()]
+			catalog_cache.set('categories', categories, size=estimate_size(categories))
+		return categories
+
+	@classmethod
+	def resolve_id(cls, name_or_id):
+		"""Category id for a course's `category` value, which may be a name or an id."""
+		if not name_or_id:
+			return None
+		for category in cls._cached_catalog():
+			if name_or_id in (category.get('id'), category.get('name')):
+				return category.get('id')
+		return None
+
+	@classmethod
+	def from_doc(cls, doc):
+		data = doc.to_dict()
+		data['id'] = doc.id
+		category = cls(data)
+		category.mark_saved()
+		return category
+
+	@classmethod
+	def query(cls):
+		"""Chainable query over categories; see models/query.py."""
+		return Query('categories', cls.from_doc)
+
 	@classmethod
 	def find_all(cls, filters=None):
 		"""Return list of categories, with optional equality filters."""
-		db = get_db()
-		if not db:
+		if not get_db():
 			return []
-		collection_ref = db.collection('categories')
-		if filters:
-			for key, value in filters.items():
-				collection_ref = collection_ref.where(key, '==', value)
-		docs = collection_ref.stream()
-		categories = []
-		for doc in docs:
-			data = doc.to_dict()
-			data['id'] = doc.id
-			categories.append(cls(data))
-		return categories
+		return cls.query().filter_by(filters).all()
+
+	@classmethod
+	def find_page(cls, filters=None, limit=None, cursor=None):
+		"""Return one page of categories as (categories, next_cursor)."""
+		if not get_db():
+			return [], None
+		return cls.query().filter_by(filters).page(limit, cursor)
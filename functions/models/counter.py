@@ -0,0 +1,140 @@
+"""Sharded counters for aggregate fields that take many concurrent writes.
+
+Firestore sustains about one write per second to a single document, so a
+counter on a popular course would serialize every enroll on that document.
+Increments go to one of N shard documents in a subcollection instead, picked
+at random. The parent field holds everything already folded in by
+reconcile(); the live value is the parent field plus the shards. Listings
+and single-document views both add the shards, so they show the same count.
+"""
+import os
+import random
+from collections import defaultdict
+
+from firebase_admin import firestore
+
+from models.db import commit_batch, get_db, set_document, stream_query
+from utils.cache import counter_cache
+
+NUM_SHARDS = int(os.environ.get('COUNTER_SHARDS', 10))
+
+# Firestore allows at most 500 writes in one batch
+MAX_BATCH_WRITES = 500
+
+
+class ShardedCounter:
+    """A numeric field on `collection` documents, spread over shard subdocuments"""
+
+    def __init__(self, collection, field, num_shards=NUM_SHARDS):
+        self.collection = collection
+        self.field = field
+        self.num_shards = num_shards
+        self.shard_collection = f'{field}_shards'
+
+    def _shards(self, doc_id):
+        return get_db().collection(self.collection).document(doc_id).collection(self.shard_collection)
+
+    def _cache_key(self, doc_id):
+        return f'{self.collection}/{doc_id}/{self.field}'
+
+    def _all_key(self):
+        return f'{self.collection}/*/{self.field}'
+
+    def _forget(self, doc_id):
+        counter_cache.delete(self._cache_key(doc_id))
+        counter_cache.delete(self._all_key())
+
+    def increment(self, doc_id, delta=1, batch=None):
+        """Add delta to a random shard, as part of `batch` when one is given"""
+        shard_ref = self._shards(doc_id).document(str(random.randrange(self.num_shards)))
+        data = {'count': firestore.Increment(delta)}
+        if batch is not None:
+            batch.set(shard_ref, data, merge=True)
+        else:
+            set_document(shard_ref, data, merge=True)
+        self._forget(doc_id)
+
+    def pending(self, doc_id):
+        """Sum of the shards not yet folded into the parent field (cached briefly)"""
+        everything = counter_cache.get(self._all_key())
+        if everything is not None:
+            return everything.get(doc_id, 0)
+        key = self._cache_key(doc_id)
+        value = counter_cache.get(key)
+        if value is None:
+            value = sum(doc.get('count') or 0 for doc in stream_query(self._shards(doc_id)))
+            counter_cache.set(key, value)
+        return value
+
+    def pending_all(self):
+        """{doc_id: unreconciled sum} for every document, from one collection-group query (cached briefly)"""
+        key = self._all_key()
+        totals = counter_cache.get(key)
+        if totals is None:
+            totals = {}
+            for shard in stream_query(get_db().collection_group(self.shard_collection)):
+                parent_ref = shard.reference.parent.parent
+                if parent_ref.parent.id == self.collection:
+                    totals[parent_ref.id] = totals.get(parent_ref.id, 0) + (shard.get('count') or 0)
+            counter_cache.set(key, totals)
+        return totals
+
+    def with_totals(self, records, id_field='id'):
+        """Copies of document dicts with the field set to its live total, reading every shard at once"""
+        if not any(self.field in record for record in records):
+            return records
+        pending = self.pending_all()
+        return [dict(record, **{self.field: (record.get(self.field) or 0) + pending.get(record.get(id_field), 0)})
+                if self.field in record else record for record in records]
+
+    def total(self, doc_id, base=0):
+        """Live value: the parent field's `base` plus unreconciled shards"""
+        return (base or 0) + self.pending(doc_id)
+
+    def _fold(self, batch, parent_ref, shards):
+        """Queue moving the shards' counts into the parent field; returns the amount moved"""
+        amount = 0
+        for shard in shards:
+            count = shard.get('count') or 0
+            if count:
+                # Subtract what was read rather than zeroing, so increments that
+                # land between the read and the commit are kept
+                batch.update(shard.reference, {'count': firestore.Increment(-count)})
+                amount += count
+        if amount:
+            batch.update(parent_ref, {self.field: firestore.Increment(amount)})
+        return amount
+
+    def reconcile(self, doc_id):
+        """Fold one document's shards back into its parent field"""
+        db = get_db()
+        batch = db.batch()
+        amount = self._fold(batch, db.collection(self.collection).document(doc_id),
+                            list(stream_query(self._shards(doc_id))))
+        commit_batch(batch)
+        self._forget(doc_id)
+        return amount
+
+    def reconcile_all(self):
+        """Fold every document's shards back, returning the number of documents updated"""
+        db = get_db()
+        shards_by_parent = defaultdict(list)
+        for shard in stream_query(db.collection_group(self.shard_collection)):
+            parent_ref = shard.reference.parent.parent
+            if parent_ref.parent.id == self.collection:
+                shards_by_parent[parent_ref.path].append(shard)
+
+        updated = 0
+        batch = db.batch()
+        for path, shards in shards_by_parent.items():
+            # Keep each parent's writes in one batch so its total never looks doubled
+            if len(batch) + len(shards) + 1 > MAX_BATCH_WRITES:
+                commit_batch(batch)
+                batch = db.batch()
+            parent_ref = db.document(path)
+            if self._fold(batch, parent_ref, shards):
+                updated += 1
+            counter_cache.delete(self._cache_key(parent_ref.id))
+        commit_batch(batch)
+        counter_cache.delete(self._all_key())
+        return updated
@@ -1,75 +1,328 @@
-from firebase_admin import firestore
 from datetime import datetime
+from models.category import Category, courses_counter
+from models.counter import ShardedCounter
+from models.db import commit_batch, get_db, get_document, get_documents
+from models.fields import data_field
+from models.query import DESCENDING, InvalidQuery, Query
+from utils.cache import catalog_cache, estimate_size, lesson_cache
+from utils.facets import FacetIndex
+from utils.search import SearchIndex
 
-# Initialize database client lazily
-def get_db():
-    try:
-        return firestore.client()
-    except Exception as e:
-        print(f"Error getting Firestore client: {e}")
+# Fields the catalog list screen needs; everything except lessons and createdAt
+SUMMARY_FIELDS = [
+    'title', 'description', 'instructor', 'duration', 'difficulty', 'thumbnail',
+    'price', 'rating', 'studentsCount', 'category', 'isPublished', 'updatedAt'
+]
+
+# Named projections accepted by ?fields=
+PROJECTIONS = {
+    'summary': SUMMARY_FIELDS
+}
+
+# Catalog filters accepted by GET /courses, applied in Firestore
+CATALOG_RANGES = {
+    'min_price': ('price', '>='),
+    'max_price': ('price', '<='),
+    'min_rating': ('rating', '>=')
+}
+CATALOG_SORTS = ['rating', 'price', 'studentsCount', 'createdAt']
+CATALOG_PARAMS = ['category', 'difficulty', 'sort'] + list(CATALOG_RANGES)
+
+# Full-text search over the published catalog; a title hit counts most
+course_index = SearchIndex({'title': 3.0, 'instructor': 2.0, 'lessons': 1.5, 'description': 1.0})
+
+def search_fields(course):
+    """(id, text fields) a catalog course dict is indexed under"""
+    lessons = course.get('lessons') or []
+    return course.get('id'), {
+        'title': course.get('title') or '',
+        'description': course.get('description') or '',
+        'instructor': course.get('instructor') or '',
+        'lessons': ' '.join(lesson.get('title') or '' for lesson in lessons if isinstance(lesson, dict))
+    }
+
+# Upper bounds of the price bands shown as a facet; anything above the last is '200+'
+PRICE_BANDS = [(50, '0-50'), (100, '50-100'), (200, '100-200')]
+
+def price_band(course):
+    price = course.get('price')
+    if price is None:
         return None
+    if not price:
+        return 'free'
+    for upper, label in PRICE_BANDS:
+        if price < upper:
+            return label
+    return '200+'
+
+# Facet counts for the catalog UI, rebuilt whenever the cached catalog is
+course_facets = FacetIndex({
+    'category': lambda course: course.get('category'),
+    'difficulty': lambda course: course.get('difficulty'),
+    'instructor': lambda course: course.get('instructor'),
+    'price': price_band
+})
+
+# (catalog list, {id: course}) for the catalog list the map was built from
+_published_by_id = (None, {})
+
+# Every enroll bumps this, so it is sharded; studentsCount holds the reconciled part
+students_counter = ShardedCounter('courses', 'studentsCount')
+
+class LessonIndex:
+    """A course's lessons as bit positions, for O(1) completion checks.
+    
+    Bits follow the lessons' positions in the list, not their `order` field:
+    orders may be missing, non-integer or repeated, and each lesson ID must
+    get a bit of its own for full_mask to count every lesson.
+    """
+    __slots__ = ('positions', 'full_mask', 'count')
+    
+    def __init__(self, lessons):
+        self.positions = {}  # lesson id -> bit position
+        for lesson in lessons or []:
+            if isinstance(lesson, dict) and lesson.get('id') and lesson['id'] not in self.positions:
+                self.positions[lesson['id']] = len(self.positions)
+        self.count = len(self.positions)
+        self.full_mask = (1 << self.count) - 1
+    
+    def mask(self, lesson_ids):
+        """Bitset of the given lessons; IDs that are not in the course are ignored"""
+        mask = 0
+        for lesson_id in lesson_ids:
+            position = self.positions.get(lesson_id)
+            if position is not None:
+                mask |= 1 << position
+        return mask
+    
+    def percentage(self, mask):
+        return round((mask & self.full_mask).bit_count() * 100.0 / self.count, 1) if self.count else 0.0
+    
+    def is_complete(self, mask):
+        return self.count > 0 and mask & self.full_mask == self.full_mask
 
 class Course:
+    # Only the document dict is stored; fields are read from it on access
+    __slots__ = ('data',)
+    
     def __init__(self, data=None):
         self.data = data or {}
-        # Add properties for easy access
-        self.id = self.data.get('id', '')
-        self.title = self.data.get('title', '')
-        self.description = self.data.get('description', '')
-        self.instructor = self.data.get('instructor', '')
-        self.duration = self.data.get('duration', 0)
-        self.difficulty = self.data.get('difficulty', 'Beginner')
-        self.price = self.data.get('price', 0.0)
-        self.rating = self.data.get('rating', 0.0)
-        self.studentsCount = self.data.get('studentsCount', 0)
-        self.category = self.data.get('category', '')
-        self.lessons = self.data.get('lessons', [])
-        self.isPublished = self.data.get('isPublished', True)
+    
+    id = data_field('id', '')
+    title = data_field('title', '')
+    description = data_field('description', '')
+    instructor = data_field('instructor', '')
+    duration = data_field('duration', 0)
+    difficulty = data_field('difficulty', 'Beginner')
+    price = data_field('price', 0.0)
+    rating = data_field('rating', 0.0)
+    studentsCount = data_field('studentsCount', 0)
+    category = data_field('category', '')
+    isPublished = data_field('isPublished', True)
+    
+    @property
+    def lessons(self):
+        """Lessons are only looked at when asked for, and absent from summary projections"""
+        return self.data.get('lessons', [])
     
     def save(self):
         db = get_db()
         if not db:
             return None
         doc_ref = db.collection('courses').document()
-        doc_ref.set(self.data)
+        batch = db.batch()
+        batch.set(doc_ref, self.data)
+        # Count the course in its category in the same atomic write
+        category_id = Category.resolve_id(self.category)
+        if category_id:
+            courses_counter.increment(category_id, batch=batch)
+        commit_batch(batch)
         self.data['id'] = doc_ref.id
         self.id = doc_ref.id
+        catalog_cache.delete_prefix('courses:published')
+        catalog_cache.delete('categories')
         return self
     
     @classmethod
-    def find_all(cls, filters=None):
-        """Find all courses with optional filters"""
-        db = get_db()
-        if not db:
+    def from_doc(cls, doc):
+        course_data = doc.to_dict()
+        course_data['id'] = doc.id
+        return cls(course_data)
+    
+    @classmethod
+    def query(cls):
+        """Chainable query over courses; see models/query.py"""
+        return Query('courses', cls.from_doc)
+    
+    @classmethod
+    def find_all(cls, filters=None, fields=None):
+        """Find all courses with optional filters and field projection"""
+        if not get_db():
             return []
-        collection_ref = db.collection('courses')
-        
-        if filters:
-            for key, value in filters.items():
-                collection_ref = collection_ref.where(key, '==', value)
+        return cls.query().filter_by(filters).select(fields).all()
+    
+    @classmethod
+    def find_page(cls, filters=None, limit=None, cursor=None, fields=None):
+        """Find one page of courses, returning (courses, next_cursor)"""
+        if not get_db():
+            return [], None
+        return cls.query().filter_by(filters).select(fields).page(limit, cursor)
+    
+    @classmethod
+    def catalog_query(cls, args):
+        """Published courses narrowed by catalog query parameters, or None when there are none.
         
-        docs = collection_ref.stream()
-        courses = []
+        ?category=a,b  ?difficulty=a,b  ?min_price=  ?max_price=  ?min_rating=
+        ?sort=rating|-rating|price|-price|...  (see CATALOG_SORTS)
         
-        for doc in docs:
-            course_data = doc.to_dict()
-            course_data['id'] = doc.id
-            courses.append(cls(course_data))
-            
-        return courses
+        Range filters may only be on one field, and a sort alongside them must
+        be on that field, so each combination needs one composite index.
+        """
+        if not any(args.get(param) for param in CATALOG_PARAMS):
+            return None
+        query = cls.query().where('isPublished', '==', True)
+        for param in ('category', 'difficulty'):
+            values = [value.strip() for value in (args.get(param) or '').split(',') if value.strip()]
+            if len(values) == 1:
+                query = query.where(param, '==', values[0])
+            elif values:
+                query = query.where(param, 'in', values)
+        for param, (field, op) in CATALOG_RANGES.items():
+            value = args.get(param)
+            if value:
+                try:
+                    query = query.where(field, op, float(value))
+                except ValueError:
+                    raise InvalidQuery(f'{param} must be a number')
+        ranged = {field for param, (field, _) in CATALOG_RANGES.items() if args.get(param)}
+        if len(ranged) > 1:
+            raise InvalidQuery('Price and rating filters cannot be combined')
+        sort = args.get('sort')
+        if sort:
+            if sort.lstrip('-') not in CATALOG_SORTS:
+                raise InvalidQuery(f'Invalid sort: {sort}')
+            if ranged and sort.lstrip('-') not in ranged:
+                raise InvalidQuery(f'With a {next(iter(ranged))} filter, sort must be on {next(iter(ranged))}')
+            if sort.startswith('-'):
+                query = query.order_by(sort[1:], DESCENDING)
+            else:
+                query = query.order_by(sort)
+        return query
+    
+    @classmethod
+    def find_published(cls, fields=None):
+        """Published courses as dicts, served from the per-instance catalog cache"""
+        key = 'courses:published'
+        if fields is not None:
+            key += ':' + ','.join(sorted(fields))
+        course_list = catalog_cache.get(key)
+        if course_list is None:
+            courses = cls.find_all({'isPublished': True}, fields=fields)
+            course_list = [course.to_dict() for course in courses]
+            catalog_cache.set(key, course_list, size=estimate_size(course_list))
+        return course_list
+    
+    @classmethod
+    def published_by_id(cls):
+        """{id: course dict} over the cached catalog, rebuilt only when the catalog list is replaced"""
+        global _published_by_id
+        courses = cls.find_published()
+        source, by_id = _published_by_id
+        if source is not courses:
+            by_id = {course.get('id'): course for course in courses}
+            _published_by_id = (courses, by_id)
+        return by_id
+    
+    @classmethod
+    def find_published_by_id(cls, course_id):
+        """One published course's dict from the catalog cache, or None"""
+        return cls.published_by_id().get(course_id)
+    
+    @classmethod
+    def search(cls, query, limit=20):
+        """Published course dicts matching `query`, best first, as (course, score) pairs"""
+        # The catalog list is replaced whenever the cache refreshes; only changed courses are re-indexed
+        course_index.sync(cls.find_published(), search_fields)
+        return course_index.search(query, limit)
+    
+    @classmethod
+    def facet_counts(cls, filters=None):
+        """(matching course count, per-facet value counts) for {facet: [values]} filters"""
+        course_facets.sync(cls.find_published())
+        return course_facets.counts(filters)
     
     @classmethod
-    def get_by_id(cls, course_id):
+    def get_by_id(cls, course_id, fields=None):
         db = get_db()
         if not db:
             return None
         doc_ref = db.collection('courses').document(course_id)
-        doc = doc_ref.get()
+        doc = get_document(doc_ref, field_paths=fields)
         if doc.exists:
-            course_data = doc.to_dict()
-            course_data['id'] = doc.id
-            return cls(course_data)
+            return cls.from_doc(doc)
         return None
     
+    @classmethod
+    def get_by_ids(cls, course_ids, chunk_size=100):
+        """Fetch many courses with batched reads, returning {course_id: Course}"""
+        db = get_db()
+        if not db:
+            return {}
+        # Dedupe while keeping order, so each course is read once
+        unique_ids = list(dict.fromkeys(course_id for course_id in course_ids if course_id))
+        collection_ref = db.collection('courses')
+        courses = {}
+        
+        for start in range(0, len(unique_ids), chunk_size):
+            doc_refs = [collection_ref.document(course_id) for course_id in unique_ids[start:start + chunk_size]]
+            for doc in get_documents(doc_refs):
+                if doc.exists:
+                    courses[doc.id] = cls.from_doc(doc)
+        
+        return courses
+    
+    @classmethod
+    def lesson_indexes(cls, course_ids):
+        """{course_id: LessonIndex}, cached per course so progress events never load course documents"""
+        indexes = {}
+        missing = []
+        for course_id in course_ids:
+            if not course_id:
+                continue
+            index = lesson_cache.get(f'courses:lessons:{course_id}')
+            if index is None:
+                missing.append(course_id)
+            else:
+                indexes[course_id] = index
+        
+        if missing:
+            db = get_db()
+            collection_ref = db.collection('courses')
+            docs = get_documents([collection_ref.document(course_id) for course_id in missing],
+                                 field_paths=['lessons'])
+            for doc in docs:
+                if doc.exists:
+                    index = LessonIndex((doc.to_dict() or {}).get('lessons'))
+                    lesson_cache.set(f'courses:lessons:{doc.id}', index)
+                    indexes[doc.id] = index
+        return indexes
+    
+    @staticmethod
+    def parse_fields(spec):
+        """Turn a ?fields= value ('summary', 'title,price', ...) into Firestore field paths"""
+        if not spec:
+            return None
+        fields = []
+        for name in spec.split(','):
+            name = name.strip()
+            if name in PROJECTIONS:
+                fields.extend(PROJECTIONS[name])
+            elif name.isidentifier():
+                fields.append(name)
+            elif name:
+                raise ValueError(f'Invalid field: {name}')
+        # The document ID is always returned and is not a stored field
+        return [field for field in dict.fromkeys(fields) if field != 'id']
+    
     def to_dict(self):
         return self.data
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""Shared Firestore access for every model.
+
+Owns the one Firestore client per instance and counts every read, write and
+query made while handling a request, with the time spent in each. Models go
+through these helpers instead of calling the client directly, so this is the
+single place to measure or tune round trips.
+"""
+import threading
+import time
+
+from firebase_admin import firestore
+from flask import g, has_app_context
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_db():
+    """Get the shared Firestore client, creating it (and its gRPC channel) once"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    _client = firestore.client()
+                except Exception as e:
+                    print(f"Error getting Firestore client: {e}")
+                    return None
+    return _client
+
+
+class CallStats:
+    """Firestore round trips made while handling one request"""
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        self.read_ms = 0.0
+        self.write_ms = 0.0
+        self.query_ms = 0.0
+
+    def record(self, kind, count, elapsed_ms):
+        if kind == 'query':
+            # Firestore bills every document a query returns as a read
+            self.queries += 1
+            self.reads += count
+            self.query_ms += elapsed_ms
+        elif kind == 'write':
+            self.writes += count
+            self.write_ms += elapsed_ms
+        else:
+            self.reads += count
+            self.read_ms += elapsed_ms
+
+    def total_ms(self):
+        return self.read_ms + self.write_ms + self.query_ms
+
+    def as_dict(self):
+        return {
+            'reads': self.reads,
+            'writes': self.writes,
+            'queries': self.queries,
+            'read_ms': round(self.read_ms, 2),
+            'write_ms': round(self.write_ms, 2),
+            'query_ms': round(self.query_ms, 2)
+        }
+
+    def server_timing(self):
+        """Value for a Server-Timing response header"""
+        return (f'fs-read;dur={self.read_ms:.1f};desc="{self.reads} reads", '
+                f'fs-write;dur={self.write_ms:.1f};desc="{self.writes} writes", '
+                f'fs-query;dur={self.query_ms:.1f};desc="{self.queries} queries"')
+
+
+# Used outside a request (scripts, streamed bodies after the request context ends)
+_process_stats = CallStats()
+
+
+def current_stats():
+    """Stats for the request being handled, or the process-wide ones outside a request"""
+    if has_app_context():
+        stats = g.get('firestore_stats')
+        if stats is None:
+            stats = g.firestore_stats = CallStats()
+        return stats
+    return _process_stats
+
+
+def _elapsed_ms(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def get_document(doc_ref, field_paths=None):
+    """Read one document"""
+    start = time.perf_counter()
+    doc = doc_ref.get(field_paths=field_paths)
+    current_stats().record('read', 1, _elapsed_ms(start))
+    return doc
+
+
+def get_documents(doc_refs, field_paths=None):
+    """Read many documents in one batched call"""
+    doc_refs = list(doc_refs)
+    if not doc_refs:
+        return []
+    start = time.perf_counter()
+    docs = list(get_db().get_all(doc_refs, field_paths=field_paths))
+    current_stats().record('read', len(docs), _elapsed_ms(start))
+    return docs
+
+
+def stream_query(query):
+    """Iterate a query's results, timing only the time spent waiting on Firestore"""
+    count = 0
+    elapsed = 0.0
+    iterator = iter(query.stream())
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                doc = next(iterator)
+            except StopIteration:
+                elapsed += _elapsed_ms(start)
+                break
+            elapsed += _elapsed_ms(start)
+            count += 1
+            yield doc
+    finally:
+        current_stats().record('query', count, elapsed)
+
+
+def run_aggregation(aggregation_query):
+    """Run a count/sum/avg aggregation query, returning {alias: value}"""
+    start = time.perf_counter()
+    results = aggregation_query.get()
+    # Billed as one read per 1000 index entries matched (at least one), not per document
+    current_stats().record('query', 1, _elapsed_ms(start))
+    return {result.alias: result.value for row in results for result in row}
+
+
+def set_document(doc_ref, data, merge=False):
+    """Write a whole document"""
+    start = time.perf_counter()
+    result = doc_ref.set(data, merge=merge)
+    current_stats().record('write', 1, _elapsed_ms(start))
+    return result
+
+
+def update_document(doc_ref, data, option=None):
+    """Update fields of an existing document, optionally only if unchanged since a read"""
+    start = time.perf_counter()
+    result = doc_ref.update(data, option=option)
+    current_stats().record('write', 1, _elapsed_ms(start))
+    return result
+
+
+def commit_batch(batch):
+    """Commit a WriteBatch in one round trip"""
+    count = len(batch)
+    if not count:
+        return None
+    start = time.perf_counter()
+    result = batch.commit()
+    current_stats().record('write', count, _elapsed_ms(start))
+    return result
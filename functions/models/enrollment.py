@@ -1,23 +1,34 @@
 from datetime import datetime
 from firebase_admin import firestore
+import os
 import uuid
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from models.db import commit_batch, get_db, get_document, get_documents, update_document
+from models.progress_buffer import (COMPLETION_FIELDS, PendingProgress, completion_writes, progress_buffer,
+                                    queue_user_stats, write_progress)
+from models.query import DESCENDING, Query
+from utils.cache import analytics_cache
+
+# Also look up UUID-keyed enrollments by query when the point read misses. Off by
+# default: set ENROLLMENT_LEGACY_LOOKUP=1 on deployments that still hold enrollments
+# created before deterministic IDs, until migrate_enrollment_ids.py has run without conflicts
+LEGACY_ENROLLMENT_LOOKUP = os.environ.get('ENROLLMENT_LEGACY_LOOKUP', '0') == '1'
 
 class Enrollment:
+    __slots__ = ('enrollment_id', 'user_id', 'course_id', 'enrolled_at', '_progress', 'status',
+                 'completed_at', 'certificate_issued', 'rating', 'review', 'reviewed_at')
+    
     def __init__(self, enrollment_id=None, user_id=None, course_id=None,
                  enrolled_at=None, **kwargs):
-        self.enrollment_id = enrollment_id or str(uuid.uuid4())
+        if not enrollment_id:
+            enrollment_id = Enrollment.make_id(user_id, course_id) if user_id and course_id else str(uuid.uuid4())
+        self.enrollment_id = enrollment_id
         self.user_id = user_id
         self.course_id = course_id
         self.enrolled_at = enrolled_at or datetime.utcnow()
         
-        # Progress tracking
-        self.progress = kwargs.get('progress', {
-            'completed_lessons': [],
-            'current_lesson': 0,
-            'completion_percentage': 0.0,
-            'total_time_spent': 0,  # in minutes
-            'last_accessed': None
-        })
+        # Progress tracking; the default map is only built when first used
+        self._progress = kwargs.get('progress')
         
         # Status
         self.status = kwargs.get('status', 'active')  # 'active', 'completed', 'dropped'
@@ -29,11 +40,117 @@ class Enrollment:
         self.review = kwargs.get('review')
         self.reviewed_at = kwargs.get('reviewed_at')
 
+    @property
+    def progress(self):
+        progress = self._progress
+        if progress is None:
+            progress = self._progress = {
+                'completed_lessons': [],
+                'current_lesson': 0,
+                'completion_percentage': 0.0,
+                'total_time_spent': 0,  # in minutes
+                'last_accessed': None
+            }
+        elif isinstance(progress, dict) and 'completed_lessons' in progress:
+            # Derived from completed_lessons, for documents written before progress writes kept it
+            progress['current_lesson'] = len(progress['completed_lessons'])
+        return progress
+
+    @progress.setter
+    def progress(self, value):
+        self._progress = value
+
     @classmethod
     def from_dict(cls, data):
         """Create Enrollment object from dictionary"""
         return cls(**data)
 
+    @classmethod
+    def from_doc(cls, doc):
+        enrollment_data = doc.to_dict()
+        enrollment_data['enrollment_id'] = doc.id
+        return cls.from_dict(enrollment_data)
+
+    @classmethod
+    def query(cls):
+        """Chainable query over enrollments; see models/query.py"""
+        return Query('enrollments', cls.from_doc)
+
+    @staticmethod
+    def make_id(user_id, course_id):
+        """Document ID of a user's enrollment in a course, so it can be read without a query"""
+        return f'{user_id}_{course_id}'
+
+    @staticmethod
+    def is_owned_by(enrollment_id, user_id):
+        """True when a deterministic enrollment ID names this user, so ownership needs no read.
+        
+        Only an ID with exactly one '_' splits into user and course unambiguously:
+        custom-token UIDs (and course IDs) may contain '_', and then 'abc_x_<course>'
+        could belong to 'abc' or 'abc_x'. False means the caller must read the owner.
+        """
+        owner, separator, course_id = enrollment_id.partition('_')
+        return bool(user_id) and bool(separator) and owner == user_id and '_' not in course_id
+
+    @staticmethod
+    def record_progress(enrollment_id, lesson_id, time_spent=0):
+        """Record a field-level progress update, returning the events it carried.
+        
+        Written as ArrayUnion/Increment/server timestamp with update(), which
+        fails instead of creating the document if the enrollment is gone. Only
+        time-only events are blind: a completed lesson reads the enrollment's
+        progress first to recompute completion, then sets entry.progress.
+        Written before returning unless buffering is enabled; see models/progress_buffer.py.
+        """
+        return progress_buffer.add(enrollment_id, lesson_id, time_spent)
+
+    @staticmethod
+    def record_progress_batch(user_id, events):
+        """Apply many {enrollment_id, lesson_id, time_spent} events, returning a status per event.
+        
+        Ownership is checked with one batched read, events are merged per
+        enrollment and written in chunked WriteBatches straight away, bypassing
+        the progress buffer so the caller learns what was stored.
+        """
+        db = get_db()
+        collection_ref = db.collection('enrollments')
+        enrollment_ids = list(dict.fromkeys(event['enrollment_id'] for event in events))
+        owners = {}
+        for doc in get_documents([collection_ref.document(enrollment_id) for enrollment_id in enrollment_ids],
+                                 field_paths=['user_id']):
+            if doc.exists:
+                owners[doc.id] = doc.get('user_id')
+        
+        now = datetime.utcnow()
+        merged = {}
+        statuses = []
+        for event in events:
+            enrollment_id = event['enrollment_id']
+            if enrollment_id not in owners:
+                statuses.append('not_found')
+            elif owners[enrollment_id] != user_id:
+                statuses.append('forbidden')
+            else:
+                entry = merged.get(enrollment_id)
+                if entry is None:
+                    entry = merged[enrollment_id] = PendingProgress()
+                entry.add(event['lesson_id'], event.get('time_spent', 0), now)
+                statuses.append('ok')
+        
+        failed, missing = write_progress(merged)
+        results = []
+        for event, status in zip(events, statuses):
+            if status == 'ok' and event['enrollment_id'] in failed:
+                status = 'error'
+            elif status == 'ok' and event['enrollment_id'] in missing:
+                status = 'not_found'
+            results.append({
+                'enrollment_id': event['enrollment_id'],
+                'lesson_id': event['lesson_id'],
+                'status': status
+            })
+        return results
+
     def to_dict(self):
         """Convert Enrollment object to dictionary"""
         return {
@@ -50,72 +167,136 @@ class Enrollment:
             'reviewed_at': self.reviewed_at
         }
 
+    @staticmethod
+    def with_courses(enrollments):
+        """Convert enrollments to dicts with their course embedded, reading all courses in one batch"""
+        return list(Enrollment.iter_with_courses(enrollments, window=max(len(enrollments), 1)))
+
+    @staticmethod
+    def iter_with_courses(enrollments, window=100, max_courses=1000):
+        """Yield enrollment dicts with their course embedded, resolving courses one window at a time.
+        
+        Courses seen in earlier windows are reused, up to max_courses, so memory stays bounded
+        however many enrollments pass through.
+        """
+        from models.course import Course
+        courses = {}
+        
+        def join(batch):
+            missing = [enrollment.course_id for enrollment in batch if enrollment.course_id not in courses]
+            if len(courses) + len(missing) > max_courses:
+                courses.clear()
+                missing = [enrollment.course_id for enrollment in batch]
+            courses.update(Course.get_by_ids(missing))
+            
+            for enrollment in batch:
+                course = courses.get(enrollment.course_id)
+                enrollment_dict = enrollment.to_dict()
+                enrollment_dict['course'] = course.to_dict() if course else None
+                yield enrollment_dict
+        
+        batch = []
+        for enrollment in enrollments:
+            batch.append(enrollment)
+            if len(batch) >= window:
+                yield from join(batch)
+                batch = []
+        if batch:
+            yield from join(batch)
+
+    @classmethod
+    def iter_all(cls, filters=None):
+        """Yield enrollments straight off the Firestore stream, without building a list"""
+        return cls.query().filter_by(filters).stream()
+
     @classmethod
     def find_all(cls, filters=None):
         """Find all enrollments with optional filters"""
         try:
-            db = firestore.client()
-            collection_ref = db.collection('enrollments')
-            
-            if filters:
-                for key, value in filters.items():
-                    collection_ref = collection_ref.where(key, '==', value)
-            
-            docs = collection_ref.stream()
-            enrollments = []
-            
-            for doc in docs:
-                enrollment_data = doc.to_dict()
-                enrollment_data['enrollment_id'] = doc.id
-                enrollments.append(cls.from_dict(enrollment_data))
-                
-            return enrollments
+            return cls.query().filter_by(filters).all()
         except Exception as e:
             print(f'Error finding enrollments: {e}')
             return []
 
     @classmethod
-    def create_enrollment(cls, user_id, course_id):
-        """Create new enrollment"""
+    def find_page(cls, filters=None, limit=None, cursor=None):
+        """Find one page of enrollments, returning (enrollments, next_cursor)"""
+        return cls.query().filter_by(filters).page(limit, cursor)
+
+    @classmethod
+    def get_by_id(cls, enrollment_id):
+        """Get enrollment by ID"""
         try:
-            # Check if enrollment already exists
-            existing = cls.get_user_course_enrollment(user_id, course_id)
-            if existing:
-                return existing
-            
-            # Create new enrollment
-            enrollment = cls(user_id=user_id, course_id=course_id)
-            
-            # Save to Firestore
-            db = firestore.client()
-            db.collection('enrollments').document(enrollment.enrollment_id).set(enrollment.to_dict())
-            
-            # Update user enrollment count
-            from models.user import User
-            user = User.get_by_id(user_id)
-            if user:
-                user.increment_enrollment_count()
-            
-            return enrollment
+            db = get_db()
+            doc = get_document(db.collection('enrollments').document(enrollment_id))
+            if doc.exists:
+                enrollment_data = doc.to_dict()
+                enrollment_data['enrollment_id'] = doc.id
+                return cls.from_dict(enrollment_data)
+            return None
         except Exception as e:
-            print(f'Error creating enrollment: {e}')
+            print(f'Error getting enrollment: {e}')
             return None
 
+    @classmethod
+    def create_enrollment(cls, user_id, course_id):
+        """Create new enrollment and bump the user's and course's counters in one atomic write.
+        
+        Raises AlreadyExists when the user is already enrolled; nothing is
+        written in that case. The caller checks that the course exists.
+        Usually a single commit with no reads: create()'s precondition is the
+        duplicate check.
+        """
+        if LEGACY_ENROLLMENT_LOOKUP:
+            # Only UUID-keyed enrollments escape create()'s precondition
+            legacy = cls.query()\
+                        .where('user_id', '==', user_id)\
+                        .where('course_id', '==', course_id)\
+                        .select(['status'])\
+                        .first()
+            if legacy:
+                raise AlreadyExists(f'Enrollment {legacy.enrollment_id} already exists')
+        
+        enrollment = cls(user_id=user_id, course_id=course_id)
+        try:
+            cls._commit_enrollment(enrollment, count_for_user=True)
+        except NotFound:
+            # No profile document to count it on: update() failed the whole batch, and
+            # set() would leave a stub without an email that get_user_profile returns as
+            # is and /auth/register later overwrites
+            cls._commit_enrollment(enrollment, count_for_user=False)
+        analytics_cache.delete(f'course:{course_id}')
+        return enrollment
+
+    @staticmethod
+    def _commit_enrollment(enrollment, count_for_user):
+        from models.course import students_counter
+        db = get_db()
+        batch = db.batch()
+        # create() only succeeds if the document is absent, so concurrent enrolls
+        # for the same user and course cannot both go through
+        batch.create(db.collection('enrollments').document(enrollment.enrollment_id), enrollment.to_dict())
+        students_counter.increment(enrollment.course_id, batch=batch)
+        if count_for_user:
+            # One user enrolls at human speed, so their own count needs no sharding
+            batch.update(db.collection('users').document(enrollment.user_id), {
+                'enrollment_count': firestore.Increment(1),
+                'updated_at': datetime.utcnow()
+            })
+        commit_batch(batch)
+
     @classmethod
     def get_user_course_enrollment(cls, user_id, course_id):
         """Check if user is already enrolled in course"""
         try:
-            db = firestore.client()
-            enrollments = db.collection('enrollments')\
-                           .where('user_id', '==', user_id)\
-                           .where('course_id', '==', course_id)\
-                           .limit(1)\
-                           .stream()
+            enrollment = cls.get_by_id(cls.make_id(user_id, course_id))
+            if enrollment or not LEGACY_ENROLLMENT_LOOKUP:
+                return enrollment
             
-            for enrollment in enrollments:
-                return cls.from_dict(enrollment.to_dict())
-            
-            return None
+            return cls.query()\
+                      .where('user_id', '==', user_id)\
+                      .where('course_id', '==', course_id)\
+                      .first()
         except Exception as e:
             print(f'Error checking enrollment: {e}')
             return None
@@ -124,91 +305,128 @@ class Enrollment:
     def get_user_enrollments(cls, user_id):
         """Get all enrollments for a user"""
         try:
-            db = firestore.client()
-            enrollments = []
-            
-            docs = db.collection('enrollments')\
-                    .where('user_id', '==', user_id)\
-                    .order_by('enrolled_at', direction=firestore.Query.DESCENDING)\
-                    .stream()
-            
-            for doc in docs:
-                enrollments.append(cls.from_dict(doc.to_dict()))
-            
-            return enrollments
+            return cls.query()\
+                      .where('user_id', '==', user_id)\
+                      .order_by('enrolled_at', DESCENDING)\
+                      .all()
         except Exception as e:
             print(f'Error getting user enrollments: {e}')
             return []
 
+    @classmethod
+    def get_user_enrollments_page(cls, user_id, limit=None, cursor=None):
+        """Get one page of a user's enrollments, newest first, as (enrollments, next_cursor)"""
+        return cls.query()\
+                  .where('user_id', '==', user_id)\
+                  .order_by('enrolled_at', DESCENDING)\
+                  .page(limit, cursor)
+
     @classmethod
     def get_course_enrollments(cls, course_id):
         """Get all enrollments for a course"""
         try:
-            db = firestore.client()
-            enrollments = []
-            
-            docs = db.collection('enrollments')\
-                    .where('course_id', '==', course_id)\
-                    .stream()
-            
-            for doc in docs:
-                enrollments.append(cls.from_dict(doc.to_dict()))
-            
-            return enrollments
+            return cls.query().where('course_id', '==', course_id).all()
         except Exception as e:
             print(f'Error getting course enrollments: {e}')
             return []
 
+    @classmethod
+    def course_stats_queries(cls, course_id):
+        """(query, aggregations) pairs behind get_course_stats; generate_indexes.py indexes them too"""
+        enrollments = cls.query().where('course_id', '==', course_id)
+        return [
+            (enrollments, [('count', None, 'enrollments'),
+                           ('sum', 'progress.total_time_spent', 'total_time_spent')]),
+            (enrollments.where('status', '==', 'completed'), [('count', None, 'completed')]),
+            (enrollments.where('rating', '>=', 1), [('count', None, 'reviews'),
+                                                    ('avg', 'rating', 'average_rating')])
+        ]
+
+    @classmethod
+    def get_course_stats(cls, course_id):
+        """Enrollment, completion and review figures for a course, cached per instance.
+        
+        Three aggregation queries, so the cost does not grow with the number of
+        enrollments the way streaming get_course_enrollments does.
+        """
+        key = f'course:{course_id}'
+        stats = analytics_cache.get(key)
+        if stats is not None:
+            return stats
+        
+        results = {}
+        for query, aggregations in cls.course_stats_queries(course_id):
+            results.update(query.aggregate(aggregations))
+        
+        count = results['enrollments']
+        average_rating = results['average_rating']
+        stats = {
+            'course_id': course_id,
+            'enrollments': count,
+            'completed': results['completed'],
+            'completion_rate': round(results['completed'] / count, 4) if count else 0.0,
+            'reviews': results['reviews'],
+            'average_rating': round(average_rating, 2) if average_rating is not None else None,
+            'total_time_spent': results['total_time_spent'] or 0,  # in minutes
+            'computed_at': datetime.utcnow()
+        }
+        analytics_cache.set(key, stats)
+        return stats
+
     def update_progress(self, lesson_id, time_spent=0):
-        """Update learning progress"""
+        """Record a lesson progress event through the progress buffer"""
         try:
-            # Add lesson to completed if not already there
-            if lesson_id not in self.progress['completed_lessons']:
-                self.progress['completed_lessons'].append(lesson_id)
-            
-            # Update time spent
-            self.progress['total_time_spent'] += time_spent
-            self.progress['last_accessed'] = datetime.utcnow()
-            
-            # Update current lesson (next lesson)
-            self.progress['current_lesson'] = len(self.progress['completed_lessons'])
-            
-            # Save to Firestore
-            db = firestore.client()
-            db.collection('enrollments').document(self.enrollment_id).update({
-                'progress': self.progress
-            })
-            
+            entry = Enrollment.record_progress(self.enrollment_id, lesson_id, time_spent)
+            if entry.progress is not None:
+                self.progress.update(entry.progress)
+            else:
+                entry.apply_to(self.progress)
             return True
         except Exception as e:
             print(f'Error updating progress: {e}')
             return False
 
-    def complete_course(self):
-        """Mark course as completed"""
+    def complete_course(self, attempts=3):
+        """Mark course as completed, counting it in the user's stats unless it already was"""
         try:
-            self.status = 'completed'
-            self.completed_at = datetime.utcnow()
-            self.progress['completion_percentage'] = 100.0
-            
-            # Update user stats
-            from models.user import User
-            user = User.get_by_id(self.user_id)
-            if user:
-                user.update_learning_stats(
-                    course_completed=True, 
-                    learning_time=self.progress['total_time_spent']
-                )
-            
-            # Save to Firestore
-            db = firestore.client()
-            db.collection('enrollments').document(self.enrollment_id).update({
-                'status': self.status,
-                'completed_at': self.completed_at,
-                'progress': self.progress
-            })
+            # Write buffered progress first: it may complete the course by itself
+            pending = progress_buffer.pending(self.enrollment_id)
+            if pending:
+                pending.apply_to(self.progress)
+                progress_buffer.flush([self.enrollment_id])
             
-            return True
+            db = get_db()
+            doc_ref = db.collection('enrollments').document(self.enrollment_id)
+            for attempt in range(attempts):
+                snapshot = get_document(doc_ref, field_paths=COMPLETION_FIELDS + ['completed_at'])
+                if not snapshot.exists:
+                    return False
+                data = snapshot.to_dict() or {}
+                completion = completion_writes(data, datetime.utcnow())
+                if completion is None:
+                    # Completed by the progress buffer or an earlier request; stats already counted
+                    self.status = 'completed'
+                    self.completed_at = data.get('completed_at')
+                    self.progress['completion_percentage'] = 100.0
+                    return True
+                
+                update, user_write = completion
+                batch = db.batch()
+                # Fails if the enrollment changed since it was read, e.g. completed concurrently
+                batch.update(doc_ref, update, option=db.write_option(last_update_time=snapshot.update_time))
+                queue_user_stats(db, batch, user_write)
+                try:
+                    commit_batch(batch)
+                except FailedPrecondition as e:
+                    print(f'Enrollment changed while completing (attempt {attempt + 1}): {e}')
+                    continue
+                
+                self.status = 'completed'
+                self.completed_at = update['completed_at']
+                self.progress['completion_percentage'] = 100.0
+                analytics_cache.delete(f'course:{self.course_id}')
+                return True
+            return False
         except Exception as e:
             print(f'Error completing course: {e}')
             return False
@@ -221,12 +439,13 @@ class Enrollment:
             self.reviewed_at = datetime.utcnow()
             
             # Save to Firestore
-            db = firestore.client()
-            db.collection('enrollments').document(self.enrollment_id).update({
+            db = get_db()
+            update_document(db.collection('enrollments').document(self.enrollment_id), {
                 'rating': self.rating,
                 'review': self.review,
                 'reviewed_at': self.reviewed_at
             })
+            analytics_cache.delete(f'course:{self.course_id}')
             
             return True
         except Exception as e:
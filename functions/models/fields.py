@@ -0,0 +1,71 @@
+"""Attribute and change-tracking helpers for the __slots__ models."""
+import copy
+
+from firebase_admin import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+
+
+def data_field(name, default=None):
+    """Attribute read from (and written to) the model's document dict on access.
+
+    Models that wrap a Firestore document keep only the dict; fields are not
+    copied onto the instance when it is built.
+    """
+    def fget(self):
+        return self.data.get(name, default)
+
+    def fset(self, value):
+        self.data[name] = value
+
+    return property(fget, fset, doc=f'`{name}` field of the document')
+
+
+def flatten(data, skip=(), prefix=()):
+    """{field path tuple: value} for every leaf of a document; nested maps are walked"""
+    leaves = {}
+    for key, value in data.items():
+        if not prefix and key in skip:
+            continue
+        path = prefix + (key,)
+        if isinstance(value, dict) and value:
+            leaves.update(flatten(value, prefix=path))
+        else:
+            # Copied so later in-place edits to lists and maps show up as changes
+            leaves[path] = copy.deepcopy(value) if isinstance(value, (list, dict)) else value
+    return leaves
+
+
+class ChangeTracking:
+    """Mixin that remembers a model's stored fields so saves write only what changed.
+
+    Subclasses call mark_saved() once the document is loaded or written;
+    changes() then returns the update() data for everything edited since,
+    with nested maps addressed by field path ('stats.courses_completed').
+    """
+    __slots__ = ('_saved',)
+
+    # Top-level fields written elsewhere (e.g. sharded counters) that save() must not touch
+    UNTRACKED_FIELDS = ()
+
+    def mark_saved(self, data=None):
+        """Record `data` (default: to_dict()) as what Firestore currently holds"""
+        self._saved = flatten(self.to_dict() if data is None else data, self.UNTRACKED_FIELDS)
+
+    def changes(self):
+        """update() data for the fields changed since mark_saved(), or None if never saved"""
+        saved = getattr(self, '_saved', None)
+        if saved is None:
+            return None
+        current = flatten(self.to_dict(), self.UNTRACKED_FIELDS)
+        changed = {path: value for path, value in current.items()
+                   if path not in saved or saved[path] != value}
+        # Keys dropped from a map the model writes are deleted; stored fields the
+        # model does not know about are left alone, as is any path that is now
+        # a parent or a child of a written one
+        fields = {path[0] for path in current}
+        written = set(current) | {path[:i] for path in current for i in range(1, len(path))}
+        for path in saved:
+            if path[0] in fields and path not in written \
+                    and not any(path[:i] in current for i in range(1, len(path))):
+                changed[path] = firestore.DELETE_FIELD
+        return {FieldPath(*path).to_api_repr(): value for path, value in changed.items()}
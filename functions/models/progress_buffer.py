@@ -0,0 +1,501 @@
+"""Write-behind buffer for lesson progress events.
+
+A video player reports progress every few seconds, and writing each report
+to the enrollment document turns one viewer into a stream of writes on a
+single document. Events are merged per enrollment in memory instead:
+completed lessons are unioned, time spent is summed and the latest access
+time wins. Each enrollment gets one field-level update per flush.
+
+By default (PROGRESS_FLUSH_INTERVAL=0) nothing is buffered: each event is
+written before the request returns, and a failed write fails the request.
+Setting an interval opts in to buffering: the buffer is flushed when the
+oldest pending event is that many seconds old, when
+PROGRESS_BUFFER_MAX_ENTRIES enrollments are pending, and at shutdown.
+Pending entries are taken out under the lock before being written, so
+concurrent or repeated flushes never write the same event twice; entries
+whose write fails are merged back for the next flush.
+"""
+import atexit
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+from firebase_admin import firestore
+from google.api_core.exceptions import NotFound
+
+from models.db import commit_batch, get_db, get_document, get_documents, update_document
+from utils.cache import analytics_cache
+
+# Buffering trades durability for fewer writes: an event is acknowledged while it is
+# still only in memory, and Cloud Functions throttles CPU once a response is sent and
+# may reclaim an instance without a SIGTERM, losing whatever is pending. Only enable it
+# (e.g. 5) on instances with always-on CPU, or where losing a few seconds of progress is fine.
+FLUSH_INTERVAL = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', 0))
+MAX_ENTRIES = int(os.environ.get('PROGRESS_BUFFER_MAX_ENTRIES', 500))
+
+# Firestore allows at most 500 writes in one batch
+MAX_BATCH_WRITES = 500
+
+# What completion needs from an enrollment; read only when an entry completes lessons
+COMPLETION_FIELDS = ['user_id', 'course_id', 'status', 'progress.completed_lessons',
+                     'progress.completion_percentage', 'progress.total_time_spent']
+
+
+class ProgressWriteError(Exception):
+    """Raised when a synchronous progress write could not be stored"""
+
+
+class PendingProgress:
+    """Progress events for one enrollment not yet written"""
+
+    def __init__(self):
+        self.completed_lessons = []
+        self._completed = set()  # membership checks without scanning the list
+        self.time_spent = 0
+        self.last_accessed = None
+        self.events = 0
+        self.progress = None  # the enrollment's progress once written, when the write read it
+
+    def add(self, lesson_id, time_spent, accessed_at):
+        if lesson_id and lesson_id not in self._completed:
+            self._completed.add(lesson_id)
+            self.completed_lessons.append(lesson_id)
+        self.time_spent += time_spent or 0
+        if self.last_accessed is None or accessed_at > self.last_accessed:
+            self.last_accessed = accessed_at
+        self.events += 1
+
+    def merge(self, other):
+        """Fold another entry's events into this one"""
+        for lesson_id in other.completed_lessons:
+            if lesson_id not in self._completed:
+                self._completed.add(lesson_id)
+                self.completed_lessons.append(lesson_id)
+        self.time_spent += other.time_spent
+        if other.last_accessed and (self.last_accessed is None or other.last_accessed > self.last_accessed):
+            self.last_accessed = other.last_accessed
+        self.events += other.events
+
+    def apply_to(self, progress):
+        """Overlay the pending events on a progress map read from Firestore"""
+        completed = list(progress.get('completed_lessons') or [])
+        seen = set(completed)
+        for lesson_id in self.completed_lessons:
+            if lesson_id not in seen:
+                completed.append(lesson_id)
+        progress['completed_lessons'] = completed
+        progress['current_lesson'] = len(completed)
+        progress['total_time_spent'] = (progress.get('total_time_spent') or 0) + self.time_spent
+        if self.last_accessed:
+            progress['last_accessed'] = self.last_accessed
+        return progress
+
+    def to_update(self):
+        """Field-level update that applies these events without reading the document"""
+        update = {}
+        if self.completed_lessons:
+            update['progress.completed_lessons'] = firestore.ArrayUnion(self.completed_lessons)
+        if self.time_spent:
+            update['progress.total_time_spent'] = firestore.Increment(self.time_spent)
+        if self.events:
+            # Stamped by Firestore at write time, so clocks on different instances don't matter
+            update['progress.last_accessed'] = firestore.SERVER_TIMESTAMP
+        return update
+
+    def to_dict(self):
+        return {
+            'completed_lessons': list(self.completed_lessons),
+            'time_spent': self.time_spent,
+            'last_accessed': self.last_accessed,
+            'events': self.events
+        }
+
+
+def write_progress(entries):
+    """Write {enrollment_id: PendingProgress} in chunked batches.
+    
+    Only time-only entries are blind updates. Entries that complete lessons
+    also recompute completion_percentage and current_lesson, which needs the
+    enrollment's current lessons: those are read in one batch and written
+    back with a last-update-time precondition, and the resulting progress is
+    left on entry.progress.
+    
+    Returns ({enrollment_id: entry} that failed, [enrollment_ids that no longer exist]).
+    """
+    db = get_db()
+    blind = []
+    with_lessons = []
+    for enrollment_id, entry in entries.items():
+        if entry.completed_lessons:
+            with_lessons.append((enrollment_id, entry))
+        elif entry.to_update():
+            blind.append((enrollment_id, entry))
+    
+    failed = {}
+    missing = []
+    for start in range(0, len(blind), MAX_BATCH_WRITES):
+        _write_blind(db, blind[start:start + MAX_BATCH_WRITES], failed, missing)
+    # Completing a course adds a write to the user, so leave room for two per entry
+    for start in range(0, len(with_lessons), MAX_BATCH_WRITES // 2):
+        _write_with_completion(db, with_lessons[start:start + MAX_BATCH_WRITES // 2], failed, missing)
+    return failed, missing
+
+
+def _write_blind(db, items, failed, missing):
+    collection_ref = db.collection('enrollments')
+    batch = db.batch()
+    for enrollment_id, entry in items:
+        batch.update(collection_ref.document(enrollment_id), entry.to_update())
+    try:
+        commit_batch(batch)
+    except Exception as e:
+        # One missing enrollment fails the whole batch; retry one by one
+        print(f'Progress batch failed, retrying individually: {e}')
+        for enrollment_id, entry in items:
+            try:
+                update_document(collection_ref.document(enrollment_id), entry.to_update())
+            except NotFound:
+                print(f'Dropping progress for missing enrollment {enrollment_id}')
+                missing.append(enrollment_id)
+            except Exception as e:
+                print(f'Error writing progress for {enrollment_id}: {e}')
+                failed[enrollment_id] = entry
+
+
+def completion_writes(data, completed_at, time_spent=0):
+    """(enrollment update, (user_id, user stats update)) that complete an enrollment, or None if it already is.
+    
+    The one place completion is decided, whether the last lesson arrives
+    through this buffer or the user calls PUT /enrollments/<id>/complete, so
+    the user's stats are only counted once.
+    """
+    if data.get('status') == 'completed':
+        return None
+    progress = data.get('progress') or {}
+    learning_time = (progress.get('total_time_spent') or 0) + time_spent
+    update = {
+        'status': 'completed',
+        'completed_at': completed_at,
+        'progress.completion_percentage': 100.0
+    }
+    return update, (data.get('user_id'), {
+        'stats.courses_completed': firestore.Increment(1),
+        'stats.total_learning_time': firestore.Increment(learning_time)
+    })
+
+
+def queue_user_stats(db, batch, user_write):
+    """Queue a user stats update, unless the user has no profile document to update"""
+    user_id, stats = user_write
+    if not user_id:
+        return
+    user_ref = db.collection('users').document(user_id)
+    # update() would fail the whole batch for a missing profile, and set() would create a stub
+    if get_document(user_ref, field_paths=['uid']).exists:
+        batch.update(user_ref, stats)
+
+
+def _completion_writes(snapshot, entry, index):
+    """(enrollment update, (user_id, user stats update) or None, progress after the update) for one entry"""
+    update = entry.to_update()
+    data = snapshot.to_dict() or {}
+    stored = data.get('progress') or {}
+    progress = entry.apply_to({
+        'completed_lessons': stored.get('completed_lessons') or [],
+        'completion_percentage': stored.get('completion_percentage') or 0.0,
+        'total_time_spent': stored.get('total_time_spent') or 0
+    })
+    update['progress.current_lesson'] = progress['current_lesson']
+    if index is None or not index.count:
+        return update, None, progress
+    mask = index.mask(stored.get('completed_lessons') or [])
+    new_mask = mask | index.mask(entry.completed_lessons)
+    if new_mask == mask:
+        return update, None, progress
+    
+    progress['completion_percentage'] = update['progress.completion_percentage'] = index.percentage(new_mask)
+    if not index.is_complete(new_mask):
+        return update, None, progress
+    # Last lesson done
+    completion = completion_writes(data, firestore.SERVER_TIMESTAMP, entry.time_spent)
+    if completion is None:
+        return update, None, progress
+    update.update(completion[0])
+    return update, completion[1], progress
+
+
+def _read_for_completion(db, items):
+    """Enrollment snapshots and the lesson indexes of their courses, in two batched reads"""
+    from models.course import Course
+    collection_ref = db.collection('enrollments')
+    snapshots = get_documents([collection_ref.document(enrollment_id) for enrollment_id, _ in items],
+                              field_paths=COMPLETION_FIELDS)
+    snapshots = {snapshot.id: snapshot for snapshot in snapshots}
+    course_ids = {(snapshot.to_dict() or {}).get('course_id') for snapshot in snapshots.values() if snapshot.exists}
+    return snapshots, Course.lesson_indexes(course_ids)
+
+
+def _queue_completion(db, batch, snapshot, entry, indexes):
+    """Queue one entry's writes; returns (progress after them, course ID if they complete the enrollment)"""
+    course_id = (snapshot.to_dict() or {}).get('course_id')
+    update, user_write, progress = _completion_writes(snapshot, entry, indexes.get(course_id))
+    # Fails if the enrollment changed since it was read, instead of losing that change
+    batch.update(snapshot.reference, update,
+                 option=db.write_option(last_update_time=snapshot.update_time))
+    if user_write:
+        queue_user_stats(db, batch, user_write)
+        return progress, course_id
+    return progress, None
+
+
+def _write_with_completion(db, items, failed, missing, attempts=3):
+    pending = list(items)
+    for attempt in range(attempts):
+        gone = []
+        queued = []
+        completed_courses = set()
+        try:
+            # Reads are retried like the commit: a transient error must not lose the events
+            snapshots, indexes = _read_for_completion(db, pending)
+            batch = db.batch()
+            for enrollment_id, entry in pending:
+                snapshot = snapshots.get(enrollment_id)
+                if snapshot is None or not snapshot.exists:
+                    gone.append(enrollment_id)
+                    continue
+                progress, completed_course = _queue_completion(db, batch, snapshot, entry, indexes)
+                if completed_course:
+                    completed_courses.add(completed_course)
+                queued.append((enrollment_id, entry, progress))
+        except Exception as e:
+            print(f'Progress read failed (attempt {attempt + 1}): {e}')
+            continue
+        
+        for enrollment_id in gone:
+            print(f'Dropping progress for missing enrollment {enrollment_id}')
+        missing.extend(gone)
+        if not queued:
+            return
+        try:
+            commit_batch(batch)
+            for _, entry, progress in queued:
+                entry.progress = progress
+            for course_id in completed_courses:
+                analytics_cache.delete(f'course:{course_id}')
+            return
+        except Exception as e:
+            # Usually a concurrent write tripped a precondition; re-read and retry
+            print(f'Progress batch failed (attempt {attempt + 1}): {e}')
+            pending = [(enrollment_id, entry) for enrollment_id, entry, _ in queued]
+            if len(pending) > 1:
+                # Retry one by one so a single conflict doesn't hold back the rest
+                for item in pending:
+                    _write_with_completion(db, [item], failed, missing, attempts - attempt - 1)
+                return
+    for enrollment_id, entry in pending:
+        failed[enrollment_id] = entry
+
+
+class ProgressBuffer:
+    """Per-instance coalescing buffer of progress events, keyed by enrollment ID"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_entries=MAX_ENTRIES):
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._pending = {}
+        self._oldest = None  # time.monotonic() of the oldest pending event
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        # Metrics
+        self.events = 0
+        self.writes = 0
+        self.flushes = 0
+        self.failed_writes = 0
+        self.dropped = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def add(self, enrollment_id, lesson_id=None, time_spent=0, accessed_at=None):
+        """Queue one progress event, returning the enrollment's pending entry.
+        
+        With buffering off the event is written before this returns: a missing
+        enrollment raises NotFound and a failed write ProgressWriteError, and
+        nothing is kept for a later retry.
+        """
+        if self.flush_interval <= 0:
+            entry = PendingProgress()
+            entry.add(lesson_id, time_spent, accessed_at or datetime.utcnow())
+            self._write_now(enrollment_id, entry)
+            return entry
+        
+        self._ensure_thread()
+        with self._lock:
+            entry = self._pending.get(enrollment_id)
+            if entry is None:
+                entry = self._pending[enrollment_id] = PendingProgress()
+            entry.add(lesson_id, time_spent, accessed_at or datetime.utcnow())
+            self.events += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                # Let the flush thread start counting down from this event
+                self._wakeup.set()
+            full = len(self._pending) >= self.max_entries
+        if full:
+            self.flush()
+        return entry
+
+    def _write_now(self, enrollment_id, entry):
+        start = time.perf_counter()
+        try:
+            failed, missing = write_progress({enrollment_id: entry})
+        except Exception:
+            failed, missing = {enrollment_id: entry}, []
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.events += entry.events
+                self.flushes += 1
+                self.writes += 1 if not failed and not missing else 0
+                self.failed_writes += len(failed)
+                self.dropped += len(missing)
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self.total_flush_ms += elapsed_ms
+        if missing:
+            raise NotFound(f'Enrollment {enrollment_id} not found')
+        if failed:
+            raise ProgressWriteError(f'Could not write progress for enrollment {enrollment_id}')
+
+    def pending(self, enrollment_id):
+        """The enrollment's unwritten events, or None"""
+        with self._lock:
+            return self._pending.get(enrollment_id)
+
+    def flush(self, enrollment_ids=None):
+        """Write pending events (all, or just these enrollments); returns the number written"""
+        with self._lock:
+            if enrollment_ids is None:
+                taken, self._pending = self._pending, {}
+            else:
+                taken = {enrollment_id: self._pending.pop(enrollment_id)
+                         for enrollment_id in enrollment_ids if enrollment_id in self._pending}
+            if not self._pending:
+                self._oldest = None
+        if not taken:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            failed, missing = write_progress(taken)
+        except Exception as e:
+            # Reads and commits are retried per chunk, so this is unexpected; rewriting an
+            # event on the next flush is better than losing it
+            print(f'Error writing progress: {e}')
+            failed, missing = taken, []
+        dropped = len(missing)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if failed:
+            # Put failed entries back, merged with anything that arrived meanwhile
+            with self._lock:
+                for enrollment_id, entry in failed.items():
+                    newer = self._pending.get(enrollment_id)
+                    if newer is not None:
+                        entry.merge(newer)
+                    self._pending[enrollment_id] = entry
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+
+        written = len(taken) - len(failed) - dropped
+        with self._lock:
+            self.flushes += 1
+            self.writes += written
+            self.failed_writes += len(failed)
+            self.dropped += dropped
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+        return written
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='progress-flush', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        """Background debounce loop: flush once the oldest event has waited flush_interval"""
+        while True:
+            with self._lock:
+                oldest = self._oldest
+            if oldest is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(0.0, oldest + self.flush_interval - time.monotonic())
+            if timeout == 0.0:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f'Error flushing progress buffer: {e}')
+                continue
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+
+    def stats(self):
+        """Coalescing and flush latency metrics for monitoring"""
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'events': self.events,
+                'writes': self.writes,
+                'coalescing_ratio': self.events / self.writes if self.writes else 0.0,
+                'flushes': self.flushes,
+                'failed_writes': self.failed_writes,
+                'dropped': self.dropped,
+                'last_flush_ms': round(self.last_flush_ms, 2),
+                'max_flush_ms': round(self.max_flush_ms, 2),
+                'avg_flush_ms': round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0
+            }
+
+
+progress_buffer = ProgressBuffer()
+
+
+def _flush_at_exit():
+    try:
+        written = progress_buffer.flush()
+        if written:
+            print(f'Flushed {written} pending progress updates at shutdown')
+    except Exception as e:
+        print(f'Error flushing progress buffer at shutdown: {e}')
+
+
+atexit.register(_flush_at_exit)
+
+
+def _install_sigterm_handler():
+    """Flush before the platform's SIGTERM stops the instance"""
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        _flush_at_exit()
+        if callable(previous):
+            previous(signum, frame)
+        elif previous == signal.SIG_DFL:
+            raise SystemExit(0)
+
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        # Only the main thread may install handlers; atexit still covers a clean exit
+        pass
+
+
+_install_sigterm_handler()
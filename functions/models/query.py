@@ -0,0 +1,273 @@
+"""Chainable Firestore queries that hand back model instances.
+
+    Course.query().where('price', '<=', 20).order_by('rating', 'DESCENDING').limit(10).all()
+
+A query only records what was asked for; the Firestore query is built when it
+runs, so the same object can also describe the composite index it needs
+(see generate_indexes.py).
+
+aggregate() runs count/sum/avg on the server, so only the results are read,
+however many documents match.
+"""
+import os
+
+from google.api_core.exceptions import GoogleAPICallError
+
+from models.db import get_db, run_aggregation, stream_query
+from utils.pagination import fetch_page
+
+ASCENDING = 'ASCENDING'
+DESCENDING = 'DESCENDING'
+
+EQUALITY_OPERATORS = {'==', 'in'}
+RANGE_OPERATORS = {'<', '<=', '>', '>=', '!=', 'not-in'}
+ARRAY_OPERATORS = {'array_contains', 'array_contains_any'}
+OPERATORS = EQUALITY_OPERATORS | RANGE_OPERATORS | ARRAY_OPERATORS
+
+# Firestore caps the values of one in / not-in / array_contains_any filter
+MAX_DISJUNCTION = 30
+
+AGGREGATIONS = {'count', 'sum', 'avg'}
+# Firestore caps the aggregations in one query
+MAX_AGGREGATIONS = 5
+
+
+class InvalidQuery(ValueError):
+    """Raised for a filter, ordering or limit Firestore would reject"""
+
+
+class _Projection:
+    """A snapshot showing only the requested fields, not the ones read for a page cursor"""
+
+    __slots__ = ('_doc', '_keys')
+
+    def __init__(self, doc, fields):
+        self._doc = doc
+        self._keys = {field.split('.', 1)[0] for field in fields}
+
+    def __getattr__(self, name):
+        return getattr(self._doc, name)
+
+    def to_dict(self):
+        data = self._doc.to_dict()
+        if data is None:
+            return None
+        return {key: value for key, value in data.items() if key in self._keys}
+
+
+class Query:
+    """Filters, orderings, limit and projection on one collection"""
+
+    def __init__(self, collection, from_doc):
+        self.collection = collection
+        self.from_doc = from_doc  # snapshot -> model instance
+        self.filters = []
+        self.orders = []
+        self.max_results = None
+        self.fields = None
+
+    def _copy(self):
+        query = Query(self.collection, self.from_doc)
+        query.filters = list(self.filters)
+        query.orders = list(self.orders)
+        query.max_results = self.max_results
+        query.fields = self.fields
+        return query
+
+    def where(self, field, op, value):
+        if op not in OPERATORS:
+            raise InvalidQuery(f'Unsupported operator: {op}')
+        if op in ('in', 'not-in', 'array_contains_any'):
+            value = list(value)
+            if not value or len(value) > MAX_DISJUNCTION:
+                raise InvalidQuery(f'{field} {op} takes 1 to {MAX_DISJUNCTION} values')
+        query = self._copy()
+        query.filters.append((field, op, value))
+        return query
+
+    def filter_by(self, filters):
+        """AND equality filters from a {field: value} dict"""
+        query = self
+        for key, value in (filters or {}).items():
+            query = query.where(key, '==', value)
+        return query
+
+    def order_by(self, field, direction=ASCENDING):
+        if direction not in (ASCENDING, DESCENDING):
+            raise InvalidQuery(f'Invalid sort direction: {direction}')
+        query = self._copy()
+        query.orders.append((field, direction))
+        return query
+
+    def limit(self, count):
+        if count < 1:
+            raise InvalidQuery('limit must be positive')
+        query = self._copy()
+        query.max_results = count
+        return query
+
+    def select(self, fields):
+        query = self._copy()
+        query.fields = None if fields is None else list(fields)
+        return query
+
+    def effective_orders(self):
+        """Explicit orderings, then any range-filtered field not already ordered.
+
+        Firestore orders by inequality fields implicitly; spelling that out
+        keeps page cursors and the generated indexes in step with it.
+        """
+        orders = list(self.orders)
+        ordered = {field for field, _ in orders}
+        for field in sorted({field for field, op, _ in self.filters if op in RANGE_OPERATORS}):
+            if field not in ordered:
+                orders.append((field, ASCENDING))
+                ordered.add(field)
+        return orders
+
+    def _filtered(self):
+        query = get_db().collection(self.collection)
+        for field, op, value in self.filters:
+            query = query.where(field, op, value)
+        if self.fields is not None:
+            query = query.select(self.fields)
+        return query
+
+    def stream(self):
+        """Yield model instances as Firestore returns them"""
+        query = self._filtered()
+        for field, direction in self.effective_orders():
+            query = query.order_by(field, direction=direction)
+        if self.max_results is not None:
+            query = query.limit(self.max_results)
+        for doc in stream_query(query):
+            yield self.from_doc(doc)
+
+    def all(self):
+        return list(self.stream())
+
+    def first(self):
+        for instance in self.limit(1).stream():
+            return instance
+        return None
+
+    def page(self, limit=None, cursor=None):
+        """One page of instances as (instances, next_cursor); see utils/pagination.py"""
+        orders = self.effective_orders()
+        query = self
+        hidden = []
+        if self.fields is not None:
+            # The cursor is built from the ordered fields, so the projection must read them
+            hidden = [field for field, _ in orders if field != '__name__' and field not in self.fields]
+            if hidden:
+                query = self.select(self.fields + hidden)
+        docs, next_cursor = fetch_page(query._filtered(), limit, cursor, order_by=orders)
+        if hidden:
+            docs = [_Projection(doc, self.fields) for doc in docs]
+        return [self.from_doc(doc) for doc in docs], next_cursor
+
+    def aggregate(self, aggregations):
+        """{alias: value} for [(kind, field, alias)], kind being 'count', 'sum' or 'avg'.
+
+        Runs as one Firestore aggregation query. Like Firestore, sum and avg
+        skip missing and non-numeric values, and avg is None when there are
+        none. An emulator that rejects the query gets the same results from
+        streaming the matching documents instead.
+        """
+        if not aggregations or len(aggregations) > MAX_AGGREGATIONS:
+            raise InvalidQuery(f'A query takes 1 to {MAX_AGGREGATIONS} aggregations')
+        for kind, field, _ in aggregations:
+            if kind not in AGGREGATIONS:
+                raise InvalidQuery(f'Unsupported aggregation: {kind}')
+            if kind != 'count' and not field:
+                raise InvalidQuery(f'{kind} needs a field')
+
+        query = self._filtered()
+        if self.max_results is not None:
+            query = query.limit(self.max_results)
+        aggregation_query = None
+        for kind, field, alias in aggregations:
+            target = query if aggregation_query is None else aggregation_query
+            if kind == 'count':
+                aggregation_query = target.count(alias=alias)
+            else:
+                aggregation_query = getattr(target, kind)(field, alias=alias)
+        try:
+            return run_aggregation(aggregation_query)
+        except GoogleAPICallError as e:
+            if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+                raise
+            print(f'Aggregation not supported by the emulator, streaming instead: {e}')
+            return self._aggregate_locally(aggregations)
+
+    def _aggregate_locally(self, aggregations):
+        fields = sorted({field for kind, field, _ in aggregations if kind != 'count'})
+        query = self.select(fields)._filtered()
+        if self.max_results is not None:
+            query = query.limit(self.max_results)
+        count = 0
+        values = {field: [] for field in fields}
+        for doc in stream_query(query):
+            count += 1
+            for field in fields:
+                try:
+                    value = doc.get(field)
+                except KeyError:
+                    continue
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[field].append(value)
+
+        results = {}
+        for kind, field, alias in aggregations:
+            if kind == 'count':
+                results[alias] = count
+            elif kind == 'sum':
+                results[alias] = sum(values[field])
+            else:
+                results[alias] = sum(values[field]) / len(values[field]) if values[field] else None
+        return results
+
+    def indexes(self, aggregations=None):
+        """The composite indexes this query needs as firestore.indexes.json entries.
+
+        Equality-only queries and queries on a single field are served by the
+        automatic single-field indexes. An ordered query whose other filters
+        are all equalities (== or in) is served by Firestore merging one
+        (field, orderings) index per filtered field, so those are listed
+        instead of one index per combination of fields. Fields summed or
+        averaged by `aggregations` (as passed to aggregate()) go after the
+        query's own fields, since Firestore reads them from the same index.
+        """
+        aggregated = [field for kind, field, _ in aggregations or [] if kind != 'count']
+        orders = self.effective_orders()
+        if not orders and not aggregated and not any(op in ARRAY_OPERATORS for _, op, _ in self.filters):
+            return []
+        ordered = {field for field, _ in orders}
+        filtered = []
+        for field, op, _ in sorted(self.filters, key=lambda f: f[0]):
+            if field not in ordered and all(field != other for other, _ in filtered):
+                filtered.append((field, op))
+        order_fields = [{'fieldPath': field, 'order': direction} for field, direction in orders if field != '__name__']
+
+        if not aggregated and order_fields and len(filtered) > 1 and \
+                all(op in EQUALITY_OPERATORS for _, op, _ in self.filters):
+            return [self._index([{'fieldPath': field, 'order': ASCENDING}] + order_fields) for field, _ in filtered]
+
+        fields = []
+        for field, op in filtered:
+            if op in ARRAY_OPERATORS:
+                fields.append({'fieldPath': field, 'arrayConfig': 'CONTAINS'})
+            else:
+                fields.append({'fieldPath': field, 'order': ASCENDING})
+        fields += order_fields
+        seen = ordered | {field for field, _ in filtered}
+        for field in aggregated:
+            if field not in seen:
+                seen.add(field)
+                fields.append({'fieldPath': field, 'order': ASCENDING})
+        if len(fields) < 2:
+            return []
+        return [self._index(fields)]
+
+    def _index(self, fields):
+        return {'collectionGroup': self.collection, 'queryScope': 'COLLECTION', 'fields': fields}
@@ -0,0 +1,301 @@
+"""Course recommendations from co-enrollment.
+
+Two courses are similar when the same students take both: the cosine of
+their columns in the binary user x course enrollment matrix,
+co(a, b) / sqrt(n(a) * n(b)). The top neighbours of every course are
+precomputed and stored in `course_neighbors/{course_id}`, so serving
+/courses/<id>/related or /me/recommendations is a lookup, not a computation.
+
+refresh() is run on a schedule (see main.py):
+
+- A full rebuild streams every enrollment, computes all similarities in one
+  batch (a sparse X^T X with NumPy/SciPy when installed) and rewrites every
+  neighbour document. It runs when there is no state yet or the last one is
+  older than FULL_REBUILD_HOURS.
+- Otherwise only enrollments created since the last run (the rows
+  Enrollment.create_enrollment writes, found by `enrolled_at`) are read.
+  Their co-enrollment counts are added to the stored ones and only the
+  affected courses get new neighbour lists.
+
+Courses left out of an incremental refresh keep scores computed against
+their neighbours' older enrollment counts, and an enrollment committed with
+an `enrolled_at` older than the last watermark is missed; the next full
+rebuild corrects both.
+"""
+import heapq
+import math
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from models.course import Course
+from models.db import commit_batch, get_db, get_document, get_documents, set_document
+from models.query import Query
+from utils.cache import recommendation_cache
+
+NEIGHBORS_COLLECTION = 'course_neighbors'
+TOP_K = int(os.environ.get('RECOMMENDATION_NEIGHBORS', 20))
+FULL_REBUILD_HOURS = int(os.environ.get('RECOMMENDATION_FULL_REBUILD_HOURS', 24))
+# Co-enrollment counts kept per course for incremental refreshes; keeps documents far below 1 MB
+MAX_CO_COUNTS = 2000
+# Firestore allows at most 500 writes in one batch
+MAX_BATCH_WRITES = 500
+
+ENROLLMENT_FIELDS = ['user_id', 'course_id', 'enrolled_at']
+
+
+def _enrollments():
+    """Enrollment rows as plain dicts: model defaults would invent an enrolled_at for rows without one"""
+    return Query('enrollments', lambda doc: doc.to_dict() or {}).select(ENROLLMENT_FIELDS)
+
+
+def _state_ref(db):
+    return db.collection('job_state').document('recommendations')
+
+
+def _sparse_modules():
+    """(numpy, scipy.sparse), or (None, None) when not installed.
+
+    Imported on first use rather than with this module: the api function
+    imports it for serving and only the scheduled rebuild needs them.
+    """
+    try:
+        import numpy
+        from scipy import sparse
+    except ImportError:
+        return None, None
+    return numpy, sparse
+
+
+def co_enrollment_counts(rows):
+    """({course: enrolled users}, {course: Counter(other course: shared users)}) from (user, course) rows"""
+    courses_of = defaultdict(set)
+    for user_id, course_id in rows:
+        if user_id and course_id:
+            courses_of[user_id].add(course_id)
+
+    numpy, sparse = _sparse_modules()
+    if numpy is not None:
+        return _co_counts_sparse(courses_of, numpy, sparse)
+
+    counts = Counter()
+    co_counts = defaultdict(Counter)
+    for courses in courses_of.values():
+        counts.update(courses)
+        for course_id in courses:
+            others = co_counts[course_id]
+            for other_id in courses:
+                if other_id != course_id:
+                    others[other_id] += 1
+    return counts, co_counts
+
+
+def _co_counts_sparse(courses_of, numpy, sparse):
+    """Same as the loop in co_enrollment_counts, as one sparse matrix product"""
+    course_ids = sorted({course_id for courses in courses_of.values() for course_id in courses})
+    column = {course_id: index for index, course_id in enumerate(course_ids)}
+    rows = []
+    columns = []
+    for row, courses in enumerate(courses_of.values()):
+        for course_id in courses:
+            rows.append(row)
+            columns.append(column[course_id])
+    matrix = sparse.csr_matrix((numpy.ones(len(rows), dtype=numpy.int32), (rows, columns)),
+                               shape=(len(courses_of), len(course_ids)))
+    product = (matrix.T @ matrix).tocsr()
+
+    counts = Counter()
+    co_counts = defaultdict(Counter)
+    for index, course_id in enumerate(course_ids):
+        start, end = product.indptr[index], product.indptr[index + 1]
+        others = co_counts[course_id]
+        for other, shared in zip(product.indices[start:end].tolist(), product.data[start:end].tolist()):
+            if other == index:
+                counts[course_id] = shared
+            else:
+                others[course_ids[other]] = shared
+    return counts, co_counts
+
+
+def top_neighbors(course_id, counts, co_counts, k=TOP_K):
+    """[{'course_id', 'score'}] for the k courses most similar to course_id"""
+    count = counts.get(course_id)
+    if not count:
+        return []
+    scored = ((other_id, shared / math.sqrt(count * counts[other_id]))
+              for other_id, shared in co_counts.get(course_id, {}).items() if counts.get(other_id))
+    return [{'course_id': other_id, 'score': round(score, 4)}
+            for other_id, score in heapq.nlargest(k, scored, key=lambda item: (item[1], item[0]))]
+
+
+def _neighbor_document(course_id, counts, co_counts, now):
+    kept = co_counts.get(course_id) or Counter()
+    if len(kept) > MAX_CO_COUNTS:
+        kept = Counter(dict(kept.most_common(MAX_CO_COUNTS)))
+    return {
+        'count': counts.get(course_id, 0),
+        'co_counts': dict(kept),
+        'neighbors': top_neighbors(course_id, counts, co_counts),
+        'updatedAt': now
+    }
+
+
+def _write(db, documents, state):
+    """Write {course_id: neighbour document} and then the job state"""
+    collection_ref = db.collection(NEIGHBORS_COLLECTION)
+    batch = db.batch()
+    for course_id, data in documents.items():
+        if len(batch) >= MAX_BATCH_WRITES:
+            commit_batch(batch)
+            batch = db.batch()
+        batch.set(collection_ref.document(course_id), data)
+    if len(batch) >= MAX_BATCH_WRITES:
+        commit_batch(batch)
+        batch = db.batch()
+    batch.set(_state_ref(db), state, merge=True)
+    commit_batch(batch)
+    for course_id in documents:
+        recommendation_cache.delete(f'related:{course_id}')
+
+
+def rebuild_all():
+    """Recompute every course's neighbours from all enrollments; returns the number of courses"""
+    db = get_db()
+    now = datetime.utcnow()
+    rows = []
+    watermark = None
+    for row in _enrollments().stream():
+        rows.append((row.get('user_id'), row.get('course_id')))
+        enrolled_at = row.get('enrolled_at')
+        if enrolled_at is not None and (watermark is None or enrolled_at > watermark):
+            watermark = enrolled_at
+    counts, co_counts = co_enrollment_counts(rows)
+
+    documents = {course_id: _neighbor_document(course_id, counts, co_counts, now) for course_id in counts}
+    _write(db, documents, {'watermark': watermark or now, 'rebuilt_at': now, 'refreshed_at': now})
+    return len(documents)
+
+
+def refresh_incremental(watermark):
+    """Fold enrollments created after `watermark` into the stored counts; returns courses updated"""
+    db = get_db()
+    now = datetime.utcnow()
+    new_rows = _enrollments().where('enrolled_at', '>', watermark).all()
+    if not new_rows:
+        set_document(_state_ref(db), {'refreshed_at': now}, merge=True)
+        return 0
+
+    count_deltas = Counter()
+    co_deltas = defaultdict(Counter)
+    users = {row.get('user_id') for row in new_rows if row.get('user_id')}
+    for user_id in users:
+        # The user's whole history, so new courses pair with the ones taken before;
+        # rows without enrolled_at are older than any watermark
+        history = sorted(((row.get('enrolled_at') is not None, row.get('enrolled_at') or 0, row['course_id'])
+                          for row in _enrollments().where('user_id', '==', user_id).stream()
+                          if row.get('course_id')))
+        for position, (dated, enrolled_at, course_id) in enumerate(history):
+            if not dated or enrolled_at <= watermark:
+                continue
+            count_deltas[course_id] += 1
+            # Each pair is counted once, when its later enrollment arrives
+            for _, _, earlier_id in history[:position]:
+                co_deltas[course_id][earlier_id] += 1
+                co_deltas[earlier_id][course_id] += 1
+
+    collection_ref = db.collection(NEIGHBORS_COLLECTION)
+    affected = set(count_deltas) | set(co_deltas)
+    counts = Counter()
+    co_counts = {}
+    for doc in get_documents([collection_ref.document(course_id) for course_id in affected],
+                             field_paths=['count', 'co_counts']):
+        data = (doc.to_dict() or {}) if doc.exists else {}
+        counts[doc.id] = data.get('count', 0) + count_deltas.get(doc.id, 0)
+        co_counts[doc.id] = Counter(data.get('co_counts') or {})
+        co_counts[doc.id].update(co_deltas.get(doc.id, {}))
+
+    # Scores also need the enrollment count of every candidate neighbour
+    candidates = {other_id for others in co_counts.values() for other_id in others} - set(counts)
+    for doc in get_documents([collection_ref.document(course_id) for course_id in candidates],
+                             field_paths=['count']):
+        if doc.exists:
+            counts[doc.id] = (doc.to_dict() or {}).get('count', 0)
+
+    documents = {course_id: _neighbor_document(course_id, counts, co_counts, now) for course_id in affected}
+    new_watermark = max(row['enrolled_at'] for row in new_rows)
+    _write(db, documents, {'watermark': new_watermark, 'refreshed_at': now})
+    return len(documents)
+
+
+def refresh():
+    """Scheduled entry point: a full rebuild when due, an incremental refresh otherwise"""
+    db = get_db()
+    state = get_document(_state_ref(db))
+    state = (state.to_dict() or {}) if state.exists else {}
+    rebuilt_at = state.get('rebuilt_at')
+    if not state.get('watermark') or not rebuilt_at or \
+            _naive(rebuilt_at) < datetime.utcnow() - timedelta(hours=FULL_REBUILD_HOURS):
+        return 'full', rebuild_all()
+    return 'incremental', refresh_incremental(state['watermark'])
+
+
+def _naive(value):
+    """Firestore returns aware UTC datetimes; compare them with utcnow()"""
+    return value.replace(tzinfo=None) if getattr(value, 'tzinfo', None) else value
+
+
+def related(course_id):
+    """Stored neighbours of one course as [{'course_id', 'score'}], cached per instance"""
+    key = f'related:{course_id}'
+    neighbors = recommendation_cache.get(key)
+    if neighbors is None:
+        doc = get_document(get_db().collection(NEIGHBORS_COLLECTION).document(course_id),
+                           field_paths=['neighbors'])
+        neighbors = ((doc.to_dict() or {}).get('neighbors') or []) if doc.exists else []
+        recommendation_cache.set(key, neighbors)
+    return neighbors
+
+
+def for_user(course_ids, limit=TOP_K):
+    """[{'course_id', 'score'}] for someone enrolled in course_ids: their courses' neighbours, summed"""
+    taken = set(course_ids)
+    missing = [course_id for course_id in taken
+               if recommendation_cache.get(f'related:{course_id}') is None]
+    if missing:
+        # One batched read for every neighbour list not cached yet
+        collection_ref = get_db().collection(NEIGHBORS_COLLECTION)
+        for doc in get_documents([collection_ref.document(course_id) for course_id in missing],
+                                 field_paths=['neighbors']):
+            neighbors = ((doc.to_dict() or {}).get('neighbors') or []) if doc.exists else []
+            recommendation_cache.set(f'related:{doc.id}', neighbors)
+
+    scores = Counter()
+    for course_id in taken:
+        for neighbor in related(course_id):
+            if neighbor['course_id'] not in taken:
+                scores[neighbor['course_id']] += neighbor['score']
+    return [{'course_id': course_id, 'score': round(score, 4)}
+            for course_id, score in heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))]
+
+
+def with_courses(scored, limit, fields=None):
+    """Published course dicts for [{'course_id', 'score'}], with the score added"""
+    published = Course.published_by_id()
+    courses = []
+    for item in scored:
+        course = published.get(item['course_id'])
+        if course is None:
+            continue  # Unpublished since the neighbours were computed
+        if fields is not None:
+            course = {key: course[key] for key in ['id'] + fields if key in course}
+        courses.append(dict(course, score=item['score']))
+        if len(courses) >= limit:
+            break
+    return courses
+
+
+def popular(exclude, limit):
+    """[{'course_id', 'score'}] for the most enrolled published courses, for users with no history"""
+    courses = [course for course in Course.find_published() if course.get('id') not in exclude]
+    top = heapq.nlargest(limit, courses, key=lambda course: course.get('studentsCount') or 0)
+    return [{'course_id': course.get('id'), 'score': 0.0} for course in top]
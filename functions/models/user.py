@@ -1,7 +1,13 @@
 from datetime import datetime
-from firebase_admin import firestore
+from models.db import get_db, get_document, set_document, update_document
+from models.fields import ChangeTracking
+from models.query import Query
 
-class User:
+class User(ChangeTracking):
+    __slots__ = ('uid', 'email', 'display_name', 'phone', 'bio', 'role', 'profile_picture_url',
+                 'enrollment_count', 'created_at', 'updated_at', 'profile_complete',
+                 '_preferences', '_stats')
+    
     def __init__(self, uid=None, email=None, display_name=None, phone=None, bio=None, 
                  role='student', profile_picture_url=None, enrollment_count=0, 
                  created_at=None, updated_at=None, profile_complete=False, **kwargs):
@@ -17,26 +23,60 @@ class User:
         self.updated_at = updated_at or datetime.utcnow()
         self.profile_complete = profile_complete
         
-        # Learning preferences
-        self.preferences = kwargs.get('preferences', {
-            'notifications': True,
-            'email_updates': True,
-            'difficulty_preference': 'beginner'
-        })
-        
-        # Learning stats
-        self.stats = kwargs.get('stats', {
-            'courses_completed': 0,
-            'total_learning_time': 0,  # in minutes
-            'certificates_earned': 0,
-            'current_streak': 0
-        })
+        # Nested maps are kept as given; defaults are only built when first used
+        self._preferences = kwargs.get('preferences')
+        self._stats = kwargs.get('stats')
+
+    @property
+    def preferences(self):
+        """Learning preferences"""
+        if self._preferences is None:
+            self._preferences = {
+                'notifications': True,
+                'email_updates': True,
+                'difficulty_preference': 'beginner'
+            }
+        return self._preferences
+
+    @preferences.setter
+    def preferences(self, value):
+        self._preferences = value
+
+    @property
+    def stats(self):
+        """Learning stats"""
+        if self._stats is None:
+            self._stats = {
+                'courses_completed': 0,
+                'total_learning_time': 0,  # in minutes
+                'certificates_earned': 0,
+                'current_streak': 0
+            }
+        return self._stats
+
+    @stats.setter
+    def stats(self, value):
+        self._stats = value
 
     @classmethod
     def from_dict(cls, data):
         """Create User object from dictionary"""
         return cls(**data)
 
+    @classmethod
+    def from_doc(cls, doc):
+        user_data = doc.to_dict()
+        user_data.setdefault('uid', doc.id)
+        user = cls.from_dict(user_data)
+        # Diff against the stored document, so defaults it lacks get written on save
+        user.mark_saved(doc.to_dict())
+        return user
+
+    @classmethod
+    def query(cls):
+        """Chainable query over users; see models/query.py"""
+        return Query('users', cls.from_doc)
+
     def to_dict(self):
         """Convert User object to dictionary"""
         return {
@@ -59,21 +99,38 @@ class User:
     def get_by_id(cls, uid):
         """Get user by UID from Firestore"""
         try:
-            db = firestore.client()
-            doc = db.collection('users').document(uid).get()
+            db = get_db()
+            doc = get_document(db.collection('users').document(uid))
             if doc.exists:
-                return cls.from_dict(doc.to_dict())
+                return cls.from_doc(doc)
             return None
         except Exception as e:
             print(f'Error getting user: {e}')
             return None
 
+    @staticmethod
+    def get_role(uid):
+        """The user's role from a one-field read, or None if they have no profile"""
+        doc = get_document(get_db().collection('users').document(uid), field_paths=['role'])
+        if not doc.exists:
+            return None
+        return (doc.to_dict() or {}).get('role', 'student')
+
     def save(self):
-        """Save user to Firestore"""
+        """Save user to Firestore; a loaded user only writes the fields that changed"""
         try:
-            db = firestore.client()
-            self.updated_at = datetime.utcnow()
-            db.collection('users').document(self.uid).set(self.to_dict())
+            db = get_db()
+            doc_ref = db.collection('users').document(self.uid)
+            changes = self.changes()
+            if changes is None:
+                self.updated_at = datetime.utcnow()
+                set_document(doc_ref, self.to_dict())
+            elif changes:
+                self.updated_at = datetime.utcnow()
+                changes['updated_at'] = self.updated_at
+                update_document(doc_ref, changes)
+            # Nothing changed: no write at all
+            self.mark_saved()
             return True
         except Exception as e:
             print(f'Error saving user: {e}')
@@ -90,13 +147,11 @@ class User:
             if key in allowed_fields:
                 setattr(self, key, value)
         
-        self.updated_at = datetime.utcnow()
         return self.save()
 
     def increment_enrollment_count(self):
         """Increment user's enrollment count"""
         self.enrollment_count += 1
-        self.updated_at = datetime.utcnow()
         return self.save()
 
     def update_learning_stats(self, course_completed=False, learning_time=0):
@@ -105,7 +160,6 @@ class User:
             self.stats['courses_completed'] += 1
         
         self.stats['total_learning_time'] += learning_time
-        self.updated_at = datetime.utcnow()
         return self.save()
 
     def validate(self):
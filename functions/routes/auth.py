@@ -1,5 +1,5 @@
 from flask import Blueprint, jsonify, request
-from controllers.auth_controller import verify_token, get_user_profile, update_user_profile, create_user_profile
+from controllers.auth_controller import verify_token, verify_id_token, get_user_profile, update_user_profile, create_user_profile
 from firebase_admin import auth
 
 auth_bp = Blueprint('auth', __name__)
@@ -9,19 +9,25 @@ def register():
     try:
         data = request.get_json()
         email = data.get('email')
-        password = data.get('password')
         display_name = data.get('display_name')
         
-        # Create user in Firebase Auth
-        user_record = auth.create_user(
-            email=email,
-            password=password,
-            display_name=display_name
-        )
+        auth_header = request.headers.get('Authorization')
+        if auth_header and auth_header.startswith('Bearer '):
+            # Account already created by the client SDK, only the profile is missing
+            decoded_token = verify_id_token(auth_header.split(' ')[1])
+            uid = decoded_token['uid']
+        else:
+            # Create user in Firebase Auth
+            user_record = auth.create_user(
+                email=email,
+                password=data.get('password'),
+                display_name=display_name
+            )
+            uid = user_record.uid
         
         # Create user profile in Firestore
         profile_data = create_user_profile(
-            user_record.uid, 
+            uid, 
             email, 
             display_name,
             {
@@ -31,13 +37,20 @@ def register():
             }
         )
         
+        if not profile_data:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to create user profile'
+            }), 500
+        
         return jsonify({
+            'success': True,
             'message': 'User registered successfully',
             'user': profile_data
         }), 201
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return jsonify({'success': False, 'error': str(e)}), 400
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
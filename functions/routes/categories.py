@@ -1,28 +1,35 @@
 from flask import Blueprint, jsonify
-from firebase_admin import firestore
+from models.category import Category, courses_counter
+from utils.http_cache import cache_control
+from utils.pagination import InvalidPageRequest, get_page_args, wants_page
 
 categories_bp = Blueprint('categories', __name__)
 
 @categories_bp.route('/', methods=['GET'])
+@cache_control(max_age=300, s_maxage=3600, stale_while_revalidate=86400)
 def get_categories():
     """Get all categories from Firestore"""
     try:
-        db = firestore.client()
-        categories_ref = db.collection('categories')
-        docs = categories_ref.stream()
-        
-        categories = []
-        for doc in docs:
-            category_data = doc.to_dict()
-            category_data['id'] = doc.id
-            categories.append(category_data)
+        next_cursor = None
+        if wants_page():
+            limit, cursor = get_page_args()
+            page, next_cursor = Category.find_page(limit=limit, cursor=cursor)
+            categories = courses_counter.with_totals([category.to_dict() for category in page])
+        else:
+            categories = Category.find_catalog()
         
         return jsonify({
             'success': True,
             'data': categories,
-            'count': len(categories)
+            'count': len(categories),
+            'next_cursor': next_cursor
         }), 200
         
+    except InvalidPageRequest as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f'Error getting categories: {e}')
         return jsonify({
@@ -1,31 +1,60 @@
 from flask import Blueprint, request, jsonify
-from models.course import Course  # Import from models, don't redefine
+from models.course import Course, students_counter  # Import from models, don't redefine
+from models.enrollment import Enrollment
+from models.user import User
+from models import recommendations
 from controllers.auth_controller import verify_token
-from firebase_admin import firestore
+from utils.http_cache import cache_control
+from utils.pagination import get_page_args, page_size, wants_page
 from datetime import datetime
 
 courses_bp = Blueprint('courses', __name__)
 
-def get_db():
-    """Get Firestore client instance"""
-    return firestore.client()
+DEFAULT_SEARCH_RESULTS = 20
+FACETS = ['category', 'difficulty', 'instructor', 'price']
 
 # Get all courses
 @courses_bp.route('', methods=['GET'], strict_slashes=False)
 @courses_bp.route('/', methods=['GET'], strict_slashes=False)
+@cache_control(max_age=60, s_maxage=300, stale_while_revalidate=600)
 def get_courses():
     try:
         print("Getting courses...")  # Debug print
-        courses = Course.find_all({'isPublished': True})  # Note: check the field name
-        course_list = [course.to_dict() for course in courses]
+        fields = Course.parse_fields(request.args.get('fields'))  # e.g. ?fields=summary
+        query = Course.catalog_query(request.args)  # e.g. ?category=DevOps&max_price=20&sort=-rating
+        next_cursor = None
+        if query is not None:
+            # Filtered in Firestore, so only matching courses are read
+            query = query.select(fields)
+            if wants_page():
+                limit, cursor = get_page_args()
+                courses, next_cursor = query.page(limit, cursor)
+            else:
+                courses = query.all()
+            course_list = [course.to_dict() for course in courses]
+        elif wants_page():
+            limit, cursor = get_page_args()
+            courses, next_cursor = Course.find_page({'isPublished': True}, limit, cursor, fields=fields)
+            course_list = [course.to_dict() for course in courses]
+        else:
+            course_list = Course.find_published(fields)  # Cached per instance, see utils/cache.py
+        # Include enrolls not yet reconciled into the stored field, as the detail view does
+        course_list = students_counter.with_totals(course_list)
         
         print(f"Found {len(course_list)} courses")  # Debug print
         
         return jsonify({
             'success': True,
             'data': course_list,
-            'count': len(course_list)
+            'count': len(course_list),
+            'next_cursor': next_cursor
         })
+    except ValueError as e:
+        # Malformed limit, cursor, fields or filter parameter
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f'Get courses error: {e}')
         return jsonify({
@@ -34,15 +63,87 @@ def get_courses():
             'message': str(e)
         }), 500
 
+# Full-text search over published courses
+@courses_bp.route('/search', methods=['GET'], strict_slashes=False)
+@cache_control(max_age=60, s_maxage=300, stale_while_revalidate=600)
+def search_courses():
+    try:
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': 'q is required'
+            }), 400
+        limit, _ = get_page_args()
+        limit = page_size(limit or DEFAULT_SEARCH_RESULTS)
+        fields = Course.parse_fields(request.args.get('fields'))
+        
+        results = []
+        for course, score in Course.search(query, limit):
+            if fields is not None:
+                course = {key: course[key] for key in ['id'] + fields if key in course}
+            results.append(dict(course, score=score))
+        results = students_counter.with_totals(results)
+        
+        return jsonify({
+            'success': True,
+            'data': results,
+            'count': len(results)
+        })
+    except ValueError as e:
+        # Malformed limit or fields parameter
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        print(f'Search courses error: {e}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to search courses',
+            'message': str(e)
+        }), 500
+
+# Facet counts for the catalog filters, e.g. ?category=DevOps,Mobile%20Development&price=0-50
+@courses_bp.route('/facets', methods=['GET'], strict_slashes=False)
+@cache_control(max_age=60, s_maxage=300, stale_while_revalidate=600)
+def get_course_facets():
+    try:
+        filters = {}
+        for name in FACETS:
+            values = [value.strip() for value in (request.args.get(name) or '').split(',') if value.strip()]
+            if values:
+                filters[name] = values
+        total, facets = Course.facet_counts(filters)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'total': total,
+                'facets': facets
+            }
+        })
+    except Exception as e:
+        print(f'Get course facets error: {e}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch course facets',
+            'message': str(e)
+        }), 500
+
 # Get single course by ID - THIS WAS MISSING!
 @courses_bp.route('/<course_id>', methods=['GET'], strict_slashes=False)
+@cache_control(max_age=60, s_maxage=300, stale_while_revalidate=600)
 def get_course_by_id(course_id):
     try:
         print(f"Getting course by ID: {course_id}")  # Debug print
-        course = Course.get_by_id(course_id)
+        course = Course.get_by_id(course_id, fields=Course.parse_fields(request.args.get('fields')))
         
         if course:
             course_data = course.to_dict()
+            if 'studentsCount' in course_data:
+                # Include enrolls not yet reconciled into the stored field
+                course_data['studentsCount'] = students_counter.total(course_id, course_data['studentsCount'])
             print(f"Found course: {course_data.get('title', 'Unknown')}")  # Debug print
             return jsonify({
                 'success': True,
@@ -55,6 +156,11 @@ def get_course_by_id(course_id):
                 'error': 'Course not found'
             }), 404
             
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f'Get course by ID error: {e}')
         return jsonify({
@@ -63,6 +169,70 @@ def get_course_by_id(course_id):
             'message': str(e)
         }), 500
 
+# Courses often taken together with this one
+@courses_bp.route('/<course_id>/related', methods=['GET'], strict_slashes=False)
+@cache_control(max_age=300, s_maxage=3600, stale_while_revalidate=86400)
+def get_related_courses(course_id):
+    try:
+        limit, _ = get_page_args()
+        limit = page_size(limit or recommendations.TOP_K)
+        fields = Course.parse_fields(request.args.get('fields'))
+        
+        related = recommendations.with_courses(recommendations.related(course_id), limit, fields)
+        
+        return jsonify({
+            'success': True,
+            'data': related,
+            'count': len(related)
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        print(f'Get related courses error: {e}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch related courses',
+            'message': str(e)
+        }), 500
+
+# Enrollment analytics for instructor dashboards; only the course's instructor or an admin may see them
+@courses_bp.route('/<course_id>/analytics', methods=['GET'], strict_slashes=False)
+@verify_token
+def get_course_analytics(course_id):
+    try:
+        course = Course.published_by_id().get(course_id)
+        if course is None:
+            found = Course.get_by_id(course_id, fields=['instructor_id'])
+            course = found.to_dict() if found else None
+        if not course:
+            return jsonify({
+                'success': False,
+                'error': 'Course not found'
+            }), 404
+        
+        # `instructor` is a display name anyone can take; instructor_id is the creator's UID
+        uid = request.user['uid']
+        if course.get('instructor_id') != uid and User.get_role(uid) != 'admin':
+            return jsonify({
+                'success': False,
+                'error': 'Only the course instructor or an admin can view its analytics'
+            }), 403
+        
+        return jsonify({
+            'success': True,
+            'data': Enrollment.get_course_stats(course_id)  # Aggregation queries, cached per instance
+        })
+    except Exception as e:
+        print(f'Get course analytics error: {e}')
+        return jsonify({
+            'success': False,
+            'error': 'Failed to fetch course analytics',
+            'message': str(e)
+        }), 500
+
 # Create new course (existing code)
 @courses_bp.route('', methods=['POST'], strict_slashes=False)
 @courses_bp.route('/', methods=['POST'], strict_slashes=False)
@@ -77,6 +247,9 @@ def create_course():
                 'error': 'No data provided'
             }), 400
         
+        # Record who created the course, e.g. to let them see its analytics
+        data['instructor_id'] = request.user['uid']
+        
         # Add timestamps
         data['createdAt'] = datetime.now()
         data['updatedAt'] = datetime.now()
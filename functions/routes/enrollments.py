@@ -1,31 +1,46 @@
 from flask import Blueprint, jsonify, request
-from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
 from controllers.auth_controller import verify_token
 from models.enrollment import Enrollment
 from models.course import Course
+from utils.pagination import InvalidPageRequest, get_page_args, wants_page
+from utils.streaming import NDJSON_MIMETYPE, stream_response
 
 enrollments_bp = Blueprint('enrollments', __name__)
 
 @enrollments_bp.route('/all', methods=['GET'])
 def get_all_enrollments():
-    """Get all enrollments (admin endpoint for export)"""
+    """Get all enrollments (admin endpoint for export), one page at a time.
+    
+    ?stream=json (or ?stream=ndjson / Accept: application/x-ndjson) streams the
+    whole collection instead, joining courses in bounded windows.
+    """
     try:
-        enrollments = Enrollment.find_all()
+        stream_format = request.args.get('stream')
+        if not stream_format and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+            stream_format = 'ndjson'
+        if stream_format:
+            enrollment_data = Enrollment.iter_with_courses(Enrollment.iter_all())
+            return stream_response(enrollment_data, ndjson=stream_format == 'ndjson')
         
-        # Get course details for each enrollment
-        enrollment_data = []
-        for enrollment in enrollments:
-            course = Course.get_by_id(enrollment.course_id)
-            enrollment_dict = enrollment.to_dict()
-            enrollment_dict['course'] = course.to_dict() if course else None
-            enrollment_data.append(enrollment_dict)
+        limit, cursor = get_page_args()
+        enrollments, next_cursor = Enrollment.find_page(limit=limit, cursor=cursor)
+        
+        # Get course details for all enrollments in one batched read
+        enrollment_data = Enrollment.with_courses(enrollments)
         
         return jsonify({
             'success': True,
             'data': enrollment_data,
-            'count': len(enrollment_data)
+            'count': len(enrollment_data),
+            'next_cursor': next_cursor
         }), 200
         
+    except InvalidPageRequest as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f'Error getting all enrollments: {e}')
         return jsonify({
@@ -39,22 +54,28 @@ def get_user_enrollments():
     """Get all enrollments for the current user"""
     try:
         user_id = request.user['uid']
-        enrollments = Enrollment.get_user_enrollments(user_id)
+        next_cursor = None
+        if wants_page():
+            limit, cursor = get_page_args()
+            enrollments, next_cursor = Enrollment.get_user_enrollments_page(user_id, limit, cursor)
+        else:
+            enrollments = Enrollment.get_user_enrollments(user_id)
         
-        # Get course details for each enrollment
-        enrollment_data = []
-        for enrollment in enrollments:
-            course = Course.get_by_id(enrollment.course_id)
-            enrollment_dict = enrollment.to_dict()
-            enrollment_dict['course'] = course.to_dict() if course else None
-            enrollment_data.append(enrollment_dict)
+        # Get course details for all enrollments in one batched read
+        enrollment_data = Enrollment.with_courses(enrollments)
         
         return jsonify({
             'success': True,
             'enrollments': enrollment_data,
-            'count': len(enrollment_data)
+            'count': len(enrollment_data),
+            'next_cursor': next_cursor
         }), 200
         
+    except InvalidPageRequest as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         print(f'Error getting enrollments: {e}')
         return jsonify({
@@ -78,36 +99,33 @@ def enroll_in_course():
         
         user_id = request.user['uid']
         
-        # Check if course exists
-        course = Course.get_by_id(course_id)
+        # Published courses come from the catalog cache, so this is usually free
+        course = Course.find_published_by_id(course_id)
+        if course is None:
+            found = Course.get_by_id(course_id)
+            course = found.to_dict() if found else None
         if not course:
             return jsonify({
                 'success': False,
                 'error': 'Course not found'
             }), 404
         
-        # Check if user is already enrolled
-        existing_enrollment = Enrollment.get_user_course_enrollment(user_id, course_id)
-        if existing_enrollment:
+        # Create the enrollment and bump counters in a single atomic write
+        try:
+            enrollment = Enrollment.create_enrollment(user_id, course_id)
+        except AlreadyExists:
+            existing_enrollment = Enrollment.get_user_course_enrollment(user_id, course_id)
             return jsonify({
                 'success': False,
                 'error': 'Already enrolled in this course',
-                'enrollment': existing_enrollment.to_dict()
+                'enrollment': existing_enrollment.to_dict() if existing_enrollment else None
             }), 400
         
-        # Create enrollment
-        enrollment = Enrollment.create_enrollment(user_id, course_id)
-        if enrollment:
-            return jsonify({
-                'success': True,
-                'message': f'Successfully enrolled in {course.title}',
-                'enrollment': enrollment.to_dict()
-            }), 201
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to create enrollment'
-            }), 500
+        return jsonify({
+            'success': True,
+            'message': f"Successfully enrolled in {course.get('title')}",
+            'enrollment': enrollment.to_dict()
+        }), 201
             
     except Exception as e:
         print(f'Error enrolling in course: {e}')
@@ -118,10 +136,9 @@ def enroll_in_course():
 
 @enrollments_bp.route('/<enrollment_id>/progress', methods=['PUT'])
 @verify_token
-def update_enrollment_progress():
+def update_enrollment_progress(enrollment_id):
     """Update progress for an enrollment"""
     try:
-        enrollment_id = request.view_args['enrollment_id']
         data = request.get_json()
         
         lesson_id = data.get('lesson_id')
@@ -133,42 +150,117 @@ def update_enrollment_progress():
                 'error': 'lesson_id is required'
             }), 400
         
-        # Get enrollment and verify ownership
-        user_id = request.user['uid']
-        db = firestore.client()
-        enrollment_doc = db.collection('enrollments').document(enrollment_id).get()
+        # Applied later as an Increment, so reject anything that is not a count now
+        if isinstance(time_spent, bool) or not isinstance(time_spent, (int, float)) or time_spent < 0:
+            return jsonify({
+                'success': False,
+                'error': 'time_spent must be a non-negative number'
+            }), 400
         
-        if not enrollment_doc.exists:
+        # Deterministic IDs name their owner; only legacy IDs need a read to verify it
+        user_id = request.user['uid']
+        if not Enrollment.is_owned_by(enrollment_id, user_id):
+            enrollment = Enrollment.get_by_id(enrollment_id)
+            
+            if not enrollment:
+                return jsonify({
+                    'success': False,
+                    'error': 'Enrollment not found'
+                }), 404
+            
+            if enrollment.user_id != user_id:
+                return jsonify({
+                    'success': False,
+                    'error': 'Unauthorized'
+                }), 403
+        
+        # Field-level update, blind for time-only events; see models/progress_buffer.py
+        try:
+            pending = Enrollment.record_progress(enrollment_id, lesson_id, time_spent)
+        except NotFound:
             return jsonify({
                 'success': False,
                 'error': 'Enrollment not found'
             }), 404
         
-        enrollment_data = enrollment_doc.to_dict()
-        if enrollment_data['user_id'] != user_id:
+        return jsonify({
+            'success': True,
+            'message': 'Progress updated successfully',
+            # The stored progress after a completed lesson; None for time-only events,
+            # which are written without reading it, and while events are buffered
+            'progress': pending.progress,
+            'pending': pending.to_dict()
+        }), 200
+            
+    except Exception as e:
+        print(f'Error updating progress: {e}')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# Most events accepted by one bulk sync request
+MAX_SYNC_EVENTS = 500
+
+@enrollments_bp.route('/progress:batch', methods=['POST'])
+@verify_token
+def sync_progress_batch():
+    """Apply many offline progress events across enrollments in one request"""
+    try:
+        data = request.get_json(silent=True) or {}
+        events = data.get('events')
+        
+        if not isinstance(events, list) or not events:
             return jsonify({
                 'success': False,
-                'error': 'Unauthorized'
-            }), 403
-        
-        # Update progress
-        enrollment = Enrollment.from_dict(enrollment_data)
-        success = enrollment.update_progress(lesson_id, time_spent)
+                'error': 'events must be a non-empty list'
+            }), 400
         
-        if success:
-            return jsonify({
-                'success': True,
-                'message': 'Progress updated successfully',
-                'progress': enrollment.progress
-            }), 200
-        else:
+        if len(events) > MAX_SYNC_EVENTS:
             return jsonify({
                 'success': False,
-                'error': 'Failed to update progress'
-            }), 500
-            
+                'error': f'At most {MAX_SYNC_EVENTS} events per request'
+            }), 400
+        
+        # Invalid events get their own result and are not sent to Firestore
+        results = [None] * len(events)
+        valid = []
+        for index, event in enumerate(events):
+            error = None
+            if not isinstance(event, dict) or not isinstance(event.get('enrollment_id'), str) \
+                    or not event.get('enrollment_id'):
+                error = 'enrollment_id is required'
+            elif not event.get('lesson_id'):
+                error = 'lesson_id is required'
+            else:
+                time_spent = event.get('time_spent', 0)
+                if isinstance(time_spent, bool) or not isinstance(time_spent, (int, float)) or time_spent < 0:
+                    error = 'time_spent must be a non-negative number'
+            if error:
+                results[index] = {
+                    'enrollment_id': event.get('enrollment_id') if isinstance(event, dict) else None,
+                    'lesson_id': event.get('lesson_id') if isinstance(event, dict) else None,
+                    'status': 'invalid',
+                    'error': error
+                }
+            else:
+                valid.append((index, event))
+        
+        if valid:
+            applied = Enrollment.record_progress_batch(request.user['uid'], [event for _, event in valid])
+            for (index, _), result in zip(valid, applied):
+                results[index] = result
+        
+        applied_count = sum(1 for result in results if result['status'] == 'ok')
+        return jsonify({
+            'success': applied_count == len(results),
+            'applied': applied_count,
+            'count': len(results),
+            'results': results
+        }), 200
+        
     except Exception as e:
-        print(f'Error updating progress: {e}')
+        print(f'Error syncing progress: {e}')
         return jsonify({
             'success': False,
             'error': str(e)
@@ -176,31 +268,27 @@ def update_enrollment_progress():
 
 @enrollments_bp.route('/<enrollment_id>/complete', methods=['PUT'])
 @verify_token
-def complete_course():
+def complete_course(enrollment_id):
     """Mark a course as completed"""
     try:
-        enrollment_id = request.view_args['enrollment_id']
         user_id = request.user['uid']
         
         # Get enrollment and verify ownership
-        db = firestore.client()
-        enrollment_doc = db.collection('enrollments').document(enrollment_id).get()
+        enrollment = Enrollment.get_by_id(enrollment_id)
         
-        if not enrollment_doc.exists:
+        if not enrollment:
             return jsonify({
                 'success': False,
                 'error': 'Enrollment not found'
             }), 404
         
-        enrollment_data = enrollment_doc.to_dict()
-        if enrollment_data['user_id'] != user_id:
+        if enrollment.user_id != user_id:
             return jsonify({
                 'success': False,
                 'error': 'Unauthorized'
             }), 403
         
         # Complete course
-        enrollment = Enrollment.from_dict(enrollment_data)
         success = enrollment.complete_course()
         
         if success:
@@ -224,10 +312,9 @@ def complete_course():
 
 @enrollments_bp.route('/<enrollment_id>/review', methods=['PUT'])
 @verify_token
-def add_course_review():
+def add_course_review(enrollment_id):
     """Add rating and review for a completed course"""
     try:
-        enrollment_id = request.view_args['enrollment_id']
         data = request.get_json()
         
         rating = data.get('rating')
@@ -242,24 +329,21 @@ def add_course_review():
         user_id = request.user['uid']
         
         # Get enrollment and verify ownership
-        db = firestore.client()
-        enrollment_doc = db.collection('enrollments').document(enrollment_id).get()
+        enrollment = Enrollment.get_by_id(enrollment_id)
         
-        if not enrollment_doc.exists:
+        if not enrollment:
             return jsonify({
                 'success': False,
                 'error': 'Enrollment not found'
             }), 404
         
-        enrollment_data = enrollment_doc.to_dict()
-        if enrollment_data['user_id'] != user_id:
+        if enrollment.user_id != user_id:
             return jsonify({
                 'success': False,
                 'error': 'Unauthorized'
             }), 403
         
         # Add review
-        enrollment = Enrollment.from_dict(enrollment_data)
         success = enrollment.add_review(rating, review_text)
         
         if success:
@@ -283,10 +367,9 @@ def add_course_review():
 
 @enrollments_bp.route('/check/<course_id>', methods=['GET'])
 @verify_token
-def check_enrollment_status():
+def check_enrollment_status(course_id):
     """Check if user is enrolled in a specific course"""
     try:
-        course_id = request.view_args['course_id']
         user_id = request.user['uid']
         
         enrollment = Enrollment.get_user_course_enrollment(user_id, course_id)
@@ -0,0 +1,45 @@
+from flask import Blueprint, jsonify, request
+from controllers.auth_controller import verify_token
+from models import recommendations
+from models.course import Course
+from models.enrollment import Enrollment
+from utils.pagination import get_page_args, page_size
+
+me_bp = Blueprint('me', __name__)
+
+@me_bp.route('/recommendations', methods=['GET'])
+@verify_token
+def get_recommendations():
+    """Courses the current user is likely to take next, from what they and others enrolled in"""
+    try:
+        limit, _ = get_page_args()
+        limit = page_size(limit or recommendations.TOP_K)
+        fields = Course.parse_fields(request.args.get('fields'))
+        
+        taken = [enrollment.course_id for enrollment in Enrollment.get_user_enrollments(request.user['uid'])]
+        scored = recommendations.for_user(taken, limit * 2) if taken else []
+        source = 'co_enrollment'
+        if not scored:
+            # Nothing to go on yet: fall back to the most popular courses
+            scored = recommendations.popular(set(taken), limit)
+            source = 'popular'
+        courses = recommendations.with_courses(scored, limit, fields)
+        
+        return jsonify({
+            'success': True,
+            'data': courses,
+            'count': len(courses),
+            'source': source
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        print(f'Error getting recommendations: {e}')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
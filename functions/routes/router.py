@@ -0,0 +1,131 @@
+"""Precompiled route table used by the `api` Cloud Function.
+
+The table is built once from the Flask app's url_map so the Cloud Function and
+the Flask app serve exactly the same blueprint handlers. Each method's rules
+form a tree of path segments, keyed first by the path's first segment: a
+request walks it with one dict lookup per segment instead of running a pattern
+over every rule, and an unknown prefix is rejected at its first segment.
+"""
+
+# Keys of a tree node besides its literal segments; never equal to a path segment
+_PARAM = 0  # (param name, child node) for a <param> segment, named after the first rule to use it
+_END = 1  # (endpoint, (param name, this rule's name) pairs that differ) of a rule ending at this node
+_RETRY = 2  # set on nodes reached through a literal segment that has a parameter sibling
+
+
+def normalize_path(path):
+    """Strip trailing slashes so '/courses' and '/courses/' match the same route"""
+    return path.rstrip('/') or '/'
+
+
+class Router:
+    def __init__(self):
+        # path -> {method: endpoint}, for rules without parameters, with and without a trailing slash
+        self._static = {}
+        # method -> tree of {segment: node}, for every rule
+        self._trees = {}
+
+    def add(self, method, template, endpoint):
+        """Register an endpoint for a method and Flask-style path template"""
+        method = method.upper()
+        template = normalize_path(template)
+
+        if '<' not in template:
+            for path in {template, template + '/', template.rstrip('/')}:
+                self._static.setdefault(path, {})[method] = endpoint
+
+        node = self._trees.setdefault(method, {})
+        renames = []
+        for part in template.split('/'):
+            if part.startswith('<') and part.endswith('>'):
+                name = part[1:-1].split(':')[-1]
+                param = node.setdefault(_PARAM, (name, {}))
+                if param[0] != name:
+                    renames.append((param[0], name))
+                node = param[1]
+            else:
+                node = node.setdefault(part, {})
+        node[_END] = (endpoint, tuple(renames))
+        # Trailing slashes lead to a node that only ends the rule
+        slash = node[''] = {_END: node[_END]}
+        slash[''] = slash
+        self._mark_retries(self._trees[method], False)
+
+    def _mark_retries(self, node, below_fork):
+        """Flag the nodes where a failed walk must fall back to _walk"""
+        if below_fork:
+            node[_RETRY] = True
+        else:
+            node.pop(_RETRY, None)
+        fork = _PARAM in node
+        for key, child in list(node.items()):
+            if key == _PARAM:
+                self._mark_retries(child[1], below_fork)
+            elif isinstance(key, str) and child is not node:
+                self._mark_retries(child, below_fork or fork)
+
+    def match(self, method, path):
+        """Return (endpoint, view_args) for an upper-case method, or None if nothing matches"""
+        methods = self._static.get(path)
+        if methods is not None:
+            endpoint = methods.get(method)
+            if endpoint is not None:
+                return endpoint, {}
+
+        node = self._trees.get(method)
+        if node is None:
+            return None
+        view_args = {}
+        for part in path.split('/'):
+            child = node.get(part)
+            if child is None:
+                param = node.get(_PARAM)
+                if param is None or not part:
+                    break
+                view_args[param[0]] = part
+                child = param[1]
+            node = child
+        else:
+            end = node.get(_END)
+            if end is not None:
+                if end[1]:
+                    return self._result(end, view_args)
+                return end[0], view_args
+        if _RETRY in node:
+            # A literal segment was taken where only its parameter sibling may lead to a rule
+            return self._walk(self._trees[method], path.split('/'), 0, {})
+        return None
+
+    @staticmethod
+    def _result(end, view_args):
+        endpoint, renames = end
+        for name, rule_name in renames:
+            view_args[rule_name] = view_args.pop(name)
+        return endpoint, view_args
+
+    def _walk(self, node, parts, index, view_args):
+        """Backtracking match, literal segments first, like werkzeug"""
+        if index == len(parts):
+            end = node.get(_END)
+            return self._result(end, view_args) if end is not None else None
+        part = parts[index]
+        child = node.get(part)
+        if child is not None:
+            found = self._walk(child, parts, index + 1, dict(view_args))
+            if found is not None:
+                return found
+        param = node.get(_PARAM)
+        if param is not None and part:
+            return self._walk(param[1], parts, index + 1, dict(view_args, **{param[0]: part}))
+        return None
+
+    @classmethod
+    def from_app(cls, app):
+        """Build the route table from every rule registered on a Flask app"""
+        router = cls()
+        for rule in app.url_map.iter_rules():
+            if rule.endpoint == 'static':
+                continue
+            for method in rule.methods - {'OPTIONS'}:
+                router.add(method, rule.rule, rule.endpoint)
+        return router
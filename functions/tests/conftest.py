@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Write progress events straight away instead of from the background flush thread
+os.environ.setdefault('PROGRESS_FLUSH_INTERVAL', '0')
+
+import pytest
+
+import main
+import models.db
+from controllers import auth_controller
+from fake_firestore import FakeFirestore
+from models.db import current_stats
+from utils.cache import (analytics_cache, catalog_cache, counter_cache, lesson_cache,
+                         recommendation_cache)
+
+CACHES = [analytics_cache, catalog_cache, counter_cache, lesson_cache, recommendation_cache,
+          auth_controller.token_cache]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A fresh in-memory Firestore behind models.db, with every cache emptied"""
+    client = FakeFirestore()
+    monkeypatch.setattr(models.db, '_client', client)
+    for cache in CACHES:
+        cache.clear()
+    return client
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    """Accept any bearer token, treating the token itself as the user's UID"""
+    monkeypatch.setattr(auth_controller, 'verify_id_token',
+                        lambda token, check_revoked=False: {'uid': token})
+    return lambda uid: {'Authorization': f'Bearer {uid}'}
+
+
+@pytest.fixture
+def app():
+    return main.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def dispatch(app):
+    """Handle one request, returning (response, Firestore CallStats for that request)"""
+    def run(method, path, headers=None, json=None):
+        with app.test_request_context(path, method=method, headers=headers, json=json):
+            response = app.full_dispatch_request()
+            return response, current_stats()
+    return run
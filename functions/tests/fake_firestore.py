@@ -0,0 +1,436 @@
+"""In-memory stand-in for the Firestore client, enough for the models' queries.
+
+Supports documents and subcollections, where/order_by/limit/select/start_after
+queries, count/sum/avg aggregations, collection groups, get_all, and write batches that apply atomically
+and enforce create() / update() / last-update-time preconditions the way the
+server does. Every document read is counted in `reads`.
+"""
+import copy
+import functools
+import itertools
+import threading
+from datetime import datetime
+
+from google.api_core.exceptions import AlreadyExists, FailedPrecondition, NotFound
+from google.cloud.firestore_v1 import transforms
+
+_MISSING = object()
+
+OPERATORS = {
+    '==': lambda value, target: value == target,
+    '!=': lambda value, target: value is not _MISSING and value != target,
+    '<': lambda value, target: _comparable(value, target) and value < target,
+    '<=': lambda value, target: _comparable(value, target) and value <= target,
+    '>': lambda value, target: _comparable(value, target) and value > target,
+    '>=': lambda value, target: _comparable(value, target) and value >= target,
+    'in': lambda value, target: value in target,
+    'not-in': lambda value, target: value is not _MISSING and value not in target,
+    'array_contains': lambda value, target: isinstance(value, list) and target in value,
+    'array_contains_any': lambda value, target: isinstance(value, list) and any(item in value for item in target),
+}
+
+
+def _comparable(value, target):
+    """Range filters only match values of the same type (ints and floats count as one)"""
+    if value is _MISSING or value is None or isinstance(value, bool) or isinstance(target, bool):
+        return False
+    if isinstance(value, (int, float)) and isinstance(target, (int, float)):
+        return True
+    return type(value) is type(target)
+
+
+def get_path(data, path):
+    for part in path.split('.'):
+        if not isinstance(data, dict) or part not in data:
+            return _MISSING
+        data = data[part]
+    return data
+
+
+def project(data, field_paths):
+    result = {}
+    for path in field_paths:
+        value = get_path(data, path)
+        if value is _MISSING:
+            continue
+        parts = path.split('.')
+        target = result
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = copy.deepcopy(value)
+    return result
+
+
+def _apply_value(target, key, value):
+    if isinstance(value, transforms.Increment):
+        target[key] = (target.get(key) or 0) + value.value
+    elif isinstance(value, transforms.ArrayUnion):
+        current = list(target.get(key) or [])
+        target[key] = current + [item for item in value.values if item not in current]
+    elif isinstance(value, transforms.ArrayRemove):
+        target[key] = [item for item in target.get(key) or [] if item not in value.values]
+    elif value is transforms.SERVER_TIMESTAMP:
+        target[key] = datetime.utcnow()
+    elif value is transforms.DELETE_FIELD:
+        target.pop(key, None)
+    else:
+        target[key] = copy.deepcopy(value)
+
+
+def apply_update(data, update):
+    """update(): keys are field paths"""
+    for path, value in update.items():
+        parts = path.split('.')
+        target = data
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        _apply_value(target, parts[-1], value)
+
+
+def apply_merge(data, update):
+    """set(merge=True): nested dicts are merged key by key"""
+    for key, value in update.items():
+        if isinstance(value, dict):
+            existing = data.get(key)
+            if not isinstance(existing, dict):
+                existing = data[key] = {}
+            apply_merge(existing, value)
+        else:
+            _apply_value(data, key, value)
+
+
+def apply_set(update):
+    data = {}
+    for key, value in update.items():
+        _apply_value(data, key, value)
+    return data
+
+
+class Snapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+        self.update_time = update_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path):
+        value = get_path(self._data or {}, field_path)
+        if value is _MISSING:
+            raise KeyError(field_path)
+        return value
+
+
+class DocumentReference:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+
+    @property
+    def id(self):
+        return self.path.rsplit('/', 1)[1]
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self.path.rsplit('/', 1)[0])
+
+    def collection(self, name):
+        return CollectionReference(self._client, f'{self.path}/{name}')
+
+    def get(self, field_paths=None, transaction=None):
+        return self._client._read(self, field_paths)
+
+    def set(self, data, merge=False):
+        batch = self._client.batch()
+        batch.set(self, data, merge=merge)
+        batch.commit()
+
+    def update(self, data, option=None):
+        batch = self._client.batch()
+        batch.update(self, data, option=option)
+        batch.commit()
+
+    def create(self, data):
+        batch = self._client.batch()
+        batch.create(self, data)
+        batch.commit()
+
+    def delete(self, option=None):
+        batch = self._client.batch()
+        batch.delete(self, option=option)
+        batch.commit()
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+
+class Query:
+    def __init__(self, client, path, group=False, filters=(), orders=(), limit=None, start_after=None, fields=None):
+        self._client = client
+        self._path = path
+        self._group = group
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._limit = limit
+        self._start_after = start_after
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = {'group': self._group, 'filters': self._filters, 'orders': self._orders, 'limit': self._limit,
+                 'start_after': self._start_after, 'fields': self._fields}
+        state.update(changes)
+        return Query(self._client, self._path, **state)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction='ASCENDING'):
+        return self._copy(orders=self._orders + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def start_after(self, values):
+        return self._copy(start_after=values)
+
+    def _matches(self, path):
+        if self._group:
+            return path.split('/')[-2] == self._path
+        return path.rsplit('/', 1)[0] == self._path
+
+    def _value(self, path, data, field_path):
+        return path.rsplit('/', 1)[1] if field_path == '__name__' else get_path(data, field_path)
+
+    def _compare(self, left, right):
+        for (field_path, direction), a, b in zip(self._orders, left, right):
+            if a == b:
+                continue
+            # Missing and null values sort first, as in Firestore
+            if a is _MISSING or a is None:
+                result = -1
+            elif b is _MISSING or b is None:
+                result = 1
+            else:
+                result = -1 if a < b else 1
+            return -result if direction == 'DESCENDING' else result
+        return 0
+
+    def stream(self, transaction=None):
+        with self._client._lock:
+            documents = [(path, data) for path, data in self._client.documents.items() if self._matches(path)]
+        results = []
+        for path, data in documents:
+            if all(OPERATORS[op](self._value(path, data, field_path), value)
+                   for field_path, op, value in self._filters):
+                results.append((path, data))
+        # Ordered fields must exist, as with Firestore's indexes
+        ordered = [field_path for field_path, _ in self._orders if field_path != '__name__']
+        results = [(path, data) for path, data in results
+                   if all(get_path(data, field_path) is not _MISSING for field_path in ordered)]
+        keys = {path: [self._value(path, data, field_path) for field_path, _ in self._orders]
+                for path, data in results}
+        results.sort(key=functools.cmp_to_key(lambda a, b: self._compare(keys[a[0]], keys[b[0]]) or
+                                              (-1 if a[0] < b[0] else 1 if a[0] > b[0] else 0)))
+        if self._start_after is not None:
+            cursor = [self._start_after.get(field_path) for field_path, _ in self._orders]
+            results = [(path, data) for path, data in results if self._compare(keys[path], cursor) > 0]
+        if self._limit is not None:
+            results = results[:self._limit]
+        for path, data in results:
+            self._client.reads += 1
+            data = project(data, self._fields) if self._fields is not None else copy.deepcopy(data)
+            yield Snapshot(DocumentReference(self._client, path), data, self._client.update_times.get(path))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def count(self, alias=None):
+        return AggregationQuery(self).count(alias)
+
+    def sum(self, field_path, alias=None):
+        return AggregationQuery(self).sum(field_path, alias)
+
+    def avg(self, field_path, alias=None):
+        return AggregationQuery(self).avg(field_path, alias)
+
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+    """Aggregations over a query's matches; reads are counted as one query, as Firestore bills them"""
+
+    def __init__(self, query):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind, field_path, alias):
+        self._aggregations.append((kind, field_path, alias or f'field_{len(self._aggregations) + 1}'))
+        return self
+
+    def count(self, alias=None):
+        return self._add('count', None, alias)
+
+    def sum(self, field_path, alias=None):
+        return self._add('sum', field_path, alias)
+
+    def avg(self, field_path, alias=None):
+        return self._add('avg', field_path, alias)
+
+    def get(self, transaction=None):
+        client = self._query._client
+        reads = client.reads
+        documents = [snapshot.to_dict() for snapshot in self._query.stream()]
+        client.reads = reads + 1
+        row = []
+        for kind, field_path, alias in self._aggregations:
+            if kind == 'count':
+                row.append(AggregationResult(alias, len(documents)))
+                continue
+            # Missing and non-numeric values are skipped, as in Firestore
+            values = [value for value in (get_path(data, field_path) for data in documents)
+                      if isinstance(value, (int, float)) and not isinstance(value, bool)]
+            if kind == 'sum':
+                row.append(AggregationResult(alias, sum(values)))
+            else:
+                row.append(AggregationResult(alias, sum(values) / len(values) if values else None))
+        return [row]
+
+
+class CollectionReference(Query):
+    def __init__(self, client, path):
+        super().__init__(client, path)
+
+    @property
+    def id(self):
+        return self._path.rsplit('/', 1)[-1]
+
+    @property
+    def parent(self):
+        if '/' not in self._path:
+            return None
+        return DocumentReference(self._client, self._path.rsplit('/', 1)[0])
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, f'{self._path}/{document_id or self._client.new_id()}')
+
+
+class WriteOption:
+    def __init__(self, last_update_time=None, exists=None):
+        self.last_update_time = last_update_time
+        self.exists = exists
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def create(self, reference, data):
+        self._writes.append(('create', reference, data, False, None))
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(('set', reference, data, merge, None))
+
+    def update(self, reference, data, option=None):
+        self._writes.append(('update', reference, data, False, option))
+
+    def delete(self, reference, option=None):
+        self._writes.append(('delete', reference, None, False, option))
+
+    def commit(self):
+        self._client._commit(self._writes)
+        return []
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.documents = {}  # path -> data
+        self.update_times = {}  # path -> last write number
+        self.reads = 0
+        self.writes = 0
+        self.commits = 0
+        self._clock = itertools.count(1)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def new_id(self):
+        return f'auto{next(self._ids):016d}'
+
+    def collection(self, path):
+        return CollectionReference(self, path)
+
+    def collection_group(self, name):
+        return Query(self, name, group=True)
+
+    def document(self, path):
+        return DocumentReference(self, path)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def write_option(self, last_update_time=None, exists=None):
+        return WriteOption(last_update_time, exists)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield self._read(reference, field_paths)
+
+    def put(self, path, data):
+        """Seed a document without counting a write"""
+        with self._lock:
+            self.documents[path] = copy.deepcopy(data)
+            self.update_times[path] = next(self._clock)
+
+    def _read(self, reference, field_paths):
+        with self._lock:
+            self.reads += 1
+            data = self.documents.get(reference.path)
+            data = copy.deepcopy(data) if data is not None else None
+            update_time = self.update_times.get(reference.path)
+        if data is not None and field_paths is not None:
+            data = project(data, field_paths)
+        return Snapshot(reference, data, update_time)
+
+    def _commit(self, writes):
+        with self._lock:
+            # Preconditions first: a batch applies completely or not at all
+            for kind, reference, _, _, option in writes:
+                exists = reference.path in self.documents
+                if kind == 'create' and exists:
+                    raise AlreadyExists(f'Document already exists: {reference.path}')
+                if kind == 'update' and not exists:
+                    raise NotFound(f'No document to update: {reference.path}')
+                if option is not None and option.last_update_time is not None and \
+                        self.update_times.get(reference.path) != option.last_update_time:
+                    raise FailedPrecondition(f'Document changed: {reference.path}')
+            for kind, reference, data, merge, _ in writes:
+                path = reference.path
+                if kind == 'create' or (kind == 'set' and not merge):
+                    self.documents[path] = apply_set(data)
+                elif kind == 'set':
+                    apply_merge(self.documents.setdefault(path, {}), data)
+                elif kind == 'update':
+                    apply_update(self.documents[path], data)
+                else:
+                    self.documents.pop(path, None)
+                self.update_times[path] = next(self._clock)
+            self.writes += len(writes)
+            self.commits += 1
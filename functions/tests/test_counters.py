@@ -0,0 +1,38 @@
+"""Listings and detail views report the same live counts, reading all shards in one query"""
+CATEGORIES = ['devops', 'mobile', 'web']
+
+
+def seed(db):
+    for number, category_id in enumerate(CATEGORIES):
+        db.put(f'categories/{category_id}', {'name': category_id, 'coursesCount': 2})
+        db.put(f'categories/{category_id}/coursesCount_shards/{number}', {'count': number + 1})
+    db.put('courses/c1', {'title': 'Docker', 'isPublished': True, 'studentsCount': 10, 'lessons': []})
+    db.put('courses/c1/studentsCount_shards/3', {'count': 4})
+
+
+def test_category_listing_reads_shards_once(db, dispatch):
+    seed(db)
+
+    response, stats = dispatch('GET', '/categories/')
+
+    counts = {category['id']: category['coursesCount'] for category in response.get_json()['data']}
+    assert counts == {'devops': 3, 'mobile': 4, 'web': 5}
+    # One query for the categories and one collection-group query for every shard
+    assert stats.queries == 2
+
+
+def test_course_listing_matches_detail_view(db, auth, dispatch):
+    seed(db)
+
+    listing, _ = dispatch('GET', '/courses/')
+    detail, _ = dispatch('GET', '/courses/c1')
+    assert listing.get_json()['data'][0]['studentsCount'] == 14
+    assert detail.get_json()['data']['studentsCount'] == 14
+
+    # A new enroll shows up in both, not only in the detail view
+    response, _ = dispatch('POST', '/enrollments/enroll', headers=auth('u1'), json={'course_id': 'c1'})
+    assert response.status_code == 201
+    listing, _ = dispatch('GET', '/courses/')
+    detail, _ = dispatch('GET', '/courses/c1')
+    assert listing.get_json()['data'][0]['studentsCount'] == 15
+    assert detail.get_json()['data']['studentsCount'] == 15
@@ -0,0 +1,57 @@
+"""Course analytics come from aggregation queries, and only the instructor or an admin sees them"""
+COURSE_ID = 'docker-devops-009'
+
+
+def seed(db):
+    db.put(f'courses/{COURSE_ID}', {'title': 'Docker', 'isPublished': True, 'instructor': 'DevOps Engineer',
+                                     'instructor_id': 'teacher', 'lessons': []})
+    db.put('users/teacher', {'uid': 'teacher', 'role': 'instructor'})
+    db.put('users/boss', {'uid': 'boss', 'role': 'admin'})
+    db.put('users/u1', {'uid': 'u1', 'role': 'student'})
+    enrollments = [
+        ('u1', 'completed', 120, 5),
+        ('u2', 'completed', 90, 4),
+        ('u3', 'active', 30, None),
+        ('u4', 'active', 0, None),
+    ]
+    for user_id, status, time_spent, rating in enrollments:
+        data = {'user_id': user_id, 'course_id': COURSE_ID, 'status': status,
+                'progress': {'total_time_spent': time_spent}}
+        if rating is not None:
+            data['rating'] = rating
+        db.put(f'enrollments/{user_id}_{COURSE_ID}', data)
+    # Another course's enrollments are not counted
+    db.put('enrollments/u1_other', {'user_id': 'u1', 'course_id': 'other', 'status': 'completed',
+                                    'progress': {'total_time_spent': 999}, 'rating': 1})
+
+
+def test_instructor_gets_aggregated_stats(db, auth, dispatch):
+    seed(db)
+
+    response, stats = dispatch('GET', f'/courses/{COURSE_ID}/analytics', headers=auth('teacher'))
+
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['enrollments'] == 4
+    assert data['completed'] == 2
+    assert data['completion_rate'] == 0.5
+    assert data['reviews'] == 2
+    assert data['average_rating'] == 4.5
+    assert data['total_time_spent'] == 240
+    # Three aggregation queries, however many enrollments match, plus the catalog query
+    assert stats.queries == 4
+
+
+def test_admin_can_read_any_course_analytics(db, auth, dispatch):
+    seed(db)
+    response, _ = dispatch('GET', f'/courses/{COURSE_ID}/analytics', headers=auth('boss'))
+    assert response.status_code == 200
+
+
+def test_other_users_are_forbidden(db, auth, dispatch):
+    seed(db)
+    for uid in ('u1', 'stranger'):
+        response, _ = dispatch('GET', f'/courses/{COURSE_ID}/analytics', headers=auth(uid))
+        assert response.status_code == 403
+    response, _ = dispatch('GET', '/courses/missing/analytics', headers=auth('boss'))
+    assert response.status_code == 404
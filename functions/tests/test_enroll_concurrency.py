@@ -0,0 +1,73 @@
+"""Enrolls write in one commit, and simultaneous ones for a user and course create one enrollment"""
+import threading
+
+from models.course import students_counter
+
+COURSE_ID = 'docker-devops-009'
+REQUESTS = 16
+
+
+def test_concurrent_enrolls_create_one_enrollment(db, auth, app, monkeypatch):
+    db.put(f'courses/{COURSE_ID}', {'title': 'Docker', 'isPublished': True, 'studentsCount': 0, 'lessons': []})
+    db.put('users/u1', {'uid': 'u1', 'email': 'u1@example.com', 'enrollment_count': 0})
+
+    # Hold every write until all requests have done their reads, so each one
+    # passes the already-enrolled check and only create()'s precondition can stop it
+    barrier = threading.Barrier(REQUESTS, timeout=10)
+    commit = db._commit
+
+    def racing_commit(writes):
+        barrier.wait()
+        commit(writes)
+
+    monkeypatch.setattr(db, '_commit', racing_commit)
+
+    statuses = []
+    lock = threading.Lock()
+
+    def enroll():
+        response = app.test_client().post('/enrollments/enroll', headers=auth('u1'),
+                                          json={'course_id': COURSE_ID})
+        with lock:
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=enroll) for _ in range(REQUESTS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] + [400] * (REQUESTS - 1)
+    enrollments = [path for path in db.documents if path.startswith('enrollments/')]
+    assert enrollments == [f'enrollments/u1_{COURSE_ID}']
+    assert students_counter.total(COURSE_ID) == 1
+    assert db.documents['users/u1']['enrollment_count'] == 1
+
+
+def test_enroll_is_one_commit(db, auth, dispatch):
+    db.put(f'courses/{COURSE_ID}', {'title': 'Docker', 'isPublished': True, 'studentsCount': 0, 'lessons': []})
+    db.put('users/u1', {'uid': 'u1', 'email': 'u1@example.com', 'enrollment_count': 0})
+    reads = db.reads
+
+    response, _ = dispatch('POST', '/enrollments/enroll', headers=auth('u1'), json={'course_id': COURSE_ID})
+
+    assert response.status_code == 201
+    # Only the course lookup reads; create()'s precondition is the duplicate check
+    assert db.reads - reads == 1
+    assert db.commits == 1
+    assert db.documents['users/u1']['enrollment_count'] == 1
+
+    response, _ = dispatch('POST', '/enrollments/enroll', headers=auth('u1'), json={'course_id': COURSE_ID})
+    assert response.status_code == 400
+    assert response.get_json()['enrollment']['enrollment_id'] == f'u1_{COURSE_ID}'
+
+
+def test_enroll_without_profile_creates_no_user_document(db, auth, dispatch):
+    db.put(f'courses/{COURSE_ID}', {'title': 'Docker', 'isPublished': True, 'studentsCount': 0, 'lessons': []})
+
+    response, _ = dispatch('POST', '/enrollments/enroll', headers=auth('u2'), json={'course_id': COURSE_ID})
+
+    assert response.status_code == 201
+    assert 'users/u2' not in db.documents
+    assert f'enrollments/u2_{COURSE_ID}' in db.documents
+    assert students_counter.total(COURSE_ID) == 1
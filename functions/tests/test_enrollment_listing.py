@@ -0,0 +1,60 @@
+"""Firestore reads made by the enrollment listings: one per enrollment, one per distinct course"""
+from datetime import datetime, timedelta
+
+COURSES = ['docker-devops-009', 'flutter-basics-001', 'react-native-003']
+
+
+def seed(db, enrollments_per_course, user_id='u1'):
+    for course_id in COURSES:
+        db.put(f'courses/{course_id}', {'title': course_id, 'isPublished': True, 'lessons': []})
+    start = datetime(2025, 1, 1)
+    count = 0
+    for course_id in COURSES:
+        for number in range(enrollments_per_course):
+            owner = user_id if number == 0 else f'other{number}'
+            enrollment_id = f'{owner}_{course_id}'
+            db.put(f'enrollments/{enrollment_id}', {
+                'enrollment_id': enrollment_id,
+                'user_id': owner,
+                'course_id': course_id,
+                'enrolled_at': start + timedelta(minutes=count),
+                'status': 'active'
+            })
+            count += 1
+    return count
+
+
+def test_user_enrollments_read_each_course_once(db, auth, dispatch):
+    seed(db, enrollments_per_course=5)
+
+    response, stats = dispatch('GET', '/enrollments/', headers=auth('u1'))
+
+    assert response.status_code == 200
+    enrollments = response.get_json()['enrollments']
+    assert len(enrollments) == len(COURSES)
+    assert all(enrollment['course']['title'] == enrollment['course_id'] for enrollment in enrollments)
+    # One query for the enrollments, then one batched read of their courses
+    assert stats.queries == 1
+    assert stats.reads == len(enrollments) + len(COURSES)
+
+
+def test_all_enrollments_read_each_course_once(db, dispatch):
+    total = seed(db, enrollments_per_course=20)
+
+    response, stats = dispatch('GET', '/enrollments/all?limit=50')
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 50
+    assert body['next_cursor']
+    assert all(enrollment['course'] for enrollment in body['data'])
+    # The page query reads one extra document to detect the next page; each
+    # distinct course is then read once, however many enrollments share it
+    courses = {enrollment['course_id'] for enrollment in body['data']}
+    assert stats.queries == 1
+    assert stats.reads == 51 + len(courses)
+    assert db.reads == stats.reads
+
+    response, stats = dispatch('GET', f"/enrollments/all?limit=50&cursor={body['next_cursor']}")
+    assert response.get_json()['count'] == total - 50
+    assert stats.reads == total - 50 + len({enrollment['course_id'] for enrollment in response.get_json()['data']})
@@ -0,0 +1,33 @@
+"""The committed firestore.indexes.json covers the catalog queries the API accepts, and only those"""
+import json
+
+import pytest
+
+import generate_indexes
+from models.course import Course
+from models.query import InvalidQuery
+
+
+def test_committed_indexes_are_current():
+    with open(generate_indexes.INDEXES_FILE, encoding='utf-8') as f:
+        committed = json.load(f)['indexes']
+    assert committed == generate_indexes.build_indexes()
+
+
+def test_equality_filters_use_merged_indexes():
+    query = Course.catalog_query({'category': 'a,b', 'difficulty': 'a', 'sort': '-rating'})
+    # One (field, rating) index per equality filter rather than one for the combination
+    assert [[field['fieldPath'] for field in index['fields']] for index in query.indexes()] == [
+        ['category', 'rating'], ['difficulty', 'rating'], ['isPublished', 'rating']]
+
+
+def test_range_filters_share_one_field_with_the_sort():
+    assert Course.catalog_query({'min_price': '5', 'max_price': '20', 'sort': '-price'}) is not None
+    for args in ({'min_price': '5', 'min_rating': '4'}, {'min_rating': '4', 'sort': 'price'}):
+        with pytest.raises(InvalidQuery):
+            Course.catalog_query(args)
+
+
+def test_rejected_catalog_query_is_a_bad_request(dispatch, db):
+    response, _ = dispatch('GET', '/courses/?min_rating=4&sort=price')
+    assert response.status_code == 400
@@ -0,0 +1,109 @@
+"""Progress events survive Firestore errors while being flushed"""
+from google.api_core.exceptions import ServiceUnavailable
+
+from models.progress_buffer import ProgressBuffer
+
+COURSE_ID = 'c1'
+ENROLLMENT_ID = f'u1_{COURSE_ID}'
+
+
+def seed(db):
+    db.put(f'courses/{COURSE_ID}', {'title': 'Course', 'lessons': [
+        {'id': 'l1', 'order': 1}, {'id': 'l2', 'order': 2}]})
+    db.put(f'enrollments/{ENROLLMENT_ID}', {'user_id': 'u1', 'course_id': COURSE_ID, 'status': 'active',
+                                            'progress': {'completed_lessons': [], 'total_time_spent': 0}})
+
+
+def fail_once(monkeypatch, target, name):
+    original = getattr(target, name)
+    calls = []
+
+    def failing(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ServiceUnavailable('try again')
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(target, name, failing)
+
+
+def test_failed_read_keeps_events_for_next_flush(db, monkeypatch):
+    seed(db)
+    buffer = ProgressBuffer(flush_interval=3600)
+    buffer.add(ENROLLMENT_ID, 'l1', 5)
+    with monkeypatch.context() as patch:
+        # Every read attempt of the first flush fails
+        patch.setattr(db, 'get_all', lambda *args, **kwargs: (_ for _ in ()).throw(ServiceUnavailable('down')))
+        assert buffer.flush() == 0
+    assert buffer.pending(ENROLLMENT_ID) is not None
+    assert buffer.stats()['failed_writes'] == 1
+
+    assert buffer.flush() == 1
+    progress = db.documents[f'enrollments/{ENROLLMENT_ID}']['progress']
+    assert progress['completed_lessons'] == ['l1']
+    assert progress['total_time_spent'] == 5
+    assert progress['completion_percentage'] == 50.0
+
+
+def test_transient_read_error_is_retried_within_a_flush(db, monkeypatch):
+    seed(db)
+    buffer = ProgressBuffer(flush_interval=3600)
+    buffer.add(ENROLLMENT_ID, 'l1', 5)
+    fail_once(monkeypatch, db, 'get_all')
+
+    assert buffer.flush() == 1
+    assert buffer.pending(ENROLLMENT_ID) is None
+    assert db.documents[f'enrollments/{ENROLLMENT_ID}']['progress']['completed_lessons'] == ['l1']
+
+
+def test_unbuffered_write_fails_the_request(db, auth, dispatch, monkeypatch):
+    seed(db)
+    with monkeypatch.context() as patch:
+        patch.setattr(db, 'get_all', lambda *args, **kwargs: (_ for _ in ()).throw(ServiceUnavailable('down')))
+        response, _ = dispatch('PUT', f'/enrollments/{ENROLLMENT_ID}/progress', headers=auth('u1'),
+                               json={'lesson_id': 'l1', 'time_spent': 5})
+
+    # Nothing was acknowledged that is not stored
+    assert response.status_code == 500
+    assert db.documents[f'enrollments/{ENROLLMENT_ID}']['progress']['completed_lessons'] == []
+
+    response, _ = dispatch('PUT', '/enrollments/u1_missing/progress', headers=auth('u1'),
+                           json={'lesson_id': 'l1'})
+    assert response.status_code == 404
+
+
+def test_lesson_event_writes_and_returns_stored_progress(db, auth, dispatch):
+    seed(db)
+    db.documents[f'enrollments/{ENROLLMENT_ID}']['progress'].update(completed_lessons=['l1'], total_time_spent=10)
+
+    response, _ = dispatch('PUT', f'/enrollments/{ENROLLMENT_ID}/progress', headers=auth('u1'),
+                           json={'lesson_id': 'l2', 'time_spent': 5})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['pending']['completed_lessons'] == ['l2']
+    assert body['progress']['completed_lessons'] == ['l1', 'l2']
+    assert body['progress']['current_lesson'] == 2
+    assert body['progress']['completion_percentage'] == 100.0
+    assert body['progress']['total_time_spent'] == 15
+    stored = db.documents[f'enrollments/{ENROLLMENT_ID}']
+    assert stored['progress']['current_lesson'] == 2
+    assert stored['status'] == 'completed'
+
+
+def test_completion_counts_lessons_whatever_their_order(db, auth, dispatch):
+    # Missing, repeated and non-integer orders still give each lesson its own bit
+    db.put(f'courses/{COURSE_ID}', {'title': 'Course', 'lessons': [
+        {'id': 'l1', 'order': 1}, {'id': 'l2', 'order': 1}, {'id': 'l3', 'order': '3'}, {'id': 'l4'}]})
+    db.put(f'enrollments/{ENROLLMENT_ID}', {'user_id': 'u1', 'course_id': COURSE_ID, 'status': 'active',
+                                            'progress': {'completed_lessons': ['l1', 'l2'], 'total_time_spent': 0}})
+
+    response, _ = dispatch('PUT', f'/enrollments/{ENROLLMENT_ID}/progress', headers=auth('u1'),
+                           json={'lesson_id': 'l3'})
+    assert response.get_json()['progress']['completion_percentage'] == 75.0
+    assert db.documents[f'enrollments/{ENROLLMENT_ID}']['status'] == 'active'
+
+    response, _ = dispatch('PUT', f'/enrollments/{ENROLLMENT_ID}/progress', headers=auth('u1'),
+                           json={'lesson_id': 'l4'})
+    assert response.get_json()['progress']['completion_percentage'] == 100.0
+    assert db.documents[f'enrollments/{ENROLLMENT_ID}']['status'] == 'completed'
@@ -0,0 +1,50 @@
+"""The Cloud Function's route table picks the same handler as Flask for every path"""
+import pytest
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import RequestRedirect
+
+from routes.router import Router
+
+REQUESTS = [
+    ('GET', '/'),
+    ('GET', '/health'),
+    ('GET', '/courses'),
+    ('GET', '/courses/'),
+    ('GET', '/courses/search'),
+    ('GET', '/courses/flutter-basics-001'),
+    ('GET', '/courses/flutter-basics-001/'),
+    ('GET', '/courses/flutter-basics-001/related'),
+    ('GET', '/courses/flutter-basics-001/analytics'),
+    # A course ID that is also a static segment still reaches the parameter rule
+    ('GET', '/courses/search/related'),
+    ('GET', '/enrollments/check/flutter-basics-001'),
+    ('PUT', '/enrollments/u1_flutter-basics-001/progress'),
+    ('PUT', '/enrollments/u1_flutter-basics-001/complete'),
+    ('PUT', '/enrollments/u1_flutter-basics-001/review'),
+    ('GET', '/enrollments/u1_flutter-basics-001/progress'),
+    ('PUT', '/enrollments/u1_flutter-basics-001/progress/extra'),
+    ('GET', '/courses/flutter-basics-001/unknown'),
+    ('GET', '/does/not/exist'),
+]
+
+
+def flask_match(app, method, path):
+    adapter = app.url_map.bind('localhost')
+    try:
+        endpoint, view_args = adapter.match(path, method)
+    except RequestRedirect as redirect:
+        return flask_match(app, method, redirect.new_url.split('localhost', 1)[1])
+    except (NotFound, MethodNotAllowed):
+        return None
+    return endpoint, view_args
+
+
+@pytest.mark.parametrize('method, path', REQUESTS)
+def test_router_matches_flask(app, method, path):
+    assert Router.from_app(app).match(method, path) == flask_match(app, method, path)
+
+
+def test_empty_segments_do_not_match_parameters(app):
+    router = Router.from_app(app)
+    assert router.match('GET', '/courses//related') is None
+    assert router.match('PUT', '/enrollments//progress') is None
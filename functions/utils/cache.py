@@ -0,0 +1,130 @@
+"""Small in-process caches shared by the request handlers.
+
+Each Cloud Functions instance keeps its own copy, so nothing here is shared
+across instances and everything must be safe to lose on a cold start.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Bounded LRU cache where every entry carries its own expiry time"""
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # default lifetime in seconds for entries set without expires_at
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, stored_at, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expires_at=None, size=0):
+        """Store a value until the given epoch time (or until evicted)"""
+        now = time.time()
+        if expires_at is None and self.ttl is not None:
+            expires_at = now + self.ttl
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, expires_at, now, size)
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self.total_bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted[3]
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def delete_prefix(self, prefix):
+        """Drop every entry whose string key starts with prefix"""
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[3]
+
+    def stats(self):
+        """Hit/miss counters and entry ages (seconds) for monitoring"""
+        now = time.time()
+        with self._lock:
+            ages = [now - entry[2] for entry in self._entries.values()]
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(ages),
+            'max_entries': self.max_entries,
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'oldest_age': max(ages) if ages else 0.0,
+            'newest_age': min(ages) if ages else 0.0
+        }
+
+
+def estimate_size(value):
+    """Approximate memory footprint of a JSON-like value, by its encoded length"""
+    return len(json.dumps(value, default=str, ensure_ascii=False))
+
+
+# Published courses and categories; invalidated by writes on this instance
+catalog_cache = LRUCache(
+    max_entries=64,
+    max_bytes=int(os.environ.get('CATALOG_CACHE_MAX_BYTES', 8 * 1024 * 1024)),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', 300))
+)
+
+# Per-course lesson indexes for progress events; kept apart so they never evict the catalog
+lesson_cache = LRUCache(
+    max_entries=int(os.environ.get('LESSON_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('LESSON_CACHE_TTL', 300))
+)
+
+# Stored course neighbours for recommendations; refreshed on this instance by the scheduled job
+recommendation_cache = LRUCache(
+    max_entries=int(os.environ.get('RECOMMENDATION_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('RECOMMENDATION_CACHE_TTL', 300))
+)
+
+# Unreconciled sharded-counter sums; other instances' increments show up after the TTL
+counter_cache = LRUCache(
+    max_entries=int(os.environ.get('COUNTER_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('COUNTER_CACHE_TTL', 30))
+)
+
+# Per-course enrollment analytics from aggregation queries; other instances' writes show up after the TTL
+analytics_cache = LRUCache(
+    max_entries=int(os.environ.get('ANALYTICS_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', 300))
+)
@@ -0,0 +1,52 @@
+"""Accept-Encoding negotiated response compression.
+
+gzip is always available; brotli is used when the `brotli` package is
+installed and the client prefers it.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves
+MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5))
+
+SUPPORTED_ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes with 'gzip' or 'br'"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY if level is None else level)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL if level is None else level)
+
+
+def compress_response(response, accept_encodings):
+    """Compress a Flask response in place when the client accepts it and it is worth it"""
+    if (response.status_code in (204, 304) or response.is_streamed
+            or response.direct_passthrough or 'Content-Encoding' in response.headers):
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_BYTES:
+        return response
+
+    # Body could be encoded differently for other clients, so shared caches must key on it
+    response.vary.add('Accept-Encoding')
+
+    encoding = accept_encodings.best_match(SUPPORTED_ENCODINGS)
+    if encoding is None:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # Each encoding is a distinct representation and needs its own strong ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
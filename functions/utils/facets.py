@@ -0,0 +1,108 @@
+"""Precomputed facet counts over an in-memory list of documents.
+
+Each facet value keeps the set of document positions that carry it: a
+Python int used as a bitmap for common values, or a tuple of positions for
+rare ones (a bitmap costs size/8 bytes however few bits are set). Counting
+a value under the active filters is a bitmap AND plus popcount, with no pass
+over the documents themselves.
+
+Filters OR together within a facet and AND across facets. Each facet's own
+counts ignore that facet's filter, so the UI can show what selecting
+another value would add.
+"""
+import threading
+
+# A value is stored as positions when it is on fewer than 1 in this many documents
+SPARSE_RATIO = 256
+
+
+class FacetIndex:
+    def __init__(self, facets):
+        self.facets = facets  # facet name -> function(document) -> value or None
+        self._lock = threading.Lock()
+        self._synced = None
+        self._size = 0
+        self._all = 0
+        self._members = {name: {} for name in facets}  # facet -> {value: bitmap int or positions}
+
+    def __len__(self):
+        return self._size
+
+    def sync(self, documents):
+        """Rebuild from `documents` unless it is the same list object as last time"""
+        if documents is self._synced:
+            return False
+        size = len(documents)
+        positions = {name: {} for name in self.facets}
+        for position, document in enumerate(documents):
+            for name, value_of in self.facets.items():
+                value = value_of(document)
+                if value is not None and value != '':
+                    positions[name].setdefault(value, []).append(position)
+
+        members = {}
+        for name, values in positions.items():
+            members[name] = {}
+            for value, value_positions in values.items():
+                if len(value_positions) * SPARSE_RATIO < size:
+                    members[name][value] = tuple(value_positions)
+                else:
+                    members[name][value] = _bitmap(value_positions, size)
+
+        with self._lock:
+            self._members = members
+            self._size = size
+            self._all = (1 << size) - 1
+            self._synced = documents
+        return True
+
+    def counts(self, filters=None):
+        """(matching total, {facet: [{'value', 'count'}, ...]}) under `filters` ({facet: [values]})"""
+        filters = filters or {}
+        for name in filters:
+            if name not in self.facets:
+                raise ValueError(f'Unknown facet: {name}')
+        with self._lock:
+            members, size, everything = self._members, self._size, self._all
+
+        masks = {}
+        for name, values in filters.items():
+            mask = 0
+            for value in values:
+                value_members = members[name].get(value)
+                if value_members is not None:
+                    mask |= value_members if isinstance(value_members, int) else _bitmap(value_members, size)
+            masks[name] = mask
+
+        facets = {}
+        for name, values in members.items():
+            base = everything
+            for other, mask in masks.items():
+                if other != name:
+                    base &= mask
+            base_bytes = None
+            counts = []
+            for value, value_members in values.items():
+                if isinstance(value_members, int):
+                    count = (value_members & base).bit_count()
+                elif base == everything:
+                    count = len(value_members)
+                else:
+                    if base_bytes is None:
+                        base_bytes = base.to_bytes((size + 7) // 8, 'little')
+                    count = sum(base_bytes[position >> 3] >> (position & 7) & 1 for position in value_members)
+                counts.append({'value': value, 'count': count})
+            counts.sort(key=lambda item: (-item['count'], str(item['value'])))
+            facets[name] = counts
+
+        total = everything
+        for mask in masks.values():
+            total &= mask
+        return total.bit_count(), facets
+
+
+def _bitmap(positions, size):
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
@@ -0,0 +1,50 @@
+"""HTTP caching for public read endpoints.
+
+Views are wrapped directly (rather than handled in after_request) so the
+policy applies both in the Flask app and when the `api` Cloud Function calls
+the view through the route table.
+"""
+import functools
+import hashlib
+
+from flask import current_app, request
+
+
+def content_etag(data):
+    """Strong ETag for a response body"""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def etag_matches(if_none_match, etag):
+    """True if If-None-Match names this body, in any content encoding (see utils/compression.py)"""
+    if if_none_match.star_tag:
+        return True
+    return any(tag == etag or tag.startswith(etag + '-') for tag in if_none_match)
+
+
+def cache_control(max_age=60, s_maxage=None, stale_while_revalidate=None):
+    """Add a public Cache-Control policy and ETag, answering If-None-Match with 304"""
+    directives = ['public', f'max-age={max_age}']
+    if s_maxage is not None:
+        directives.append(f's-maxage={s_maxage}')
+    if stale_while_revalidate is not None:
+        directives.append(f'stale-while-revalidate={stale_while_revalidate}')
+    header = ', '.join(directives)
+
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code != 200 or request.method not in ('GET', 'HEAD'):
+                return response
+
+            etag = content_etag(response.get_data())
+            if etag_matches(request.if_none_match, etag):
+                response = current_app.response_class(status=304)
+            response.headers['Cache-Control'] = header
+            response.set_etag(etag)
+            return response
+
+        return decorated_function
+
+    return decorator
@@ -0,0 +1,85 @@
+"""JSON encoding shared by the Flask app, the `api` function and the export script.
+
+Uses orjson when it is installed and the standard library otherwise. Every
+datetime is written as ISO 8601 in UTC with a 'Z' suffix (naive values are
+assumed to be UTC, matching the datetime.utcnow() timestamps in the models).
+"""
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, timezone
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def format_datetime(value):
+    """The single datetime format used on the wire"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    else:
+        value = value.astimezone(timezone.utc)
+    # Drop subclasses such as Firestore's DatetimeWithNanoseconds
+    value = datetime(value.year, value.month, value.day, value.hour, value.minute,
+                     value.second, value.microsecond)
+    return value.isoformat() + 'Z'
+
+
+def _default(o):
+    """Encode values neither backend handles natively"""
+    if isinstance(o, datetime):
+        return format_datetime(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, 'to_dict'):
+        return o.to_dict()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def stdlib_dumps(obj, pretty=False):
+    """Serialize to UTF-8 JSON bytes with the standard library"""
+    if pretty:
+        text = json.dumps(obj, default=_default, sort_keys=True, indent=2, ensure_ascii=False)
+    else:
+        text = json.dumps(obj, default=_default, sort_keys=True, separators=(',', ':'),
+                          ensure_ascii=False)
+    return text.encode('utf-8')
+
+
+if orjson:
+    # Route every datetime through _default so orjson and the fallback agree
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj, pretty=False):
+        """Serialize to UTF-8 JSON bytes"""
+        option = _OPTIONS | orjson.OPT_INDENT_2 if pretty else _OPTIONS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    loads = orjson.loads
+else:
+    dumps = stdlib_dumps
+    loads = json.loads
+
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by dumps()/loads() above"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        # Hand the encoded bytes straight to the response, no str round trip
+        return self._app.response_class(dumps(obj), mimetype='application/json')
@@ -0,0 +1,104 @@
+"""Cursor-based pagination on top of Firestore order_by + start_after.
+
+Cursors are opaque to clients: a URL-safe base64 encoding of the last
+document's order-by values and ID.
+"""
+import base64
+import json
+from datetime import datetime
+
+from flask import request
+
+from models.db import stream_query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for a malformed `limit` or `cursor` query parameter"""
+
+
+def page_size(limit=None):
+    """Clamp a requested page size to the hard cap"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def get_page_args():
+    """Read (limit, cursor) from the query string; both are None when absent"""
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise InvalidPageRequest('limit must be an integer')
+    return limit, request.args.get('cursor') or None
+
+
+def wants_page():
+    """True when the client asked for paginated results"""
+    return 'limit' in request.args or 'cursor' in request.args
+
+
+def encode_cursor(values):
+    encoded = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {'$dt': value.isoformat()}
+        encoded.append(value)
+    payload = json.dumps(encoded, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidPageRequest('Invalid cursor')
+    if not isinstance(values, list):
+        raise InvalidPageRequest('Invalid cursor')
+
+    decoded = []
+    for value in values:
+        if isinstance(value, dict) and '$dt' in value:
+            value = datetime.fromisoformat(value['$dt'])
+        decoded.append(value)
+    return decoded
+
+
+def fetch_page(query, limit=None, cursor=None, order_by=None, direction='ASCENDING'):
+    """Run one page of a query ordered by `order_by` (optional) and document ID.
+
+    `order_by` is a field sorted in `direction`, or a list of (field, direction)
+    pairs. Returns (snapshots, next_cursor); next_cursor is None on the last page.
+    """
+    limit = page_size(limit)
+    if isinstance(order_by, str):
+        orders = [(order_by, direction)]
+    else:
+        orders = [(field, field_direction) for field, field_direction in order_by or [] if field != '__name__']
+        if orders:
+            direction = orders[-1][1]
+    fields = [field for field, _ in orders]
+    for field, field_direction in orders:
+        query = query.order_by(field, direction=field_direction)
+    # Document ID breaks ties so every cursor position is unique
+    query = query.order_by('__name__', direction=direction)
+
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(fields) + 1:
+            raise InvalidPageRequest('Invalid cursor')
+        query = query.start_after(dict(zip(fields + ['__name__'], values)))
+
+    # One extra document tells us whether another page exists
+    docs = list(stream_query(query.limit(limit + 1)))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor([last.get(field) for field in fields] + [last.id])
+    return docs, next_cursor
@@ -0,0 +1,309 @@
+"""In-memory full-text index with BM25 ranking.
+
+Text is folded before it is indexed or searched: lower-cased, with accents
+stripped and đ mapped to d, so "hoa" finds "hóa" and "ung dung" finds
+"ứng dụng". Query terms also match as prefixes of indexed terms, which is
+what a search-as-you-type box sends.
+
+Documents are indexed by ID and can be added, replaced or removed one at a
+time; sync() brings the index in line with a fresh list of documents by
+re-tokenizing only the ones whose text changed. Each document is kept
+alongside its postings and handed back with its score.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+# Score multiplier for a prefix hit relative to a whole-word hit
+PREFIX_WEIGHT = 0.5
+# Most terms one query term expands to; keeps one-letter prefixes cheap
+MAX_PREFIX_EXPANSIONS = 50
+
+# Recompute length normalization once the average document length has drifted this far
+LENGTH_DRIFT = 0.05
+
+_TOKEN = re.compile(r'\w+')
+_COMBINING = re.compile(r'[\u0300-\u036f]+')
+# đ/Đ have no Unicode decomposition, so NFD alone leaves them alone
+_FOLD_TABLE = str.maketrans({'đ': 'd', 'Đ': 'd'})
+
+
+def fold(text):
+    """Lower-case and strip diacritics"""
+    if text.isascii():
+        return text.lower()
+    return _COMBINING.sub('', unicodedata.normalize('NFD', text.translate(_FOLD_TABLE))).lower()
+
+
+def tokenize(text):
+    return _TOKEN.findall(fold(text or ''))
+
+
+class SearchIndex:
+    """Inverted index over named text fields, each with its own BM25 weight.
+
+    Postings map each term to {doc number: weighted term frequency}. Queries
+    use the threshold algorithm: each query term's postings are walked in
+    descending score order (a ranked list built on first use), other terms
+    are looked up directly, and the walk stops once nothing unseen can beat
+    the current top results. Common terms therefore cost about as much as
+    rare ones.
+    """
+
+    def __init__(self, field_weights):
+        self.field_weights = field_weights  # field name -> weight
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}  # term -> {doc number: weighted term frequency}
+        self._ranked = {}  # term -> doc numbers by descending score, built on demand
+        self._terms = []  # sorted vocabulary, for prefix lookups
+        self._doc_ids = []  # doc number -> doc ID (None once removed)
+        self._numbers = {}  # doc ID -> doc number
+        self._fields = {}  # doc number -> indexed field values, to detect changes
+        self._documents = {}  # doc number -> document returned by search()
+        self._doc_terms = {}  # doc number -> terms, for removal
+        self._lengths = {}  # doc number -> weighted length
+        self._norms = {}  # doc number -> BM25 length normalization
+        self._frequencies = {}  # interned frequency values; most documents share a few
+        self._total_length = 0.0
+        self._normed_length = None  # average length the norms were computed against
+        self._synced = None
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def _norm(self, length):
+        return K1 * (1 - B + B * length / (self._normed_length or length or 1.0))
+
+    def _add(self, doc_id, fields, document, new_terms=None):
+        number = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._numbers[doc_id] = number
+        self._fields[number] = fields
+        self._documents[number] = document
+
+        frequencies = {}
+        length = 0.0
+        for name, weight in self.field_weights.items():
+            for term in tokenize(fields.get(name)):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+                length += weight
+        interned = self._frequencies
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if new_terms is None:
+                    bisect.insort(self._terms, term)
+                else:
+                    new_terms.append(term)
+            postings[number] = interned.setdefault(frequency, frequency)
+            self._ranked.pop(term, None)
+        self._doc_terms[number] = tuple(frequencies)
+        self._lengths[number] = length
+        self._norms[number] = self._norm(length)
+        self._total_length += length
+
+    def _remove(self, doc_id):
+        number = self._numbers.pop(doc_id, None)
+        if number is None:
+            return
+        self._doc_ids[number] = None
+        del self._fields[number]
+        del self._documents[number]
+        del self._norms[number]
+        self._total_length -= self._lengths.pop(number)
+        for term in self._doc_terms.pop(number):
+            postings = self._postings[term]
+            del postings[number]
+            self._ranked.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                # Terms first seen in a sync still running are not in the vocabulary yet
+                position = bisect.bisect_left(self._terms, term)
+                if position < len(self._terms) and self._terms[position] == term:
+                    del self._terms[position]
+
+    def _upsert(self, doc_id, fields, document, new_terms=None):
+        """Index a document unless its text is unchanged; True if it was (re)indexed"""
+        number = self._numbers.get(doc_id)
+        if number is not None:
+            if self._fields[number] == fields:
+                self._documents[number] = document
+                return False
+            self._remove(doc_id)
+        self._add(doc_id, fields, document, new_terms)
+        return True
+
+    def upsert(self, doc_id, fields, document=None):
+        """Index a document, replacing any earlier version of it"""
+        with self._lock:
+            self._upsert(doc_id, fields, doc_id if document is None else document)
+            self._renormalize_if_drifted()
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+            self._renormalize_if_drifted()
+
+    def sync(self, documents, extract):
+        """Make the index hold exactly `documents`; extract(document) gives (doc_id, fields).
+
+        Only documents that are new, changed or gone are re-indexed. Calling
+        it again with the very same list object is free.
+        """
+        if documents is self._synced:
+            return 0
+        changed = 0
+        with self._lock:
+            seen = set()
+            # New vocabulary is sorted in once at the end rather than inserted term by term
+            new_terms = []
+            for document in documents:
+                doc_id, fields = extract(document)
+                seen.add(doc_id)
+                if self._upsert(doc_id, fields, document, new_terms):
+                    changed += 1
+            for doc_id in [doc_id for doc_id in self._numbers if doc_id not in seen]:
+                self._remove(doc_id)
+                changed += 1
+            if new_terms:
+                self._terms = sorted(set(self._terms).union(new_terms).intersection(self._postings))
+            self._compact()
+            self._renormalize_if_drifted()
+            self._synced = documents
+        return changed
+
+    def _renormalize_if_drifted(self):
+        average = self._total_length / len(self._numbers) if self._numbers else 0.0
+        if self._normed_length and abs(average - self._normed_length) <= LENGTH_DRIFT * self._normed_length:
+            return
+        self._normed_length = average or None
+        for number, length in self._lengths.items():
+            self._norms[number] = self._norm(length)
+        self._ranked.clear()
+
+    def _compact(self):
+        """Renumber documents once removals have left too many holes"""
+        if len(self._doc_ids) < 2 * len(self._numbers) + 64:
+            return
+        documents = [(doc_id, self._fields[number], self._documents[number])
+                     for doc_id, number in self._numbers.items()]
+        synced, normed_length = self._synced, self._normed_length
+        self._reset()
+        self._synced, self._normed_length = synced, normed_length
+        new_terms = []
+        for doc_id, fields, document in documents:
+            self._add(doc_id, fields, document, new_terms)
+        self._terms = sorted(new_terms)
+
+    def _expand(self, term):
+        """(indexed term, weight) pairs a query term matches: itself, then prefix hits"""
+        matches = []
+        if term in self._postings:
+            matches.append((term, 1.0))
+        start = bisect.bisect_left(self._terms, term)
+        for indexed in self._terms[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+            if not indexed.startswith(term):
+                break
+            if indexed != term:
+                matches.append((indexed, PREFIX_WEIGHT))
+        return matches
+
+    def _ranked_list(self, term):
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            postings, norms = self._postings[term], self._norms
+            ranked = self._ranked[term] = sorted(
+                postings, key=lambda number: -postings[number] / (postings[number] + norms[number]))
+        return ranked
+
+    @staticmethod
+    def _idf(count, document_frequency):
+        return math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def _sorted_access(self, term, factor):
+        """(score, doc number) for one indexed term, best first"""
+        postings, norms = self._postings[term], self._norms
+        factor *= K1 + 1
+        for number in self._ranked_list(term):
+            frequency = postings[number]
+            yield factor * frequency / (frequency + norms[number]), number
+
+    def search(self, query, limit=20):
+        """Best-matching (document, score) pairs, highest score first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit < 1:
+            return []
+        with self._lock:
+            count = len(self._numbers)
+            if not count:
+                return []
+            norms = self._norms
+
+            # Per query term: [(postings, idf * weight)] over the indexed terms it matches
+            sources = []
+            for term in terms:
+                matches = []
+                iterators = []
+                for indexed, weight in self._expand(term):
+                    postings = self._postings[indexed]
+                    factor = weight * self._idf(count, len(postings))
+                    matches.append((postings, factor))
+                    iterators.append(self._sorted_access(indexed, factor))
+                if matches:
+                    # A query term scores each document once, by its best-matching indexed term
+                    merged = iterators[0] if len(iterators) == 1 else heapq.merge(
+                        *iterators, key=lambda item: -item[0])
+                    sources.append((matches, merged))
+            if not sources:
+                return []
+
+            def score(number):
+                total = 0.0
+                for matches, _ in sources:
+                    best = 0.0
+                    for postings, factor in matches:
+                        frequency = postings.get(number)
+                        if frequency:
+                            value = factor * frequency * (K1 + 1) / (frequency + norms[number])
+                            if value > best:
+                                best = value
+                    total += best
+                return total
+
+            top = []  # min-heap of (score, doc number)
+            seen = set()
+            frontier = [None] * len(sources)
+            active = list(range(len(sources)))
+            while active:
+                for position in list(active):
+                    item = next(sources[position][1], None)
+                    if item is None:
+                        frontier[position] = 0.0
+                        active.remove(position)
+                        continue
+                    frontier[position], number = item
+                    if number in seen:
+                        continue
+                    seen.add(number)
+                    entry = (score(number), number)
+                    if len(top) < limit:
+                        heapq.heappush(top, entry)
+                    elif entry > top[0]:
+                        heapq.heapreplace(top, entry)
+                # Nothing not yet seen can score above the sum of the current positions
+                if len(top) == limit and top[0][0] >= sum(value or 0.0 for value in frontier):
+                    break
+
+            top.sort(reverse=True)
+            return [(self._documents[number], round(value, 4)) for value, number in top]
@@ -0,0 +1,45 @@
+"""Chunked JSON and NDJSON bodies for listings too large to build in memory.
+
+Items are encoded one at a time as they come off the iterator, so memory per
+request stays constant. Once streaming has started the status code is fixed,
+so a failure mid-stream is reported inside the body instead.
+"""
+from flask import Response
+
+from utils.json_provider import dumps
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def json_array_stream(items):
+    """Yield {"data": [...], "count": n, "success": true} piece by piece"""
+    yield b'{"data":['
+    count = 0
+    try:
+        for item in items:
+            if count:
+                yield b','
+            yield dumps(item)
+            count += 1
+    except Exception as e:
+        print(f'Error while streaming: {e}')
+        yield b'],"count":' + str(count).encode() + b',"error":' + dumps(str(e)) + b',"success":false}'
+        return
+    yield b'],"count":' + str(count).encode() + b',"success":true}'
+
+
+def ndjson_stream(items):
+    """Yield one JSON document per line"""
+    try:
+        for item in items:
+            yield dumps(item) + b'\n'
+    except Exception as e:
+        print(f'Error while streaming: {e}')
+        yield dumps({'error': str(e), 'success': False}) + b'\n'
+
+
+def stream_response(items, ndjson=False):
+    """Wrap an item iterator in a streamed JSON or NDJSON response"""
+    if ndjson:
+        return Response(ndjson_stream(items), mimetype=NDJSON_MIMETYPE)
+    return Response(json_array_stream(items), mimetype='application/json')